@@ -4,12 +4,71 @@ class Settings(BaseSettings):
     SQLDB_URL: str
     SECRET_KEY: str
 
+    # Comma-separated replicas for the read-heavy GET routes; empty keeps
+    # every read on SQLDB_URL.
+    SQLDB_READ_URLS: str = ""
+    READ_REPLICA_CHECK_INTERVAL: float = 5
+    READ_REPLICA_CHECK_TIMEOUT: float = 2
+    # After a write its caller reads from the primary for this long, which
+    # should cover the replicas' usual lag.
+    READ_YOUR_WRITES_SECONDS: float = 5
+
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 5 * 60
     REFRESH_TOKEN_EXPIRE_MINUTES: int = 7 * 24 * 60
 
     DB_POOL_SIZE: int = 5
     DB_MAX_OVERFLOW: int = 10
     DB_POOL_RECYCLE: int = 3600
+    DB_POOL_TIMEOUT: float = 5
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_WARMUP: int = 0
+    # Off when a deploy step runs scripts/initial-db.py upgrade instead;
+    # workers then refuse to start on an outdated schema.
+    DB_MIGRATE_ON_STARTUP: bool = True
+
+    HASH_EXECUTOR: str = "thread"
+    HASH_MAX_WORKERS: int = 4
+    HASH_MAX_PENDING: int = 256
+
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL: int = 60
+    # Each worker caches token generations on its own, so a revocation made
+    # through one worker reaches the others within this many seconds.
+    TOKEN_GENERATION_TTL: int = 5
+
+    COUNT_CACHE_TTL: int = 60
+
+    AVAILABILITY_CACHE_TTL: float = 2
+
+    SWEEPER_ENABLED: bool = True
+    SWEEPER_INTERVAL: float = 30
+    SWEEPER_BATCH_SIZE: int = 500
+    SWEEPER_LOOKBACK_MINUTES: int = 24 * 60
+    SWEEPER_OVERLAP_SECONDS: int = 60
+    SWEEPER_FULL_EVERY: int = 20
+
+    ROLLUP_ENABLED: bool = True
+    ROLLUP_INTERVAL: float = 60
+    ROLLUP_BATCH_SIZE: int = 500
+
+    SINGLEFLIGHT_ENABLED: bool = True
+
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_BACKEND: str = "memory"
+    RESPONSE_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+    # Also bounds how stale another worker's view can get with the memory
+    # backend, which only sees the writes made through its own worker.
+    RESPONSE_CACHE_TTL: float = 30
+
+    # "memory" keeps keys per worker; "database" shares them between workers.
+    IDEMPOTENCY_BACKEND: str = "memory"
+    IDEMPOTENCY_TTL: int = 24 * 60 * 60
+    IDEMPOTENCY_MAX_KEYS: int = 10000
+    IDEMPOTENCY_WAIT_TIMEOUT: float = 30
+
+    EVENT_BACKEND: str = "local"
+    EVENT_QUEUE_SIZE: int = 100
+    EVENT_KEEPALIVE: float = 15
 
     model_config = SettingsConfigDict(
         env_file=".env", validate_assignment = True, extra = "allow")
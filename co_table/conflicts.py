@@ -0,0 +1,150 @@
+import asyncio
+import contextlib
+import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import exc
+from sqlmodel import select, exists
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .models import DBReservation, DBTable
+
+OVERLAP_CONSTRAINT = "reservations_no_overlap"
+
+# Locks are striped by id over a fixed set, so memory stays flat however
+# many tables and rooms are ever booked; ids sharing a stripe just wait on
+# each other.
+LOCK_STRIPES = 256
+
+_table_locks = [asyncio.Lock() for _ in range(LOCK_STRIPES)]
+_room_locks = [asyncio.Lock() for _ in range(LOCK_STRIPES)]
+
+
+class ReservationConflict(HTTPException):
+    def __init__(self, reservation_id: int | None = None):
+        super().__init__(
+            status_code=409,
+            detail="This table is already reserved for that time",
+        )
+        self.reservation_id = reservation_id
+
+
+def is_overlap_violation(error: exc.IntegrityError) -> bool:
+    return OVERLAP_CONSTRAINT in str(error.orig)
+
+
+async def find_conflict(
+    session: AsyncSession,
+    table_id: int,
+    start_time: datetime.datetime,
+    end_time: datetime.datetime,
+    exclude_id: int | None = None,
+) -> DBReservation | None:
+    # Walks ix_reservations_table_id_end_time from start_time onwards, so only
+    # the table's current and upcoming bookings are visited, never its history.
+    statement = (
+        select(DBReservation)
+        .where(DBReservation.table_id == table_id)
+        .where(DBReservation.end_time > start_time)
+        .where(DBReservation.start_time < end_time)
+        .order_by(DBReservation.end_time)
+        .limit(1)
+    )
+    if exclude_id is not None:
+        statement = statement.where(DBReservation.id != exclude_id)
+
+    result = await session.exec(statement)
+    return result.first()
+
+
+def enforced_by_database(session: AsyncSession) -> bool:
+    return session.bind.dialect.name == "postgresql"
+
+
+async def ensure_free(
+    session: AsyncSession,
+    table_id: int,
+    start_time: datetime.datetime,
+    end_time: datetime.datetime,
+    exclude_id: int | None = None,
+):
+    conflict = await find_conflict(
+        session, table_id, start_time, end_time, exclude_id=exclude_id
+    )
+    if conflict:
+        raise ReservationConflict(conflict.id)
+
+
+def _table_lock(session: AsyncSession, table_id: int):
+    if enforced_by_database(session):
+        return contextlib.nullcontext()
+    return _table_locks[table_id % LOCK_STRIPES]
+
+
+def room_guard(session: AsyncSession, room_id: int):
+    # Row locks taken by find_free_table spread concurrent pickers over a
+    # room's tables on Postgres; elsewhere pickers for a room take turns.
+    if enforced_by_database(session):
+        return contextlib.nullcontext()
+    return _room_locks[room_id % LOCK_STRIPES]
+
+
+async def find_free_table(
+    session: AsyncSession,
+    room_id: int,
+    start_time: datetime.datetime,
+    end_time: datetime.datetime,
+) -> DBTable | None:
+    overlapping = (
+        select(DBReservation.id)
+        .where(DBReservation.table_id == DBTable.id)
+        .where(DBReservation.end_time > start_time)
+        .where(DBReservation.start_time < end_time)
+    )
+    statement = (
+        select(DBTable)
+        .where(DBTable.room_id == room_id)
+        .where(~exists(overlapping))
+        .order_by(DBTable.number, DBTable.id)
+        .limit(1)
+    )
+    if enforced_by_database(session):
+        # Tables another transaction is booking right now are skipped rather
+        # than waited on, so concurrent requests land on different tables.
+        statement = statement.with_for_update(skip_locked=True, of=DBTable)
+
+    result = await session.exec(statement)
+    return result.first()
+
+
+@contextlib.asynccontextmanager
+async def table_guard(session: AsyncSession, table_id: int):
+    # Writes to a table's bookings inside this block are serialized where the
+    # database cannot enforce non-overlap, and overlap violations reported by
+    # the database surface as ReservationConflict.
+    async with _table_lock(session, table_id):
+        try:
+            yield
+        except ReservationConflict:
+            await session.rollback()
+            raise
+        except exc.IntegrityError as e:
+            if not is_overlap_violation(e):
+                raise
+            await session.rollback()
+            raise ReservationConflict() from e
+
+
+@contextlib.asynccontextmanager
+async def reserve_window(
+    session: AsyncSession,
+    table_id: int,
+    start_time: datetime.datetime,
+    end_time: datetime.datetime,
+    exclude_id: int | None = None,
+):
+    async with table_guard(session, table_id):
+        await ensure_free(
+            session, table_id, start_time, end_time, exclude_id=exclude_id
+        )
+        yield
@@ -0,0 +1,82 @@
+import math
+import time
+import typing
+
+from sqlalchemy import text
+from sqlmodel import SQLModel, select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+
+CountMode = typing.Literal["exact", "estimate", "none"]
+
+settings = config.get_setting()
+
+
+class RowCounter:
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        # table name -> (expiry, row count)
+        self._counts: dict[str, tuple[float, int]] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    async def exact(self, session: AsyncSession, model: type[SQLModel]) -> int:
+        entry = self._counts.get(model.__tablename__)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        count = (await session.exec(select(func.count()).select_from(model))).one()
+        self._counts[model.__tablename__] = (time.monotonic() + self.ttl, count)
+        return count
+
+    async def estimate(self, session: AsyncSession, model: type[SQLModel]) -> int:
+        # Planner statistics are only as fresh as the last ANALYZE/autovacuum;
+        # a never analyzed table reports -1 and gets an exact count instead.
+        if session.bind.dialect.name == "postgresql":
+            result = await session.exec(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+                params=dict(table=model.__tablename__),
+            )
+            estimate = result.scalar_one_or_none()
+            if estimate is not None and estimate >= 0:
+                return estimate
+        return await self.exact(session, model)
+
+    def adjust(self, model: type[SQLModel], delta: int):
+        entry = self._counts.get(model.__tablename__)
+        if entry is not None:
+            self._counts[model.__tablename__] = (entry[0], max(0, entry[1] + delta))
+
+    def invalidate(self, model: type[SQLModel]):
+        self._counts.pop(model.__tablename__, None)
+
+    def get_stats(self) -> dict:
+        return dict(
+            ttl=self.ttl,
+            hits=self.hits,
+            misses=self.misses,
+            counts={table: entry[1] for table, entry in self._counts.items()},
+        )
+
+
+counters = RowCounter(ttl=settings.COUNT_CACHE_TTL)
+
+
+async def page_count(
+    session: AsyncSession, model: type[SQLModel], size: int, mode: CountMode = "exact", statement=None
+) -> int | None:
+    if mode == "none":
+        return None
+    if statement is not None:
+        # A filtered listing has no cached or planner count to fall back on;
+        # both modes count the matching rows.
+        count = (await session.exec(select(func.count()).select_from(statement.subquery()))).one()
+    elif mode == "estimate":
+        count = await counters.estimate(session, model)
+    else:
+        count = await counters.exact(session, model)
+    return int(math.ceil(count / size))
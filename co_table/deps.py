@@ -6,44 +6,130 @@ from fastapi.security import OAuth2PasswordBearer
 import typing
 import jwt 
 
-from .models.user import User, DBUser
+from sqlmodel import select
+
+from .models.user import User, DBUser, UserPrincipal, TokenPrincipal
 
 from . import models
 from . import security
 from . import config
+from . import cache
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
 settings = config.get_setting()
 
+user_cache = cache.TTLCache(
+    maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL
+)
+token_generations = cache.TTLCache(
+    maxsize=settings.USER_CACHE_SIZE, ttl=settings.TOKEN_GENERATION_TTL
+)
 
-async def get_current_user(
-    token: typing.Annotated[str, Depends(oauth2_scheme)],
-    session: typing.Annotated[models.AsyncSession, Depends(models.get_session)],
-) -> User:
-    credentials_exception = HTTPException(
+
+def invalidate_user(user_id: int):
+    user_cache.pop(user_id)
+    token_generations.pop(user_id)
+
+
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def decode_token(token: str, token_type: str | None = None) -> dict:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
         )
-        user_id: int = payload.get("sub")
-
     except jwt.PyJWTError as e:
         print(e)
-        raise credentials_exception
+        raise credentials_exception()
 
-    user = await session.get(DBUser, user_id)
+    if payload.get("typ") != token_type:
+        raise credentials_exception()
+    return payload
+
+
+async def load_user(user_id: int, session: models.AsyncSession) -> UserPrincipal:
+    user = user_cache.get(user_id)
     if user is None:
-        raise credentials_exception
+        db_user = await session.get(DBUser, user_id)
+        if db_user is None:
+            raise credentials_exception()
+        user = UserPrincipal.model_validate(db_user)
+        user_cache.set(user_id, user)
+        token_generations.set(user_id, user.token_generation)
+
+    return user
+
+
+async def get_token_generation(user_id: int, session: models.AsyncSession) -> int | None:
+    generation = token_generations.get(user_id)
+    if generation is None:
+        result = await session.exec(
+            select(DBUser.token_generation).where(DBUser.id == user_id)
+        )
+        generation = result.one_or_none()
+        if generation is None:
+            return None
+        token_generations.set(user_id, generation)
 
+    return generation
+
+
+async def get_current_user(
+    token: typing.Annotated[str, Depends(oauth2_scheme)],
+    session: typing.Annotated[models.UnitOfWork, Depends(models.get_session)],
+) -> User:
+    payload = decode_token(token)
+    user = await load_user(payload.get("sub"), session)
+    # Checked against the short-lived generation cache, not the cached user,
+    # which may be older than a change made through another worker.
+    if "gen" in payload:
+        generation = await get_token_generation(user.id, session)
+        if payload["gen"] != generation:
+            raise credentials_exception()
+        if user.token_generation != generation:
+            user_cache.pop(user.id)
+            user = await load_user(user.id, session)
+
+    # Whatever the route does next, including turning the user away, it
+    # does not need the connection the checks above may have taken.
+    await session.release()
     return user
 
 
+async def get_token_user(
+    token: typing.Annotated[str, Depends(oauth2_scheme)],
+    session: typing.Annotated[models.UnitOfWork, Depends(models.get_session)],
+) -> TokenPrincipal:
+    payload = decode_token(token)
+    user_id: int = payload.get("sub")
+
+    # Tokens issued before claims were embedded carry only "sub".
+    if payload.get("ver") != security.CLAIMS_VERSION:
+        user = await load_user(user_id, session)
+        await session.release()
+        return TokenPrincipal.model_validate(user)
+
+    if payload.get("gen") != await get_token_generation(user_id, session):
+        raise credentials_exception()
+    await session.release()
+
+    return TokenPrincipal(
+        id=user_id,
+        roles=payload["roles"],
+        faculty=payload["faculty"],
+        room_permission=payload["room_permission"],
+        token_generation=payload["gen"],
+    )
+
+
 async def get_current_active_user(
     current_user: typing.Annotated[User, Depends(get_current_user)]
 ) -> User:
@@ -0,0 +1,211 @@
+import asyncio
+import collections
+import json
+import logging
+
+from fastapi.encoders import jsonable_encoder
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "co_table_events"
+
+# pg_notify rejects payloads of 8000 bytes or more.
+MAX_NOTIFY_BYTES = 7900
+
+# Put on a subscriber's queue in place of its backlog when it is evicted.
+EVICTED = dict(type="evicted")
+
+
+class Subscription:
+    def __init__(self, room_id: int, max_queue: int):
+        self.room_id = room_id
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(max_queue)
+        self.evicted = False
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+
+class EventBus:
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self._subscribers: dict[int, set[Subscription]] = collections.defaultdict(set)
+
+        self.published = 0
+        self.delivered = 0
+        self.evictions = 0
+
+    def subscribe(self, room_id: int) -> Subscription:
+        subscription = Subscription(room_id, self.max_queue)
+        self._subscribers[room_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.room_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.room_id]
+
+    def subscriber_count(self, room_id: int | None = None) -> int:
+        if room_id is not None:
+            return len(self._subscribers.get(room_id, ()))
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def deliver(self, room_id: int, event: dict):
+        # Never waits on a subscriber: one that has fallen max_queue events
+        # behind is dropped and told so, and can reconnect for a new snapshot.
+        for subscription in list(self._subscribers.get(room_id, ())):
+            try:
+                subscription.queue.put_nowait(event)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                self.evict(subscription)
+
+    def evict(self, subscription: Subscription):
+        self.unsubscribe(subscription)
+        subscription.evicted = True
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(EVICTED)
+        self.evictions += 1
+
+    def get_stats(self) -> dict:
+        return dict(
+            rooms=len(self._subscribers),
+            subscribers=self.subscriber_count(),
+            max_queue=self.max_queue,
+            published=self.published,
+            delivered=self.delivered,
+            evictions=self.evictions,
+        )
+
+
+class LocalBackend:
+    name = "local"
+
+    def __init__(self, bus: EventBus):
+        self.bus = bus
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, room_id: int, event: dict):
+        self.bus.deliver(room_id, event)
+
+
+class PostgresBackend:
+    # Every worker LISTENs on one channel and delivers what it hears to its
+    # own subscribers, including the events it published itself.
+    name = "postgres"
+
+    def __init__(self, bus: EventBus, url: str):
+        self.bus = bus
+        self.dsn = url.replace("postgresql+asyncpg://", "postgresql://", 1)
+        self._listener = None
+        self._publisher = None
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        import asyncpg
+
+        async with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = await asyncpg.connect(self.dsn)
+            await self._listener.add_listener(CHANNEL, self._notified)
+            self._publisher = await asyncpg.connect(self.dsn)
+
+    async def stop(self):
+        async with self._lock:
+            for connection in (self._listener, self._publisher):
+                if connection is not None:
+                    await connection.close()
+            self._listener = None
+            self._publisher = None
+
+    def _notified(self, connection, pid, channel, payload):
+        message = json.loads(payload)
+        self.bus.deliver(message["room_id"], message["event"])
+
+    async def publish(self, room_id: int, event: dict):
+        if self._publisher is None:
+            await self.start()
+        payload = json.dumps(dict(room_id=room_id, event=event))
+        if len(payload.encode("utf-8")) > MAX_NOTIFY_BYTES:
+            # Too big to carry, e.g. a bulk table create: subscribers are told
+            # to reconnect and pick the change up from a fresh snapshot.
+            payload = json.dumps(dict(room_id=room_id, event=dict(type="resync", room_id=room_id)))
+        async with self._lock:
+            await self._publisher.execute("SELECT pg_notify($1, $2)", CHANNEL, payload)
+
+
+bus = EventBus()
+backend = LocalBackend(bus)
+
+
+def init_events(settings):
+    global bus, backend
+
+    bus = EventBus(max_queue=settings.EVENT_QUEUE_SIZE)
+    if settings.EVENT_BACKEND == "postgres":
+        backend = PostgresBackend(bus, settings.SQLDB_URL)
+    elif settings.EVENT_BACKEND == "local":
+        backend = LocalBackend(bus)
+    else:
+        raise ValueError(f"Unknown event backend: {settings.EVENT_BACKEND}")
+
+
+async def start():
+    await backend.start()
+
+
+async def stop():
+    await backend.stop()
+
+
+async def publish(room_id: int, event: dict):
+    # Events describe writes that are already committed, so a failure to
+    # publish is logged rather than failing the request.
+    bus.published += 1
+    try:
+        await backend.publish(room_id, jsonable_encoder(event))
+    except Exception:
+        logger.exception("Publishing event for room %s failed", room_id)
+
+
+def subscribe(room_id: int) -> Subscription:
+    return bus.subscribe(room_id)
+
+
+def unsubscribe(subscription: Subscription):
+    bus.unsubscribe(subscription)
+
+
+def get_stats() -> dict:
+    return dict(bus.get_stats(), backend=backend.name)
+
+
+def format_event(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def stream(subscription: Subscription, snapshot: dict, keepalive: float = 15):
+    try:
+        yield format_event(jsonable_encoder(snapshot))
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), keepalive)
+            except asyncio.TimeoutError:
+                # Comment line, keeps proxies from closing an idle stream.
+                yield ": keepalive\n\n"
+                continue
+            yield format_event(event)
+            if event["type"] in ("evicted", "resync", "room_deleted"):
+                return
+    finally:
+        unsubscribe(subscription)
@@ -0,0 +1,128 @@
+import asyncio
+import concurrent.futures
+
+import bcrypt
+
+from fastapi import HTTPException, status
+
+
+def _hashpw(password: bytes) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt())
+
+
+def _checkpw(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+class PasswordHasher:
+    def __init__(self, kind: str = "thread", max_workers: int = 4, max_pending: int = 256):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown hash executor: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._slots = asyncio.Semaphore(max_workers)
+
+        self.queue_depth = 0
+        self.peak_queue_depth = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def executor(self) -> concurrent.futures.Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = concurrent.futures.ProcessPoolExecutor(self.max_workers)
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="co-table-hash"
+                )
+        return self._executor
+
+    async def run(self, func, *args):
+        # Only max_workers jobs are handed to the executor at a time, the rest
+        # wait here where they can be counted and shed once the queue is full.
+        if self.queue_depth >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, please try again later",
+            )
+
+        self.queue_depth += 1
+        self.peak_queue_depth = max(self.peak_queue_depth, self.queue_depth)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queue_depth -= 1
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._slots.release()
+
+    def get_stats(self) -> dict:
+        return dict(
+            executor=self.kind,
+            max_workers=self.max_workers,
+            max_pending=self.max_pending,
+            queue_depth=self.queue_depth,
+            peak_queue_depth=self.peak_queue_depth,
+            in_flight=self.in_flight,
+            completed=self.completed,
+            rejected=self.rejected,
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hasher = None
+
+
+def init_hasher(settings):
+    global hasher
+
+    if hasher is not None:
+        hasher.shutdown()
+    hasher = PasswordHasher(
+        kind=settings.HASH_EXECUTOR,
+        max_workers=settings.HASH_MAX_WORKERS,
+        max_pending=settings.HASH_MAX_PENDING,
+    )
+
+
+def get_hasher() -> PasswordHasher:
+    global hasher
+
+    if hasher is None:
+        hasher = PasswordHasher()
+    return hasher
+
+
+async def hash_password(password: str) -> str:
+    hashed = await get_hasher().run(_hashpw, password.encode("utf-8"))
+    return hashed.decode("utf-8")
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await get_hasher().run(
+        _checkpw, password.encode("utf-8"), hashed.encode("utf-8")
+    )
+
+
+def get_stats() -> dict:
+    return get_hasher().get_stats()
+
+
+def shutdown():
+    if hasher is not None:
+        hasher.shutdown()
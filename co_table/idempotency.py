@@ -0,0 +1,229 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import typing
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import exc
+from sqlmodel import select, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import cache
+from . import models
+
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+
+class Stored(typing.NamedTuple):
+    fingerprint: str
+    response: typing.Any
+
+
+def fingerprint(payload) -> str:
+    data = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    # Completed responses of this worker only; concurrent duplicates are
+    # held back by IdempotencyStore itself.
+    name = "memory"
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.responses = cache.TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Stored | None:
+        return self.responses.get(key)
+
+    async def claim(self, key: str, fingerprint: str, timeout: float) -> bool:
+        return True
+
+    async def save(self, key: str, stored: Stored):
+        self.responses.set(key, stored)
+
+    async def release(self, key: str):
+        pass
+
+    def get_stats(self) -> dict:
+        return self.responses.get_stats()
+
+
+class DatabaseBackend:
+    # A key is claimed by inserting its row before the request runs, so a
+    # duplicate arriving at another worker finds it and waits for the
+    # response to be filled in.
+    name = "database"
+    purge_every = 1024
+
+    def __init__(self, ttl: float):
+        self.ttl = datetime.timedelta(seconds=ttl)
+        self.claims = 0
+
+    async def get(self, key: str) -> Stored | None:
+        async with AsyncSession(models.engine) as session:
+            row = await session.get(models.DBIdempotencyKey, key)
+        if row is None or row.response is None or row.expires_at <= datetime.datetime.now():
+            return None
+        return Stored(row.fingerprint, json.loads(row.response))
+
+    async def claim(self, key: str, fingerprint: str, timeout: float) -> bool:
+        now = datetime.datetime.now()
+        async with AsyncSession(models.engine) as session:
+            await session.exec(
+                delete(models.DBIdempotencyKey)
+                .where(models.DBIdempotencyKey.key == key, models.DBIdempotencyKey.expires_at <= now)
+            )
+            # Until the response is saved the claim only lasts as long as a
+            # duplicate would wait, so a worker dying mid-request frees it.
+            session.add(models.DBIdempotencyKey(
+                key=key, fingerprint=fingerprint, expires_at=now + datetime.timedelta(seconds=timeout)))
+            try:
+                await session.commit()
+            except exc.IntegrityError:
+                return False
+            self.claims += 1
+            if self.claims % self.purge_every == 0:
+                await session.exec(delete(models.DBIdempotencyKey).where(models.DBIdempotencyKey.expires_at <= now))
+                await session.commit()
+        return True
+
+    async def pending(self, key: str) -> bool:
+        async with AsyncSession(models.engine) as session:
+            result = await session.exec(
+                select(models.DBIdempotencyKey.key)
+                .where(models.DBIdempotencyKey.key == key)
+                .where(models.DBIdempotencyKey.expires_at > datetime.datetime.now())
+            )
+            return result.first() is not None
+
+    async def save(self, key: str, stored: Stored):
+        async with AsyncSession(models.engine) as session:
+            row = await session.get(models.DBIdempotencyKey, key)
+            if row is None:
+                row = models.DBIdempotencyKey(key=key, fingerprint=stored.fingerprint)
+                session.add(row)
+            row.response = json.dumps(stored.response)
+            row.expires_at = datetime.datetime.now() + self.ttl
+            await session.commit()
+
+    async def release(self, key: str):
+        async with AsyncSession(models.engine) as session:
+            await session.exec(
+                delete(models.DBIdempotencyKey)
+                .where(models.DBIdempotencyKey.key == key, models.DBIdempotencyKey.response.is_(None))
+            )
+            await session.commit()
+
+    def get_stats(self) -> dict:
+        return dict(claims=self.claims)
+
+
+class IdempotencyStore:
+    def __init__(self, backend, wait_timeout: float = 30):
+        self.backend = backend
+        self.wait_timeout = wait_timeout
+        self._inflight: dict[str, asyncio.Future] = {}
+
+        self.executed = 0
+        self.replayed = 0
+        self.waited = 0
+
+    async def _wait_elsewhere(self, key: str):
+        # Another worker holds the claim: poll until it saves a response or
+        # gives the key up.
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_timeout
+        while loop.time() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            if await self.backend.get(key) is not None or not await self.backend.pending(key):
+                return
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+
+    async def run(self, key: str, fingerprint: str, call: typing.Callable[[], typing.Awaitable]) -> tuple[typing.Any, bool]:
+        # Returns the response and whether it is a replay. Only successful
+        # responses are kept; after a failure the next duplicate runs again.
+        while True:
+            stored = await self.backend.get(key)
+            if stored is not None:
+                if stored.fingerprint != fingerprint:
+                    raise HTTPException(
+                        status_code=422, detail="This Idempotency-Key was already used for a different request")
+                self.replayed += 1
+                return stored.response, True
+
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self.waited += 1
+                try:
+                    await asyncio.wait_for(asyncio.shield(inflight), self.wait_timeout)
+                except asyncio.TimeoutError:
+                    raise HTTPException(
+                        status_code=409, detail="A request with this Idempotency-Key is still in progress")
+                continue
+
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            try:
+                if not await self.backend.claim(key, fingerprint, self.wait_timeout):
+                    self.waited += 1
+                    await self._wait_elsewhere(key)
+                    continue
+                try:
+                    response = jsonable_encoder(await call())
+                except BaseException:
+                    await self.backend.release(key)
+                    raise
+                await self.backend.save(key, Stored(fingerprint, response))
+                self.executed += 1
+                return response, False
+            finally:
+                del self._inflight[key]
+                future.set_result(None)
+
+    def get_stats(self) -> dict:
+        return dict(
+            self.backend.get_stats(),
+            backend=self.backend.name,
+            inflight=len(self._inflight),
+            executed=self.executed,
+            replayed=self.replayed,
+            waited=self.waited,
+        )
+
+
+store = IdempotencyStore(MemoryBackend(maxsize=10000, ttl=24 * 60 * 60))
+
+
+def init_idempotency(settings):
+    global store
+
+    if settings.IDEMPOTENCY_BACKEND == "database":
+        backend = DatabaseBackend(ttl=settings.IDEMPOTENCY_TTL)
+    elif settings.IDEMPOTENCY_BACKEND == "memory":
+        backend = MemoryBackend(maxsize=settings.IDEMPOTENCY_MAX_KEYS, ttl=settings.IDEMPOTENCY_TTL)
+    else:
+        raise ValueError(f"Unknown idempotency backend: {settings.IDEMPOTENCY_BACKEND}")
+    store = IdempotencyStore(backend, wait_timeout=settings.IDEMPOTENCY_WAIT_TIMEOUT)
+
+
+async def run(
+    key: str | None,
+    scope: tuple,
+    payload,
+    call: typing.Callable[[], typing.Awaitable],
+) -> tuple[typing.Any, bool]:
+    # scope keeps keys apart per user and route, so one client can never be
+    # replayed another's response.
+    if key is None:
+        return await call(), False
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+    scoped = ":".join(str(part) for part in scope) + ":" + key
+    return await store.run(scoped, fingerprint(payload), call)
+
+
+def get_stats() -> dict:
+    return store.get_stats()
@@ -1,4 +1,6 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import exc
 
 from co_table import config
 
@@ -8,21 +10,49 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from . import models
 from . import routers
+from . import hashing
+from . import sweeper
+from . import rollup
+from . import events
+from . import idempotency
+from . import singleflight
+from . import response_cache
+from . import replicas
+from . import migrations
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await models.recreate_table()
+    await migrations.start()
+    await models.warm_up()
+    replicas.start()
+    await events.start()
+    sweeper.start()
+    rollup.start()
     yield
+    await rollup.stop()
+    await sweeper.stop()
+    await events.stop()
+    await replicas.stop()
+    hashing.shutdown()
     if models.engine is not None:
         await models.close_session()
         await models.engine.dispose()
 
+async def pool_timeout_handler(request: Request, error: exc.TimeoutError) -> JSONResponse:
+    # Every connection stayed checked out for DB_POOL_TIMEOUT seconds.
+    return JSONResponse(
+        status_code = 503,
+        content = dict(detail = "The database is busy, please try again"),
+        headers = {"Retry-After": "1"},
+    )
+
 def create_app(settings = None):
     
     if not settings:
         settings = config.get_setting()
     
     app = FastAPI(lifespan = lifespan)
+    app.add_exception_handler(exc.TimeoutError, pool_timeout_handler)
 
     app.add_middleware(
         CORSMiddleware,
@@ -31,8 +61,18 @@ def create_app(settings = None):
         allow_methods=[""],
         allow_headers=["*"],
     )
+    app.add_middleware(replicas.ReadYourWrites)
 
     models.init_db(settings)
+    migrations.init_migrations(settings)
+    hashing.init_hasher(settings)
+    sweeper.init_sweeper(settings)
+    rollup.init_rollup(settings)
+    events.init_events(settings)
+    idempotency.init_idempotency(settings)
+    singleflight.init_singleflight(settings)
+    response_cache.init_response_cache(settings)
+    replicas.init_replicas(settings)
 
     routers.init_routers(app)
 
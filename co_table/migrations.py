@@ -0,0 +1,152 @@
+import datetime
+import logging
+import typing
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, exc, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlmodel import SQLModel
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# Kept out of SQLModel.metadata so models.recreate_table leaves it alone.
+metadata = MetaData()
+
+schema_version = Table(
+    "schema_version",
+    metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# Any constant will do; workers booting together on Postgres take this
+# advisory lock so only one of them migrates.
+LOCK_ID = 7_243_001
+
+
+class Migration(typing.NamedTuple):
+    version: int
+    name: str
+    apply: typing.Callable[[AsyncConnection], typing.Awaitable[None]]
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(version: int, name: str):
+    def register(apply):
+        assert not MIGRATIONS or MIGRATIONS[-1].version < version, "migrations must be added in order"
+        MIGRATIONS.append(Migration(version, name, apply))
+        return apply
+    return register
+
+
+@migration(1, "initial schema")
+async def initial_schema(conn: AsyncConnection):
+    # Creates the tables that are missing, which also adopts a database the
+    # old drop-and-create startup built. On a new database this builds the
+    # latest shape of every table, so later migrations have to be written
+    # to be no-ops there: IF EXISTS / IF NOT EXISTS.
+    await conn.run_sync(SQLModel.metadata.create_all)
+
+
+@migration(2, "index audit")
+async def index_audit(conn: AsyncConnection):
+    # The password hash and display name lost their unique indexes; the
+    # foreign keys that hot queries and cascades filter on gained theirs.
+    # Plain CREATE INDEX locks writes to the table on Postgres while it
+    # builds, so apply this outside busy hours on a large database.
+    for name in ("ix_users_password", "ix_users_name"):
+        await conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    def create(sync_conn):
+        for table, name in (
+            ("rooms", "ix_rooms_faculty"),
+            ("rooms", "ix_rooms_user_id"),
+            ("tables", "ix_tables_room_id_number"),
+            ("refresh_token_families", "ix_refresh_token_families_user_id"),
+        ):
+            index = next(index for index in SQLModel.metadata.tables[table].indexes if index.name == name)
+            index.create(sync_conn, checkfirst=True)
+    await conn.run_sync(create)
+
+
+def latest() -> int:
+    return MIGRATIONS[-1].version
+
+
+async def read_version(conn: AsyncConnection) -> int:
+    result = await conn.execute(select(func.max(schema_version.c.version)))
+    return result.scalar() or 0
+
+
+async def current_version(engine: AsyncEngine) -> int:
+    # The single query a worker runs at startup when nothing is pending.
+    async with engine.connect() as conn:
+        try:
+            return await read_version(conn)
+        except (exc.ProgrammingError, exc.OperationalError):
+            # No schema_version table yet.
+            return 0
+
+
+async def migrate(engine: AsyncEngine, target: int | None = None) -> list[int]:
+    target = latest() if target is None else target
+    if await current_version(engine) >= target:
+        return []
+
+    applied = []
+    async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), dict(id=LOCK_ID))
+        await conn.run_sync(metadata.create_all)
+        # Read again under the lock: another worker may have got there first.
+        version = await read_version(conn)
+        for step in MIGRATIONS:
+            if not version < step.version <= target:
+                continue
+            logger.info("Applying migration %d: %s", step.version, step.name)
+            await step.apply(conn)
+            await conn.execute(insert(schema_version).values(
+                version=step.version, name=step.name, applied_at=datetime.datetime.now()))
+            applied.append(step.version)
+    return applied
+
+
+async def reset(engine: AsyncEngine) -> list[int]:
+    # Drops every table, data included, and migrates from nothing.
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.drop_all)
+        await conn.run_sync(metadata.drop_all)
+    return await migrate(engine)
+
+
+async def get_status(engine: AsyncEngine) -> dict:
+    version = await current_version(engine)
+    return dict(
+        current=version,
+        latest=latest(),
+        pending=[f"{step.version}: {step.name}" for step in MIGRATIONS if step.version > version],
+    )
+
+
+migrate_on_startup = True
+
+
+def init_migrations(settings):
+    global migrate_on_startup
+
+    migrate_on_startup = settings.DB_MIGRATE_ON_STARTUP
+
+
+async def start():
+    if migrate_on_startup:
+        await migrate(models.engine)
+        return
+    version = await current_version(models.engine)
+    if version < latest():
+        raise RuntimeError(
+            f"Database schema is at version {version}, this code needs {latest()}; "
+            "run scripts/initial-db.py upgrade first")
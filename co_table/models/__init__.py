@@ -3,31 +3,80 @@ from typing import AsyncIterator
 from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
+
+from ..pool import InstrumentedPool, stats as pool_stats
 
 from .user import *
 from .table import *
 from .reservation import *
 from .room import *
+from .analytics import *
 from .dbmodel import *
+from .functions import *
 
 connect_args = {}
 
 engine = None
+async_session = None
+pool_warmup = 0
 
 def init_db(settings):
-    global engine
+    global engine, async_session, pool_warmup
+
+    engine = make_engine(settings, settings.SQLDB_URL)
+    async_session = async_sessionmaker(engine, class_=UnitOfWork, expire_on_commit=False)
+    pool_warmup = min(settings.DB_POOL_WARMUP, settings.DB_POOL_SIZE)
 
-    engine = create_async_engine(
-        settings.SQLDB_URL,
+def make_engine(settings, database_url: str, poolclass = InstrumentedPool):
+    options = {}
+    url = make_url(database_url)
+    # An in-memory SQLite database lives in a single connection, so there
+    # is no pool to size.
+    if not (url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")):
+        options = dict(
+            poolclass = poolclass,
+            pool_size = settings.DB_POOL_SIZE,
+            max_overflow = settings.DB_MAX_OVERFLOW,
+            pool_recycle = settings.DB_POOL_RECYCLE,
+            # Fail the request with a 503 instead of queueing it behind a
+            # saturated pool for the default 30 seconds.
+            pool_timeout = settings.DB_POOL_TIMEOUT,
+        )
+    new_engine = create_async_engine(
+        database_url,
         #echo = True,
         future = True,
         connect_args = connect_args,
-        # pool_size=settings.DB_POOL_SIZE,
-        # max_overflow=settings.DB_MAX_OVERFLOW,
-        # pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping = settings.DB_POOL_PRE_PING,
+        **options,
     )
+    if new_engine.dialect.name == "sqlite":
+        event.listen(new_engine.sync_engine, "connect", enable_sqlite_foreign_keys)
+    return new_engine
+
+async def warm_up():
+    # Opens the first connections at startup rather than on the first
+    # requests after a deploy.
+    connections = []
+    try:
+        for _ in range(pool_warmup):
+            connections.append(await engine.connect())
+    finally:
+        for connection in connections:
+            await connection.close()
+
+def get_pool_stats() -> dict:
+    return pool_stats.get_stats(engine.pool if engine is not None else None)
+
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # ON DELETE CASCADE is only honoured by sqlite with this pragma on.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
 
 async def create_all():
     async with engine.begin() as conn:
@@ -39,10 +88,20 @@ async def recreate_table():
         await conn.run_sync(SQLModel.metadata.create_all)
 
 
-async def get_session() -> AsyncIterator[AsyncSession]: 
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
+class UnitOfWork(AsyncSession):
+    # Like any AsyncSession it only checks a connection out of the pool at
+    # its first statement, and gives it back when a transaction ends.
+
+    async def release(self):
+        # Ends a transaction that has only read, so the connection goes back
+        # to the pool now instead of when the request finishes; the next
+        # statement checks one out again. Loaded objects stay usable since
+        # commits do not expire them.
+        if self.in_transaction() and not (self.new or self.dirty or self.deleted):
+            await self.commit()
+
+
+async def get_session() -> AsyncIterator[UnitOfWork]: 
     async with async_session() as session:
         yield session
 
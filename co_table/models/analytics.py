@@ -0,0 +1,23 @@
+from pydantic import BaseModel, ConfigDict
+import datetime
+
+class OccupancyHour(BaseModel):
+  model_config = ConfigDict(from_attributes=True)
+  hour: datetime.datetime
+  reserved_minutes: int
+  reservations: int
+  utilization: float
+
+class OccupancyList(BaseModel):
+  room_id: int
+  tables: int
+  hours: list[OccupancyHour]
+
+class OccupancyHeatmap(BaseModel):
+  # cells[weekday][hour], Monday first: the share of table time reserved
+  # over every such hour in the window.
+  room_ids: list[int]
+  tables: int
+  from_time: datetime.datetime
+  to_time: datetime.datetime
+  cells: list[list[float]]
@@ -1,29 +1,58 @@
 from typing import Optional
 from . import BaseRoom, BaseTable, BaseReservation
 from sqlmodel import Field, SQLModel, Relationship
+from sqlalchemy import DDL, Index, event
 from . import DBUser
 
 import datetime
 import pydantic
 
+def updated_at_field():
+  # Set on insert and on every UPDATE, including the bulk statements that
+  # never load the row, so /changes sees every write.
+  return Field(
+    default_factory=datetime.datetime.now,
+    sa_column_kwargs=dict(default=datetime.datetime.now, onupdate=datetime.datetime.now),
+  )
+
 class DBRoom(BaseRoom, SQLModel, table = True):
   __tablename__ = "rooms"
+  __table_args__ = (
+    Index("ix_rooms_updated_at", "updated_at", "id"),
+    Index("ix_rooms_faculty", "faculty", "id"),
+    Index("ix_rooms_user_id", "user_id"),
+  )
   id: Optional[int] = Field(default=None, primary_key=True)
-  tables: list["DBTable"] = Relationship(back_populates="room", cascade_delete=True)
+  tables: list["DBTable"] = Relationship(back_populates="room", cascade_delete=True, passive_deletes=True)
   user_id: int = Field(default=None, foreign_key="users.id")
   user: DBUser | None = Relationship()
   status: bool = Field(default=True)
+  updated_at: datetime.datetime = updated_at_field()
 
 class DBTable(BaseTable, SQLModel, table = True):
   __tablename__ = "tables"
+  __table_args__ = (
+    Index("ix_tables_updated_at", "updated_at", "id"),
+    # Also serves the next table number of a room and its ordered listing.
+    Index("ix_tables_room_id_number", "room_id", "number"),
+  )
   id: Optional[int] = Field(default=None, primary_key=True)
   is_available: bool = Field(default=False)
-  room_id: int = Field(default=None, foreign_key="rooms.id")
+  updated_at: datetime.datetime = updated_at_field()
+  room_id: int = Field(default=None, foreign_key="rooms.id", ondelete="CASCADE")
   room: DBRoom = Relationship(back_populates="tables")
-  reservations: list["DBReservation"] = Relationship(back_populates="table", cascade_delete=True)
+  reservations: list["DBReservation"] = Relationship(back_populates="table", cascade_delete=True, passive_deletes=True)
 
 class DBReservation(BaseReservation, SQLModel, table = True):
   __tablename__ = "reservations"
+  __table_args__ = (
+    Index("ix_reservations_table_id_end_time", "table_id", "end_time"),
+    Index("ix_reservations_table_id_start_time", "table_id", "start_time"),
+    Index("ix_reservations_user_id_start_time", "user_id", "start_time"),
+    Index("ix_reservations_end_time", "end_time"),
+    Index("ix_reservations_start_time", "start_time", "id"),
+    Index("ix_reservations_updated_at", "updated_at", "id"),
+  )
   id: Optional[int] = Field(default=None, primary_key=True)
   reserved_at: datetime.datetime | None = pydantic.Field(
         json_schema_extra=dict(example="2023-01-01T00:00:00.000000"), default=None
@@ -36,5 +65,69 @@ class DBReservation(BaseReservation, SQLModel, table = True):
     )
   user_id: int = Field(default=None, foreign_key="users.id")
   user: DBUser | None = Relationship()
-  table_id: int = Field(default=None, foreign_key="tables.id")
+  table_id: int = Field(default=None, foreign_key="tables.id", ondelete="CASCADE")
   table: DBTable = Relationship(back_populates="reservations")
+  updated_at: datetime.datetime = updated_at_field()
+
+class DBTombstone(SQLModel, table = True):
+  # One row per deleted room, table or reservation, read by the /changes
+  # endpoints and the occupancy rollup.
+  __tablename__ = "tombstones"
+  __table_args__ = (
+    Index("ix_tombstones_entity_deleted_at", "entity", "deleted_at", "id"),
+  )
+  id: Optional[int] = Field(default=None, primary_key=True)
+  entity: str
+  entity_id: int
+  room_id: Optional[int] = None
+  deleted_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+class DBOccupancyHourly(SQLModel, table = True):
+  # Reserved time per room and hour, kept up to date by co_table.rollup.
+  __tablename__ = "occupancy_hourly"
+  room_id: int = Field(foreign_key="rooms.id", ondelete="CASCADE", primary_key=True)
+  hour: datetime.datetime = Field(primary_key=True)
+  reserved_minutes: int = Field(default=0)
+  reservations: int = Field(default=0)
+
+class DBOccupancyFolded(SQLModel, table = True):
+  # What each reservation last contributed to occupancy_hourly, so a change
+  # or delete can take it back out. Not tied to reservations by a foreign
+  # key: history stays counted after its table is deleted.
+  __tablename__ = "occupancy_folded"
+  reservation_id: int = Field(primary_key=True)
+  room_id: int = Field(foreign_key="rooms.id", ondelete="CASCADE", index=True)
+  start_time: datetime.datetime
+  end_time: datetime.datetime
+
+class DBRollupState(SQLModel, table = True):
+  __tablename__ = "rollup_state"
+  name: str = Field(primary_key=True)
+  watermark: Optional[str] = None
+  updated_at: datetime.datetime = updated_at_field()
+
+class DBIdempotencyKey(SQLModel, table = True):
+  # Shared by all workers when IDEMPOTENCY_BACKEND is "database". A row
+  # without a response is a request still being handled.
+  __tablename__ = "idempotency_keys"
+  key: str = Field(primary_key=True, max_length=320)
+  fingerprint: str
+  response: Optional[str] = None
+  expires_at: datetime.datetime = Field(index=True)
+
+# Postgres enforces non-overlapping bookings per table itself; other backends
+# rely on the serialized check in co_table.conflicts.
+event.listen(
+  SQLModel.metadata,
+  "before_create",
+  DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"),
+)
+event.listen(
+  DBReservation.__table__,
+  "after_create",
+  DDL(
+    "ALTER TABLE reservations ADD CONSTRAINT reservations_no_overlap "
+    "EXCLUDE USING gist (table_id WITH =, tsrange(start_time, end_time) WITH &&) "
+    "WHERE (start_time IS NOT NULL AND end_time IS NOT NULL)"
+  ).execute_if(dialect="postgresql"),
+)
@@ -0,0 +1,30 @@
+from sqlalchemy import DateTime
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import GenericFunction
+
+__all__ = ["add_hours"]
+
+
+class add_hours(GenericFunction):
+  type = DateTime()
+  inherit_cache = True
+
+
+@compiles(add_hours)
+def _add_hours(element, compiler, **kw):
+  timestamp, hours = list(element.clauses)
+  return "(%s + interval '1 hour' * %s)" % (
+    compiler.process(timestamp, **kw),
+    compiler.process(hours, **kw),
+  )
+
+
+@compiles(add_hours, "sqlite")
+def _add_hours_sqlite(element, compiler, **kw):
+  # Same text layout SQLAlchemy stores sqlite datetimes in, at millisecond
+  # precision, so results still compare and parse as DateTime.
+  timestamp, hours = list(element.clauses)
+  return "strftime('%%Y-%%m-%%d %%H:%%M:%%f', %s, '+' || %s || ' hours')" % (
+    compiler.process(timestamp, **kw),
+    compiler.process(hours, **kw),
+  )
@@ -13,6 +13,10 @@ class CreateReservation(BaseReservation):
 class UpdateReservation(BaseReservation):
   pass
 
+class ReserveAnyReservation(BaseModel):
+  room_id: int
+  duration_hours: int
+
 class Reservation(BaseReservation):
   id: int
   reserved_at: datetime.datetime | None
@@ -23,5 +27,7 @@ class ReservationList(BaseModel):
   model_config = ConfigDict(from_attributes=True)
   reservations: list[Reservation]
   page: int
-  page_count: int
+  page_count: int | None
   size_per_page: int
+  next_cursor: str | None = None
+  prev_cursor: str | None = None
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, ConfigDict
+import datetime
 
 class BaseRoom(BaseModel):
   model_config = ConfigDict(from_attributes=True)
@@ -22,5 +23,42 @@ class RoomList(BaseModel):
   model_config = ConfigDict(from_attributes=True)
   rooms: list[Room]
   page: int
-  page_count: int
+  page_count: int | None
   size_per_page: int
+  next_cursor: str | None = None
+  prev_cursor: str | None = None
+
+class RoomAvailability(BaseModel):
+  model_config = ConfigDict(from_attributes=True)
+  room_id: int
+  name: str
+  faculty: str
+  status: bool
+  total_tables: int
+  free_tables: int
+  next_free_time: datetime.datetime | None
+
+class RoomAvailabilityList(BaseModel):
+  model_config = ConfigDict(from_attributes=True)
+  rooms: list[RoomAvailability]
+  generated_at: datetime.datetime
+
+class RoomChanges(BaseModel):
+  model_config = ConfigDict(from_attributes=True)
+  rooms: list[Room]
+  deleted: list[int]
+  watermark: str
+  has_more: bool
+
+class NextSlot(BaseModel):
+  table_id: int
+  number: int
+  start_time: datetime.datetime
+  end_time: datetime.datetime
+
+class NextSlots(BaseModel):
+  room_id: int
+  status: bool
+  duration_hours: int
+  slots: list[NextSlot]
+  generated_at: datetime.datetime
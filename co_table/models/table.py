@@ -20,5 +20,14 @@ class TableList(BaseModel):
   model_config = ConfigDict(from_attributes=True)
   tables: list[Table]
   page: int
-  page_count: int
+  page_count: int | None
   size_per_page: int
+  next_cursor: str | None = None
+  prev_cursor: str | None = None
+
+class TableChanges(BaseModel):
+  model_config = ConfigDict(from_attributes=True)
+  tables: list[Table]
+  deleted: list[int]
+  watermark: str
+  has_more: bool
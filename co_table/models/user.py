@@ -1,13 +1,14 @@
 import datetime
 import json
 from typing import List, Optional
-import bcrypt
 
 from sqlmodel import SQLModel, Field
 
 from pydantic import BaseModel, ConfigDict, EmailStr
 import pydantic
 
+from .. import hashing
+
 class BaseUser(BaseModel):
     model_config = ConfigDict(from_attributes = True, populate_by_name = True)
     email: str = pydantic.Field(json_schema_extra = dict(example = "admin@email.local"))
@@ -27,6 +28,21 @@ class User(BaseUser):
     faculty: str = pydantic.Field(json_schema_extra = dict(example = "Engineering"))
 
 
+class UserPrincipal(User):
+    model_config = ConfigDict(frozen = True)
+    room_permission: bool = pydantic.Field(json_schema_extra = dict(example = False))
+    token_generation: int = pydantic.Field(default = 0, exclude = True)
+
+
+class TokenPrincipal(BaseModel):
+    model_config = ConfigDict(from_attributes = True, frozen = True)
+    id: int
+    roles: str
+    faculty: str
+    room_permission: bool
+    token_generation: int = 0
+
+
 class ReferenceUser(BaseModel):
     model_config = ConfigDict(from_attributes = True, populate_by_name = True)
     username: str = pydantic.Field(example = "admin")
@@ -56,16 +72,21 @@ class Token(BaseModel):
     issued_at: datetime.datetime
     user_id: int
 
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
 class DBUser(SQLModel, table=True):
     __tablename__ = "users"
     id: Optional[int] = Field(default=None, primary_key=True)
     username: str = Field(index=True, unique=True)
-    password: str = Field(index=True, unique=True)
-    name: str = Field(index=True, unique=True)
+    # Never looked up: an index on them would only slow every write.
+    password: str
+    name: str
     email: str = Field(index=True, unique=True)
     roles: str = Field(default_factory=str)
     faculty: str = Field(default_factory=str)
     room_permission: bool = pydantic.Field(json_schema_extra = dict(example = False))
+    token_generation: int = Field(default=0)
     register_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
     updated_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
     last_login_date: Optional[datetime.datetime] = Field(default=None)
@@ -75,21 +96,28 @@ class DBUser(SQLModel, table=True):
         return any(role in user_roles for role in roles)
 
     async def get_encrypted_password(self, password: str) -> str:
-        return bcrypt.hashpw(
-            password.encode("utf-8"), salt=bcrypt.gensalt()
-        ).decode("utf-8")
+        return await hashing.hash_password(password)
 
     async def set_password(self, password: str):
         self.password = await self.get_encrypted_password(password)
 
     async def verify_password(self, password: str) -> bool:
-        return bcrypt.checkpw(
-            password.encode("utf-8"), self.password.encode("utf-8")
-        )
+        return await hashing.verify_password(password, self.password)
+
+
+class DBRefreshTokenFamily(SQLModel, table=True):
+    __tablename__ = "refresh_token_families"
+    family: str = Field(primary_key=True)
+    user_id: int = Field(foreign_key="users.id", ondelete="CASCADE", index=True)
+    # id of the only refresh token of the family that is still valid
+    token_id: str
+    expires_at: datetime.datetime = Field(index=True)
     
 class UserList(BaseModel):
     model_config = ConfigDict(from_attributes = True, populate_by_name = True)
     users: list[DBUser]
     page: int
-    page_count: int
-    size_per_page: int
\ No newline at end of file
+    page_count: int | None
+    size_per_page: int
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
\ No newline at end of file
@@ -0,0 +1,85 @@
+import base64
+import datetime
+import json
+import typing
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+MAX_PAGE_SIZE = 200
+
+
+class Page(typing.NamedTuple):
+    items: list
+    next_cursor: str | None
+    prev_cursor: str | None
+
+
+def encode_cursor(values: typing.Sequence) -> str:
+    data = [value.isoformat() if isinstance(value, datetime.datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: typing.Sequence) -> tuple:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if len(data) != len(keys):
+            raise ValueError(cursor)
+        values = []
+        for key, value in zip(keys, data):
+            if key.type.python_type is datetime.datetime:
+                value = datetime.datetime.fromisoformat(value)
+            elif not isinstance(value, key.type.python_type):
+                raise ValueError(cursor)
+            values.append(value)
+        return tuple(values)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def cursor_for(item, keys: typing.Sequence) -> str:
+    return encode_cursor([getattr(item, key.key) for key in keys])
+
+
+async def paginate(
+    session: AsyncSession,
+    statement,
+    keys: typing.Sequence,
+    size: int,
+    page: int = 1,
+    after: str | None = None,
+    before: str | None = None,
+) -> Page:
+    # keys must be unique together (end with the primary key) so that a
+    # cursor points between two rows, never in the middle of a tie.
+    key = tuple_(*keys) if len(keys) > 1 else keys[0]
+
+    if before is not None:
+        values = decode_cursor(before, keys)
+        statement = statement.where(key < (tuple_(*values) if len(keys) > 1 else values[0]))
+        statement = statement.order_by(*[column.desc() for column in keys]).limit(size + 1)
+        items = list((await session.exec(statement)).all())
+        has_more = len(items) > size
+        items = items[:size][::-1]
+        return Page(
+            items,
+            cursor_for(items[-1], keys) if items else before,
+            cursor_for(items[0], keys) if items and has_more else None,
+        )
+
+    if after is not None:
+        values = decode_cursor(after, keys)
+        statement = statement.where(key > (tuple_(*values) if len(keys) > 1 else values[0]))
+    else:
+        statement = statement.offset((page - 1) * size)
+
+    statement = statement.order_by(*keys).limit(size + 1)
+    items = list((await session.exec(statement)).all())
+    has_more = len(items) > size
+    items = items[:size]
+    return Page(
+        items,
+        cursor_for(items[-1], keys) if items and has_more else None,
+        cursor_for(items[0], keys) if items and (after is not None or page > 1) else None,
+    )
@@ -0,0 +1,68 @@
+import bisect
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Upper bounds, in milliseconds, of the checkout wait histogram buckets; the
+# last bucket counts everything slower.
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.overflow_max = 0
+
+    def record(self, wait: float, overflow: int):
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.wait_buckets[bisect.bisect_left(WAIT_BUCKETS_MS, wait * 1000)] += 1
+        self.overflow_max = max(self.overflow_max, overflow)
+
+    def get_stats(self, pool=None) -> dict:
+        stats = dict(
+            checkouts=self.checkouts,
+            timeouts=self.timeouts,
+            wait_avg_ms=self.wait_total / self.checkouts * 1000 if self.checkouts else 0.0,
+            wait_max_ms=self.wait_max * 1000,
+            wait_histogram_ms={
+                f"le_{bound}" if bound is not None else "inf": count
+                for bound, count in zip(WAIT_BUCKETS_MS + (None,), self.wait_buckets)
+            },
+            overflow_max=self.overflow_max,
+        )
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=max(0, pool.overflow()),
+                max_overflow=pool._max_overflow,
+                timeout=pool.timeout(),
+            )
+        return stats
+
+
+# Kept outside the pool: SQLAlchemy replaces a pool with a fresh instance
+# after a disconnect, and the numbers should carry on across that.
+stats = PoolStats()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    def connect(self):
+        # Time spent here is waiting for a free connection, plus opening one
+        # when the pool grows.
+        began = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            stats.timeouts += 1
+            raise
+        stats.record(time.perf_counter() - began, max(0, self.overflow()))
+        return connection
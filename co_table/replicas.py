@@ -0,0 +1,204 @@
+import asyncio
+import itertools
+import logging
+import typing
+
+from fastapi import Request
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from . import cache
+from . import models
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+def caller(request: Request) -> typing.Hashable:
+    # Whoever wrote: the bearer token when there is one, else the address.
+    return request.headers.get("authorization") or (request.client.host if request.client else None)
+
+
+class Replica:
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.session = async_sessionmaker(engine, class_=models.UnitOfWork, expire_on_commit=False)
+        self.healthy = True
+
+        self.reads = 0
+        self.failures = 0
+
+    def get_stats(self) -> dict:
+        stats = dict(
+            url=self.engine.url.render_as_string(hide_password=True),
+            healthy=self.healthy,
+            reads=self.reads,
+            failures=self.failures,
+        )
+        if isinstance(self.engine.pool, QueuePool):
+            stats.update(checked_out=self.engine.pool.checkedout())
+        return stats
+
+
+class ReadRouter:
+    def __init__(
+        self,
+        replicas: typing.Sequence[Replica] = (),
+        sticky_seconds: float = 5,
+        check_interval: float = 5,
+        check_timeout: float = 2,
+        maxsize: int = 10000,
+    ):
+        self.replicas = list(replicas)
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        # Per worker: a client whose next read lands on another worker can
+        # still be served by a replica that has not caught up yet.
+        self.recent_writers = cache.TTLCache(maxsize=maxsize, ttl=sticky_seconds)
+        self._next = itertools.count()
+        self._task = None
+        self._stopping = asyncio.Event()
+
+        self.primary_reads = 0
+        self.sticky_reads = 0
+
+    def pick(self, request: Request) -> Replica | None:
+        # None means the primary: there are no replicas, none is healthy,
+        # or the caller wrote a moment ago and should see that write.
+        if not self.replicas:
+            return None
+        if self.recent_writers.get(caller(request)):
+            self.sticky_reads += 1
+            return None
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._next) % len(self.replicas)]
+            if replica.healthy:
+                return replica
+        self.primary_reads += 1
+        return None
+
+    def wrote(self, request: Request):
+        if self.replicas:
+            self.recent_writers.set(caller(request), True)
+
+    def failed(self, replica: Replica):
+        # Left out until the next health check finds it answering again.
+        if replica.healthy:
+            logger.warning("Read replica %s failed", replica.engine.url.render_as_string(hide_password=True))
+        replica.healthy = False
+        replica.failures += 1
+
+    async def check(self, replica: Replica):
+        async def ping():
+            async with replica.engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+
+        try:
+            await asyncio.wait_for(ping(), self.check_timeout)
+        except Exception:
+            self.failed(replica)
+        else:
+            replica.healthy = True
+
+    async def check_all(self):
+        await asyncio.gather(*[self.check(replica) for replica in self.replicas])
+
+    async def run(self):
+        while not self._stopping.is_set():
+            await self.check_all()
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.check_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None and self.replicas:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def get_stats(self) -> dict:
+        return dict(
+            replicas=[replica.get_stats() for replica in self.replicas],
+            primary_reads=self.primary_reads,
+            sticky_reads=self.sticky_reads,
+            recent_writers=len(self.recent_writers),
+            sticky_seconds=self.recent_writers.ttl,
+        )
+
+
+class ReadYourWrites:
+    # Marks the caller of every successful write, so its reads stay on the
+    # primary for a moment. Plain ASGI rather than BaseHTTPMiddleware so the
+    # event streams pass through untouched.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS or not router.replicas:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_marking(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                router.wrote(Request(scope))
+            await send(message)
+
+        await self.app(scope, receive, send_marking)
+
+
+router = ReadRouter()
+
+
+def init_replicas(settings):
+    global router
+
+    # Replica checkouts are kept out of the primary's pool stats.
+    urls = [url.strip() for url in settings.SQLDB_READ_URLS.split(",") if url.strip()]
+    router = ReadRouter(
+        [Replica(models.make_engine(settings, url, poolclass=AsyncAdaptedQueuePool)) for url in urls],
+        sticky_seconds=settings.READ_YOUR_WRITES_SECONDS,
+        check_interval=settings.READ_REPLICA_CHECK_INTERVAL,
+        check_timeout=settings.READ_REPLICA_CHECK_TIMEOUT,
+        maxsize=settings.USER_CACHE_SIZE,
+    )
+
+
+async def get_read_session(request: Request) -> typing.AsyncIterator[models.UnitOfWork]:
+    # For GET routes that can take a replica's lag. session.info["source"]
+    # tells a cached route which kind of database its rows came from.
+    replica = router.pick(request)
+    if replica is None:
+        async with models.async_session(info=dict(source="primary")) as session:
+            yield session
+        return
+
+    replica.reads += 1
+    async with replica.session(info=dict(source="replica")) as session:
+        try:
+            yield session
+        except exc.DBAPIError as error:
+            if error.connection_invalidated or isinstance(error, exc.OperationalError):
+                router.failed(replica)
+            raise
+
+
+def start():
+    router.start()
+
+
+async def stop():
+    await router.stop()
+
+
+def get_stats() -> dict:
+    return router.get_stats()
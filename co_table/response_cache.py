@@ -0,0 +1,141 @@
+import collections
+import time
+import typing
+
+from fastapi.responses import Response
+from sqlmodel import SQLModel
+
+
+class MemoryBackend:
+    # Per worker: a write made through another worker is only seen here
+    # once the entry's ttl runs out. A shared backend (Redis and the like)
+    # needs the same five coroutines, with versions kept next to the
+    # entries so every worker sees every bump.
+    name = "memory"
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: collections.OrderedDict[str, tuple[float, bytes]] = collections.OrderedDict()
+        self._versions: dict[str, int] = collections.defaultdict(int)
+
+        self.evictions = 0
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        if len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        self.size -= len(self._entries.pop(key)[1])
+
+    async def version(self, name: str) -> int:
+        return self._versions[name]
+
+    async def bump(self, name: str) -> int:
+        # Entries of older versions are never asked for again and age out
+        # of the LRU.
+        self._versions[name] += 1
+        return self._versions[name]
+
+    def get_stats(self) -> dict:
+        return dict(
+            entries=len(self._entries),
+            bytes=self.size,
+            max_bytes=self.max_bytes,
+            evictions=self.evictions,
+            versions=dict(self._versions),
+        )
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl: float = 30, enabled: bool = True):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_load(
+        self,
+        route: str,
+        depends_on: typing.Sequence[type[SQLModel]],
+        key: typing.Hashable,
+        load: typing.Callable[[], typing.Awaitable[Response]],
+    ) -> Response:
+        # The key carries the version of every model the response is built
+        # from, so a write makes the old entries unreachable at once.
+        if not self.enabled:
+            return await load()
+        versions = [await self.backend.version(model.__tablename__) for model in depends_on]
+        cache_key = repr((route, tuple(versions), key))
+        body = await self.backend.get(cache_key)
+        if body is not None:
+            self.hits += 1
+            return Response(body, media_type="application/json")
+
+        self.misses += 1
+        response = await load()
+        await self.backend.set(cache_key, response.body, self.ttl)
+        return response
+
+    async def bump(self, *models: type[SQLModel]):
+        for model in models:
+            await self.backend.bump(model.__tablename__)
+
+    def get_stats(self) -> dict:
+        return dict(
+            self.backend.get_stats(),
+            backend=self.backend.name,
+            enabled=self.enabled,
+            ttl=self.ttl,
+            hits=self.hits,
+            misses=self.misses,
+        )
+
+
+responses = ResponseCache(MemoryBackend(max_bytes=16 * 1024 * 1024))
+
+
+def init_response_cache(settings):
+    global responses
+
+    if settings.RESPONSE_CACHE_BACKEND == "memory":
+        backend = MemoryBackend(max_bytes=settings.RESPONSE_CACHE_MAX_BYTES)
+    else:
+        raise ValueError(f"Unknown response cache backend: {settings.RESPONSE_CACHE_BACKEND}")
+    responses = ResponseCache(backend, ttl=settings.RESPONSE_CACHE_TTL, enabled=settings.RESPONSE_CACHE_ENABLED)
+
+
+async def get_or_load(
+    route: str,
+    depends_on: typing.Sequence[type[SQLModel]],
+    key: typing.Hashable,
+    load: typing.Callable[[], typing.Awaitable[Response]],
+) -> Response:
+    return await responses.get_or_load(route, depends_on, key, load)
+
+
+async def bump(*models: type[SQLModel]):
+    await responses.bump(*models)
+
+
+def get_stats() -> dict:
+    return responses.get_stats()
@@ -0,0 +1,212 @@
+import asyncio
+import collections
+import datetime
+import logging
+import time
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import models
+from . import sync
+
+logger = logging.getLogger(__name__)
+
+HOUR = datetime.timedelta(hours=1)
+STATE = "occupancy_hourly"
+
+
+def hours_of(start: datetime.datetime, end: datetime.datetime):
+    # (hour, reserved minutes in that hour) for every hour the span touches.
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    while hour < end:
+        overlap = min(end, hour + HOUR) - max(start, hour)
+        yield hour, round(overlap.total_seconds() / 60)
+        hour += HOUR
+
+
+def add_span(deltas: dict, room_id: int, start: datetime.datetime, end: datetime.datetime, sign: int):
+    for hour, minutes in hours_of(start, end):
+        delta = deltas[room_id, hour]
+        delta[0] += sign * minutes
+        delta[1] += sign
+
+
+async def apply_deltas(session: AsyncSession, deltas: dict):
+    hours_by_room = collections.defaultdict(list)
+    for room_id, hour in deltas:
+        hours_by_room[room_id].append(hour)
+
+    for room_id, hours in hours_by_room.items():
+        existing = {
+            row.hour: row
+            for row in (await session.exec(
+                select(models.DBOccupancyHourly)
+                .where(models.DBOccupancyHourly.room_id == room_id)
+                .where(models.DBOccupancyHourly.hour.in_(hours))
+            )).all()
+        }
+        for hour in hours:
+            minutes, count = deltas[room_id, hour]
+            row = existing.get(hour)
+            if row is None:
+                if count <= 0:
+                    continue
+                row = models.DBOccupancyHourly(room_id=room_id, hour=hour)
+                session.add(row)
+            row.reserved_minutes += minutes
+            row.reservations += count
+            if row.reservations <= 0:
+                await session.delete(row)
+
+
+class Rollup:
+    def __init__(self, interval: float = 60, batch_size: int = 500):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: asyncio.Task | None = None
+        self._stopping = asyncio.Event()
+
+        self.runs = 0
+        self.errors = 0
+        self.folded = 0
+        self.removed = 0
+        self.last_duration = 0.0
+        self.watermark: str | None = None
+
+    async def fold_batch(self, session: AsyncSession) -> bool:
+        # Folds the next batch of reservation changes since the stored
+        # watermark and moves the watermark in the same transaction. The state
+        # row is locked on Postgres, so workers running the rollup at the same
+        # time take turns instead of folding a change twice.
+        state = await session.get(models.DBRollupState, STATE, with_for_update=True)
+        if state is None:
+            state = models.DBRollupState(name=STATE)
+            session.add(state)
+        result = await sync.changes(session, models.DBReservation, "reservation", self.batch_size, state.watermark)
+
+        changed_ids = [db_reservation.id for db_reservation in result.items]
+        folded = {
+            row.reservation_id: row
+            for row in (await session.exec(
+                select(models.DBOccupancyFolded)
+                .where(models.DBOccupancyFolded.reservation_id.in_(changed_ids + result.deleted))
+            )).all()
+        }
+        table_ids = {db_reservation.table_id for db_reservation in result.items}
+        rooms = dict((await session.exec(
+            select(models.DBTable.id, models.DBTable.room_id).where(models.DBTable.id.in_(table_ids))
+        )).all())
+
+        deltas = collections.defaultdict(lambda: [0, 0])
+        for row in folded.values():
+            add_span(deltas, row.room_id, row.start_time, row.end_time, -1)
+
+        for db_reservation in result.items:
+            row = folded.pop(db_reservation.id, None)
+            room_id = rooms.get(db_reservation.table_id)
+            if db_reservation.start_time is None or db_reservation.end_time is None or room_id is None:
+                if row is not None:
+                    await session.delete(row)
+                continue
+            add_span(deltas, room_id, db_reservation.start_time, db_reservation.end_time, 1)
+            if row is None:
+                row = models.DBOccupancyFolded(reservation_id=db_reservation.id, room_id=room_id,
+                    start_time=db_reservation.start_time, end_time=db_reservation.end_time)
+                session.add(row)
+            else:
+                row.room_id = room_id
+                row.start_time = db_reservation.start_time
+                row.end_time = db_reservation.end_time
+            self.folded += 1
+
+        # What is left was deleted.
+        for row in folded.values():
+            await session.delete(row)
+            self.removed += 1
+
+        await apply_deltas(session, deltas)
+        state.watermark = result.watermark
+        await session.commit()
+        self.watermark = result.watermark
+        return result.has_more
+
+    async def catch_up(self):
+        began = time.monotonic()
+        async with AsyncSession(models.engine, expire_on_commit=False) as session:
+            while await self.fold_batch(session):
+                pass
+        self.runs += 1
+        self.last_duration = time.monotonic() - began
+
+    async def run(self):
+        while not self._stopping.is_set():
+            try:
+                await self.catch_up()
+            except Exception:
+                self.errors += 1
+                logger.exception("Occupancy rollup failed")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._task, self.interval)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+
+    def get_stats(self) -> dict:
+        return dict(
+            running=self._task is not None,
+            interval=self.interval,
+            batch_size=self.batch_size,
+            runs=self.runs,
+            errors=self.errors,
+            folded=self.folded,
+            removed=self.removed,
+            last_duration=self.last_duration,
+        )
+
+
+rollup = None
+enabled = False
+
+
+def init_rollup(settings):
+    global rollup, enabled
+
+    enabled = settings.ROLLUP_ENABLED
+    rollup = Rollup(interval=settings.ROLLUP_INTERVAL, batch_size=settings.ROLLUP_BATCH_SIZE)
+
+
+def get_rollup() -> Rollup:
+    global rollup
+
+    if rollup is None:
+        rollup = Rollup()
+    return rollup
+
+
+def start():
+    if enabled:
+        get_rollup().start()
+
+
+async def stop():
+    if rollup is not None:
+        await rollup.stop()
+
+
+def get_stats() -> dict:
+    return dict(get_rollup().get_stats(), enabled=enabled)
@@ -1,4 +1,4 @@
-from . import root, user, authentication, room, table, reservation
+from . import root, user, authentication, room, table, reservation, analytics
 
 def init_routers(app):
     app.include_router(root.router)
@@ -6,4 +6,5 @@ def init_routers(app):
     app.include_router(authentication.router)
     app.include_router(room.router)
     app.include_router(table.router)
-    app.include_router(reservation.router)
\ No newline at end of file
+    app.include_router(reservation.router)
+    app.include_router(analytics.router)
\ No newline at end of file
@@ -0,0 +1,131 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlmodel import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Annotated
+from .. import models
+from .. import deps
+from .. import rollup
+
+import datetime
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["analytics"],
+)
+
+DEFAULT_WINDOW = datetime.timedelta(days=30)
+MAX_WINDOW = datetime.timedelta(days=92)
+
+# Everything here reads occupancy_hourly, which the rollup keeps within
+# ROLLUP_INTERVAL of the reservations; reservations are never scanned.
+
+def require_admin(current_user: models.TokenPrincipal):
+  if current_user.roles != "admin":
+    raise HTTPException(status_code=403, detail="Not enough permissions")
+
+def window(from_: datetime.datetime | None, to: datetime.datetime | None) -> tuple[datetime.datetime, datetime.datetime]:
+  # By default the 30 days up to the end of today, which takes in the
+  # bookings running now.
+  if to is None:
+    to = datetime.datetime.combine(datetime.date.today(), datetime.time()) + datetime.timedelta(days=1)
+  if from_ is None:
+    from_ = to - DEFAULT_WINDOW
+  if from_ >= to:
+    raise HTTPException(status_code=400, detail="from must be earlier than to")
+  if to - from_ > MAX_WINDOW:
+    raise HTTPException(status_code=400, detail=f"The window can be at most {MAX_WINDOW.days} days")
+  return from_, to
+
+async def count_tables(session: AsyncSession, room_ids: list[int]) -> int:
+  return (await session.exec(
+    select(func.count(models.DBTable.id)).where(models.DBTable.room_id.in_(room_ids)))).one()
+
+async def heatmap(
+    session: AsyncSession, room_ids: list[int], from_: datetime.datetime, to: datetime.datetime
+    ) -> models.OccupancyHeatmap:
+  tables = await count_tables(session, room_ids)
+  result = await session.exec(
+    select(models.DBOccupancyHourly.hour, func.sum(models.DBOccupancyHourly.reserved_minutes))
+    .where(models.DBOccupancyHourly.room_id.in_(room_ids))
+    .where(models.DBOccupancyHourly.hour >= from_, models.DBOccupancyHourly.hour < to)
+    .group_by(models.DBOccupancyHourly.hour)
+  )
+  minutes = [[0] * 24 for _ in range(7)]
+  for hour, reserved_minutes in result.all():
+    minutes[hour.weekday()][hour.hour] += reserved_minutes
+
+  occurrences = [[0] * 24 for _ in range(7)]
+  hour = from_.replace(minute=0, second=0, microsecond=0)
+  if hour < from_:
+    hour += rollup.HOUR
+  while hour < to:
+    occurrences[hour.weekday()][hour.hour] += 1
+    hour += rollup.HOUR
+
+  cells = [
+    [
+      minutes[day][hour] / (occurrences[day][hour] * 60 * tables) if occurrences[day][hour] and tables else 0.0
+      for hour in range(24)
+    ]
+    for day in range(7)
+  ]
+  return models.OccupancyHeatmap(room_ids=room_ids, tables=tables, from_time=from_, to_time=to, cells=cells)
+
+@router.get("/rooms/{room_id}/occupancy", response_model=models.OccupancyList)
+async def get_room_occupancy(
+    room_id: int,
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    from_: Annotated[datetime.datetime | None, Query(alias="from")] = None,
+    to: datetime.datetime | None = None,
+    ) -> models.OccupancyList:
+  require_admin(current_user)
+  from_, to = window(from_, to)
+  if await session.get(models.DBRoom, room_id) is None:
+    raise HTTPException(status_code=404, detail="Room not found")
+
+  tables = await count_tables(session, [room_id])
+  result = await session.exec(
+    select(models.DBOccupancyHourly)
+    .where(models.DBOccupancyHourly.room_id == room_id)
+    .where(models.DBOccupancyHourly.hour >= from_, models.DBOccupancyHourly.hour < to)
+    .order_by(models.DBOccupancyHourly.hour)
+  )
+  hours = [
+    models.OccupancyHour(
+      hour=row.hour,
+      reserved_minutes=row.reserved_minutes,
+      reservations=row.reservations,
+      utilization=row.reserved_minutes / (60 * tables) if tables else 0.0,
+    )
+    for row in result.all()
+  ]
+  return models.OccupancyList(room_id=room_id, tables=tables, hours=hours)
+
+@router.get("/rooms/{room_id}/heatmap", response_model=models.OccupancyHeatmap)
+async def get_room_heatmap(
+    room_id: int,
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    from_: Annotated[datetime.datetime | None, Query(alias="from")] = None,
+    to: datetime.datetime | None = None,
+    ) -> models.OccupancyHeatmap:
+  require_admin(current_user)
+  from_, to = window(from_, to)
+  if await session.get(models.DBRoom, room_id) is None:
+    raise HTTPException(status_code=404, detail="Room not found")
+  return await heatmap(session, [room_id], from_, to)
+
+@router.get("/faculties/{faculty}/heatmap", response_model=models.OccupancyHeatmap)
+async def get_faculty_heatmap(
+    faculty: str,
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    from_: Annotated[datetime.datetime | None, Query(alias="from")] = None,
+    to: datetime.datetime | None = None,
+    ) -> models.OccupancyHeatmap:
+  require_admin(current_user)
+  from_, to = window(from_, to)
+  room_ids = list((await session.exec(
+    select(models.DBRoom.id).where(models.DBRoom.faculty == faculty).order_by(models.DBRoom.id))).all())
+  return await heatmap(session, room_ids, from_, to)
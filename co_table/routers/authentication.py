@@ -10,8 +10,9 @@ import datetime
 from .. import config
 from .. import models
 from .. import security
+from .. import deps
 
-from ..models.user import Token, DBUser
+from ..models.user import Token, DBUser, RefreshTokenRequest
 
 router = APIRouter(tags=["Authentication"])
 
@@ -43,7 +44,6 @@ async def authentication(
             detail = "Incorrect username or password",
         )
 
-    print("userx", user, await user.verify_password(form_data.password))
     if not await user.verify_password(form_data.password):
         raise HTTPException(
             status_code = status.HTTP_401_UNAUTHORIZED,
@@ -55,23 +55,71 @@ async def authentication(
     session.add(user)
     await session.commit()
     await session.refresh(user)
+    deps.invalidate_user(user.id)
 
+    family, token_id = await security.refresh_tokens.start(
+        session, user.id, refresh_token_expires_at()
+    )
+    return create_token(
+        security.user_claims(user), family, token_id, user.last_login_date
+    )
+
+
+@router.post("/token/refresh")
+async def refresh_authentication(
+    form_data: RefreshTokenRequest,
+    session: Annotated[models.AsyncSession, Depends(models.get_session)],
+) -> Token:
+    payload = deps.decode_token(
+        form_data.refresh_token, token_type=security.REFRESH_TOKEN_TYPE
+    )
+    if payload.get("ver") != security.CLAIMS_VERSION:
+        raise deps.credentials_exception()
+
+    # Roles, faculty or password changed since login: the embedded claims
+    # are stale, so the client has to log in again.
+    if payload["gen"] != await deps.get_token_generation(payload["sub"], session):
+        raise deps.credentials_exception()
+
+    token_id = await security.refresh_tokens.rotate(
+        session, payload["fam"], payload["jti"], refresh_token_expires_at()
+    )
+    if token_id is None:
+        raise deps.credentials_exception()
+
+    claims = {claim: payload[claim] for claim in security.TOKEN_CLAIMS}
+    return create_token(claims, payload["fam"], token_id, datetime.datetime.now())
+
+
+def refresh_token_expires_at() -> datetime.datetime:
+    return datetime.datetime.now() + datetime.timedelta(
+        minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES
+    )
+
+
+def create_token(
+    claims: dict, family: str, token_id: str, issued_at: datetime.datetime
+) -> Token:
     access_token_expires = datetime.timedelta(
         minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
     )
     return Token(
         access_token = security.create_access_token(
-            data = {"sub": user.id},
+            data = claims,
             expires_delta = access_token_expires,
         ),
         refresh_token=security.create_refresh_token(
-            data = {"sub": user.id},
-            expires_delta=access_token_expires,
+            data = dict(
+                claims,
+                typ = security.REFRESH_TOKEN_TYPE,
+                fam = family,
+                jti = token_id,
+            ),
         ),
         token_type ="Bearer",
         scope = "",
         expires_in = settings.ACCESS_TOKEN_EXPIRE_MINUTES,
         expires_at = datetime.datetime.now() + access_token_expires,
-        issued_at = user.last_login_date,
-        user_id = user.id,
-    )
\ No newline at end of file
+        issued_at = issued_at,
+        user_id = claims["sub"],
+    )
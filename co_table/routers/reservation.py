@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Header, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlmodel import select, func
+from sqlmodel import select, func, update, delete
 from typing import Annotated
 from .. import models
+from .. import replicas
 from .. import deps
+from .. import pagination
+from .. import counting
+from .. import conflicts
+from .. import events
+from .. import sweeper
+from .. import idempotency
 
-import math
 import datetime
 
 router = APIRouter(
@@ -14,42 +20,173 @@ router = APIRouter(
 )
 
 SIZE_PER_PAGE = 50
+RESERVE_ANY_ATTEMPTS = 3
 
-@router.post("/create_reservation", response_model=models.Reservation)
-async def create_reservation(
+def check_room_access(db_room: models.DBRoom, current_user: models.TokenPrincipal):
+  if db_room.status != True:
+      raise HTTPException(status_code=403, detail="This room is closed, please try again later")
+  if db_room.faculty != current_user.faculty and db_room.faculty != "ไม่มีคณะ":
+    raise HTTPException(status_code=403, detail="You can only reserve tables in your faculty's rooms")
+
+async def reservation_changed(session: AsyncSession, event_type: str, reservation: models.Reservation, room_id: int | None = None):
+  # The booked table's is_available follows the change right away instead
+  # of waiting for the sweeper.
+  await sweeper.reconcile_tables(session, [reservation.table_id])
+  if room_id is None:
+    db_table = await session.get(models.DBTable, reservation.table_id)
+    if db_table is None:
+      return
+    room_id = db_table.room_id
+  await events.publish(room_id, dict(type=event_type, reservation=reservation))
+
+async def insert_reservation(
+    session: AsyncSession,
+    current_user: models.TokenPrincipal,
     reservation: models.CreateReservation,
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
-    session: Annotated[AsyncSession, Depends(models.get_session)],
     ) -> models.Reservation:
   db_reservation = models.DBReservation.model_validate(reservation)
   db_table = await session.get(models.DBTable, reservation.table_id)
-  db_room = await session.get(models.DBRoom, db_table.room_id)
-  db_reservation.table_id = db_table.id
   if not db_table:
         raise HTTPException(status_code=404, detail="Table not found")
+  db_room = await session.get(models.DBRoom, db_table.room_id)
+  db_reservation.table_id = db_table.id
   if not db_room:
       raise HTTPException(status_code=404, detail="Room not found for this table")
-  if db_room.status != True:
-      raise HTTPException(status_code=403, detail="This room is closed, please try again later")
-  if db_room.faculty != current_user.faculty and db_room.faculty != "ไม่มีคณะ":
-    raise HTTPException(status_code=403, detail="You can only reserve tables in your faculty's rooms")
+  check_room_access(db_room, current_user)
   db_reservation.reserved_at = datetime.datetime.now()
   db_reservation.start_time = datetime.datetime.now()
   db_reservation.end_time = db_reservation.start_time + datetime.timedelta(hours=reservation.duration_hours)
-  session.add(db_reservation)
-  await session.commit()
+  async with conflicts.reserve_window(session, db_table.id, db_reservation.start_time, db_reservation.end_time):
+    session.add(db_reservation)
+    await session.commit()
+  counting.counters.adjust(models.DBReservation, 1)
   await session.refresh(db_reservation)
-  return models.Reservation.model_validate(db_reservation)
+  created = models.Reservation.model_validate(db_reservation)
+  await reservation_changed(session, "reservation_created", created, db_room.id)
+  return created
+
+@router.post("/create_reservation", response_model=models.Reservation)
+async def create_reservation(
+    reservation: models.CreateReservation,
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    response: Response,
+    idempotency_key: Annotated[str | None, Header()] = None,
+    ) -> models.Reservation:
+  # A retry carrying the same Idempotency-Key gets the first response back
+  # instead of booking again.
+  created, replayed = await idempotency.run(
+    idempotency_key, (current_user.id, "create_reservation"), reservation,
+    lambda: insert_reservation(session, current_user, reservation))
+  if replayed:
+    response.headers["Idempotent-Replayed"] = "true"
+  return created
+
+@router.post("/reserve_any", response_model=models.Reservation)
+async def reserve_any(
+    reservation: models.ReserveAnyReservation,
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    ) -> models.Reservation:
+  db_room = await session.get(models.DBRoom, reservation.room_id)
+  if not db_room:
+    raise HTTPException(status_code=404, detail="Room not found")
+  check_room_access(db_room, current_user)
+  # Read once: a conflict rolls the session back and expires db_room.
+  room_id = db_room.id
+
+  # A conflict here means a specific-table booking won the race for the
+  # picked table after it was chosen; picking again finds the next one.
+  for _ in range(RESERVE_ANY_ATTEMPTS):
+    start_time = datetime.datetime.now()
+    end_time = start_time + datetime.timedelta(hours=reservation.duration_hours)
+    try:
+      async with conflicts.room_guard(session, room_id):
+        db_table = await conflicts.find_free_table(session, room_id, start_time, end_time)
+        if db_table is None:
+          raise HTTPException(status_code=409, detail="No free table in this room")
+        db_reservation = models.DBReservation(
+          user_id=current_user.id,
+          table_id=db_table.id,
+          duration_hours=reservation.duration_hours,
+          reserved_at=start_time,
+          start_time=start_time,
+          end_time=end_time,
+        )
+        async with conflicts.reserve_window(session, db_table.id, start_time, end_time):
+          session.add(db_reservation)
+          await session.commit()
+    except conflicts.ReservationConflict:
+      continue
+    counting.counters.adjust(models.DBReservation, 1)
+    await session.refresh(db_reservation)
+    created = models.Reservation.model_validate(db_reservation)
+    await reservation_changed(session, "reservation_created", created, room_id)
+    return created
+  raise HTTPException(status_code=409, detail="No free table in this room")
+
+def filter_reservations(
+    statement,
+    table_id: int | None = None,
+    room_id: int | None = None,
+    user_id: int | None = None,
+    from_: datetime.datetime | None = None,
+    to: datetime.datetime | None = None,
+    active_only: bool = False,
+    ):
+  # Each filter leads with table_id or user_id where it can so the
+  # (table_id, start_time) and (user_id, start_time) indexes apply.
+  if table_id is not None:
+    statement = statement.where(models.DBReservation.table_id == table_id)
+  if room_id is not None:
+    statement = statement.where(models.DBReservation.table_id.in_(
+      select(models.DBTable.id).where(models.DBTable.room_id == room_id)))
+  if user_id is not None:
+    statement = statement.where(models.DBReservation.user_id == user_id)
+  # from/to select the reservations overlapping the window.
+  if from_ is not None:
+    statement = statement.where(models.DBReservation.end_time > from_)
+  if to is not None:
+    statement = statement.where(models.DBReservation.start_time < to)
+  if active_only:
+    now = datetime.datetime.now()
+    statement = statement.where(models.DBReservation.start_time <= now, models.DBReservation.end_time > now)
+  return statement
 
 @router.get("/get_list_reservation", response_model=models.ReservationList)
-async def get_reservations(session: Annotated[AsyncSession, Depends(models.get_session)], page: int = 1) -> list[models.ReservationList]:
-  result = await session.exec(select(models.DBReservation).offset((page - 1) * SIZE_PER_PAGE).limit(SIZE_PER_PAGE))
+async def get_reservations(
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)],
+    page: int = 1,
+    size: Annotated[int, Query(ge=1, le=pagination.MAX_PAGE_SIZE)] = SIZE_PER_PAGE,
+    after: str | None = None,
+    before: str | None = None,
+    count: counting.CountMode = "exact",
+    table_id: int | None = None,
+    room_id: int | None = None,
+    user_id: int | None = None,
+    from_: Annotated[datetime.datetime | None, Query(alias="from")] = None,
+    to: datetime.datetime | None = None,
+    active_only: bool = False,
+    ) -> models.ReservationList:
+  if from_ is not None and to is not None and from_ >= to:
+    raise HTTPException(status_code=400, detail="from must be earlier than to")
+  # A NULL start_time cannot be put in a cursor or compared with one; every
+  # route sets start_time, so such rows can only come from outside the API.
+  statement = filter_reservations(
+    select(models.DBReservation).where(models.DBReservation.start_time.is_not(None)),
+    table_id, room_id, user_id, from_, to, active_only)
+  filtered = any(value is not None for value in (table_id, room_id, user_id, from_, to)) or active_only
+  result = await pagination.paginate(
+    session, statement,
+    [models.DBReservation.start_time, models.DBReservation.id], size, page=page, after=after, before=before)
 
-  db_reservations = result.all()
+  db_reservations = result.items
 
-  page_count = int(math.ceil((await session.exec(select(func.count(models.DBReservation.id)))).first() / SIZE_PER_PAGE))
+  page_count = await counting.page_count(
+    session, models.DBReservation, size, count, statement if filtered else None)
 
-  return models.ReservationList.model_validate(dict(reservations=db_reservations, page=page, page_count=page_count, size_per_page=SIZE_PER_PAGE))
+  return models.ReservationList.model_validate(dict(reservations=db_reservations, page=page, page_count=page_count, size_per_page=size,
+    next_cursor=result.next_cursor, prev_cursor=result.prev_cursor))
 
 @router.get("/get_id_reservation", response_model=models.Reservation)
 async def get_reservation(reservation_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]) -> models.Reservation:
@@ -58,48 +195,80 @@ async def get_reservation(reservation_id: int, session: Annotated[AsyncSession,
     return models.Reservation.model_validate(db_reservation)
   raise HTTPException(status_code=404, detail="Reservation not found")
 
+async def raise_missing_or_forbidden(session: AsyncSession, reservation_id: int, action: str):
+  # Only reached when the ownership-filtered statement matched no row.
+  if await session.get(models.DBReservation, reservation_id) is None:
+    raise HTTPException(status_code=404, detail="Reservation not found")
+  raise HTTPException(
+    status_code=403, 
+    detail=f"You are not allowed to {action} this reservation")
+
 @router.put("/update_reservation", response_model=models.Reservation)
 async def update_reservation(
     reservation_id: int,
     reservation: models.UpdateReservation,
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)]
     ) -> models.Reservation:
-  db_reservation = await session.get(models.DBReservation, reservation_id)
-  
-  if not db_reservation:
-    raise HTTPException(status_code=404, detail="Reservation not found")
+  # Moving a booking to a table is held to the same rules as creating one,
+  # and a missing table is a 404 rather than a foreign key error.
+  db_table = await session.get(models.DBTable, reservation.table_id)
+  if not db_table:
+    raise HTTPException(status_code=404, detail="Table not found")
+  db_room = await session.get(models.DBRoom, db_table.room_id)
+  if not db_room:
+    raise HTTPException(status_code=404, detail="Room not found for this table")
+  check_room_access(db_room, current_user)
 
-  if db_reservation.user_id != current_user.id and current_user.roles != "admin":
-    raise HTTPException(
-      status_code=403, 
-      detail="You are not allowed to update this reservation")
-  
-  data = reservation.model_dump()
-  db_reservation.sqlmodel_update(data)
-  
-  if db_reservation.start_time is None:
-    db_reservation.start_time = datetime.datetime.now()
-  
-  db_reservation.end_time = db_reservation.start_time + datetime.timedelta(hours=reservation.duration_hours)
-  session.add(db_reservation)
-  await session.commit()
-  await session.refresh(db_reservation)
-  return models.Reservation.model_validate(db_reservation)
+  start_time = func.coalesce(models.DBReservation.start_time, datetime.datetime.now())
+  statement = (
+    update(models.DBReservation)
+    .where(models.DBReservation.id == reservation_id)
+    .values(
+      **reservation.model_dump(),
+      start_time=start_time,
+      end_time=models.add_hours(start_time, reservation.duration_hours),
+    )
+    .returning(models.DBReservation)
+    .execution_options(synchronize_session=False)
+  )
+  if current_user.roles != "admin":
+    statement = statement.where(models.DBReservation.user_id == current_user.id)
+
+  async with conflicts.table_guard(session, reservation.table_id):
+    db_reservation = (await session.exec(statement)).scalars().one_or_none()
+    if db_reservation is None:
+      await raise_missing_or_forbidden(session, reservation_id, "update")
+    if not conflicts.enforced_by_database(session):
+      await conflicts.ensure_free(
+        session, db_reservation.table_id, db_reservation.start_time, db_reservation.end_time, exclude_id=db_reservation.id)
+    await session.commit()
+  updated = models.Reservation.model_validate(db_reservation)
+  await reservation_changed(session, "reservation_updated", updated)
+  return updated
 
 @router.delete("/delete_reservation")
 async def delete_reservation(
     reservation_id: int, 
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)]
     ) -> None:
-  db_reservation = await session.get(models.DBReservation, reservation_id)
-  if not db_reservation:
-    raise HTTPException(status_code=404, detail="Reservation not found")
-  if db_reservation.user_id != current_user.id and current_user.roles != "admin":
-    raise HTTPException(
-      status_code=403, 
-      detail="You are not allowed to delete this reservation")
-  await session.delete(db_reservation)
+  statement = (
+    delete(models.DBReservation)
+    .where(models.DBReservation.id == reservation_id)
+    .returning(models.DBReservation)
+    .execution_options(synchronize_session=False)
+  )
+  if current_user.roles != "admin":
+    statement = statement.where(models.DBReservation.user_id == current_user.id)
+
+  db_reservation = (await session.exec(statement)).scalars().one_or_none()
+  if db_reservation is None:
+    await raise_missing_or_forbidden(session, reservation_id, "delete")
+  deleted = models.Reservation.model_validate(db_reservation)
+  # Lets the occupancy rollup take the reservation back out.
+  session.add(models.DBTombstone(entity="reservation", entity_id=reservation_id))
   await session.commit()
-  return {"message": "Reservation deleted"}
\ No newline at end of file
+  counting.counters.adjust(models.DBReservation, -1)
+  await reservation_changed(session, "reservation_deleted", deleted)
+  return {"message": "Reservation deleted"}
@@ -1,11 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import select, func
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlmodel import select, update, not_, func, exists
+from sqlalchemy.orm import aliased
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Annotated
 from .. import models
+from .. import replicas
 from .. import deps
+from .. import pagination
+from .. import counting
+from .. import cache
+from .. import config
+from .. import events
+from .. import sync
+from .. import slots
+from .. import singleflight
+from .. import response_cache
 
-import math
+import datetime
 
 router = APIRouter(
     prefix="/rooms",
@@ -13,11 +25,16 @@ router = APIRouter(
 )
 
 SIZE_PER_PAGE = 50
+MAX_HORIZON_DAYS = 14
+
+settings = config.get_setting()
+
+availability_cache = cache.TTLCache(maxsize=256, ttl=settings.AVAILABILITY_CACHE_TTL)
 
 @router.post("/create_room", response_model=models.Room)
 async def create_room(
     room: models.CreateRoom, 
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)]
     ) -> models.Room:
   if current_user.id != room.user_id:
@@ -30,61 +47,256 @@ async def create_room(
   db_room.user_id = current_user.id
   session.add(db_room)
   await session.commit()
+  counting.counters.adjust(models.DBRoom, 1)
+  await response_cache.bump(models.DBRoom)
   await session.refresh(db_room)
   return models.Room.model_validate(db_room)
 
 
 @router.get("/get_listRoom", response_model=models.RoomList)
 async def get_rooms(
-    session: Annotated[AsyncSession, Depends(models.get_session)], 
-    page: int = 1
+    request: Request,
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)], 
+    page: int = 1,
+    size: Annotated[int, Query(ge=1, le=pagination.MAX_PAGE_SIZE)] = SIZE_PER_PAGE,
+    after: str | None = None,
+    before: str | None = None,
+    count: counting.CountMode = "exact",
     ) -> models.RoomList:
-  result = await session.exec(select(models.DBRoom).offset((page - 1) * SIZE_PER_PAGE).limit(SIZE_PER_PAGE))
+  async def load() -> models.RoomList:
+    result = await pagination.paginate(
+      session, select(models.DBRoom), [models.DBRoom.id], size, page=page, after=after, before=before)
+
+    db_rooms = result.items
+    page_count = await counting.page_count(session, models.DBRoom, size, count)
+
+    return models.RoomList.model_validate(dict(rooms=db_rooms, page=page, page_count=page_count, size_per_page=size,
+      next_cursor=result.next_cursor, prev_cursor=result.prev_cursor))
+
+  # Everyone opening the app at once asks for the same first page: it is
+  # served from the cache until a room is written, and a miss is loaded
+  # once however many ask for it. Pages read from a replica are kept apart
+  # from the primary's, so a caller reading its own write never gets one.
+  key = singleflight.request_key(request, session.info["source"])
+  return await response_cache.get_or_load(
+    "get_listRoom", [models.DBRoom], key, lambda: singleflight.do("get_listRoom", key, load))
 
-  db_rooms = result.all()
-  page_count = int(math.ceil((await session.exec(select(func.count(models.DBRoom.id)))).first() / SIZE_PER_PAGE))
+@router.get("/availability", response_model=models.RoomAvailabilityList)
+async def get_availability(
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    faculty: str | None = None,
+    ) -> models.RoomAvailabilityList:
+  availability = availability_cache.get(faculty)
+  if availability is not None:
+    return availability
 
-  return models.RoomList.model_validate(dict(rooms=db_rooms, page=page, page_count=page_count, size_per_page=SIZE_PER_PAGE))
+  # Free means no reservation covers this instant. DBTable.is_available is
+  # not used: it is derived from the same reservations by the sweeper and
+  # lags behind them, and create_reservation does not look at it either.
+  now = datetime.datetime.now()
+  busy = (
+    select(models.DBReservation.table_id)
+    .where(models.DBReservation.start_time <= now, models.DBReservation.end_time > now)
+    .distinct()
+    .subquery()
+  )
+  # A busy table frees up at the first end_time that no other booking of
+  # the table runs past, so back-to-back bookings count as one stretch.
+  following = aliased(models.DBReservation)
+  free_at = (
+    select(
+      models.DBReservation.table_id,
+      func.min(models.DBReservation.end_time).label("free_at"),
+    )
+    .where(models.DBReservation.end_time > now)
+    .where(~exists(
+      select(following.id)
+      .where(following.table_id == models.DBReservation.table_id)
+      .where(following.start_time <= models.DBReservation.end_time)
+      .where(following.end_time > models.DBReservation.end_time)
+    ))
+    .group_by(models.DBReservation.table_id)
+    .subquery()
+  )
+  statement = (
+    select(
+      models.DBRoom.id,
+      models.DBRoom.name,
+      models.DBRoom.faculty,
+      models.DBRoom.status,
+      func.count(models.DBTable.id).label("total_tables"),
+      func.count(busy.c.table_id).label("busy_tables"),
+      func.min(free_at.c.free_at).label("busy_until"),
+    )
+    .select_from(models.DBRoom)
+    .outerjoin(models.DBTable, models.DBTable.room_id == models.DBRoom.id)
+    .outerjoin(busy, busy.c.table_id == models.DBTable.id)
+    .outerjoin(free_at, free_at.c.table_id == busy.c.table_id)
+    .group_by(models.DBRoom.id, models.DBRoom.name, models.DBRoom.faculty, models.DBRoom.status)
+    .order_by(models.DBRoom.id)
+  )
+  if faculty is not None:
+    statement = statement.where(models.DBRoom.faculty == faculty)
+
+  rooms = []
+  for row in (await session.exec(statement)).all():
+    # A closed room refuses reservations, so none of its tables is free.
+    free_tables = row.total_tables - row.busy_tables if row.status else 0
+    if free_tables > 0:
+      next_free_time = now
+    elif row.total_tables > 0 and row.status:
+      next_free_time = row.busy_until
+    else:
+      next_free_time = None
+    rooms.append(models.RoomAvailability(
+      room_id=row.id,
+      name=row.name,
+      faculty=row.faculty,
+      status=row.status,
+      total_tables=row.total_tables,
+      free_tables=free_tables,
+      next_free_time=next_free_time,
+    ))
+
+  availability = models.RoomAvailabilityList(rooms=rooms, generated_at=now)
+  if availability_cache.ttl > 0:
+    availability_cache.set(faculty, availability)
+  return availability
+
+@router.get("/changes", response_model=models.RoomChanges)
+async def get_room_changes(
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    since: str | None = None,
+    size: Annotated[int, Query(ge=1, le=pagination.MAX_PAGE_SIZE)] = SIZE_PER_PAGE,
+    ) -> models.RoomChanges:
+  # Pass the returned watermark as since on the next call; while has_more
+  # is set there are further changes to fetch right away.
+  result = await sync.changes(session, models.DBRoom, "room", size, since)
+  return models.RoomChanges(
+    rooms=[models.Room.model_validate(db_room) for db_room in result.items],
+    deleted=result.deleted, watermark=result.watermark, has_more=result.has_more)
 
 @router.get("/room_id", response_model=models.Room)
 async def get_room(
     room_id: int, 
-    session: Annotated[AsyncSession, Depends(models.get_session)]
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)]
     ) -> models.Room:
   db_room = await session.get(models.DBRoom, room_id)
   if db_room:
     return models.Room.model_validate(db_room)
   raise HTTPException(status_code=404, detail="Room not found")
 
+@router.get("/{room_id}/events")
+async def room_events(
+    room_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)]
+    ) -> StreamingResponse:
+  db_room = await session.get(models.DBRoom, room_id)
+  if not db_room:
+    raise HTTPException(status_code=404, detail="Room not found")
+
+  # Subscribed before the snapshot is read so no change falls in between.
+  subscription = events.subscribe(room_id)
+  try:
+    result = await session.exec(
+      select(models.DBTable).where(models.DBTable.room_id == room_id).order_by(models.DBTable.number))
+    tables = [models.Table.model_validate(db_table) for db_table in result.all()]
+    # The stream can stay open for hours; it must not keep a pooled
+    # connection checked out for that long.
+    await session.close()
+  except BaseException:
+    events.unsubscribe(subscription)
+    raise
+  snapshot = dict(type="snapshot", room_id=room_id, status=db_room.status, tables=tables)
+  return StreamingResponse(
+    events.stream(subscription, snapshot, settings.EVENT_KEEPALIVE),
+    media_type="text/event-stream",
+    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+  )
+
+@router.get("/{room_id}/next_slots", response_model=models.NextSlots)
+async def next_slots(
+    room_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    duration_hours: Annotated[int, Query(ge=1)],
+    horizon_days: Annotated[int, Query(ge=1, le=MAX_HORIZON_DAYS)] = 7,
+    limit: Annotated[int, Query(ge=1, le=50)] = 5,
+    ) -> models.NextSlots:
+  db_room = await session.get(models.DBRoom, room_id)
+  if not db_room:
+    raise HTTPException(status_code=404, detail="Room not found")
+
+  now = datetime.datetime.now()
+  duration = datetime.timedelta(hours=duration_hours)
+  horizon_end = now + datetime.timedelta(days=horizon_days)
+  # A closed room refuses reservations, so it has no slots to offer.
+  if not db_room.status:
+    return models.NextSlots(room_id=room_id, status=False, duration_hours=duration_hours, slots=[], generated_at=now)
+
+  tables = (await session.exec(
+    select(models.DBTable.id, models.DBTable.number)
+    .where(models.DBTable.room_id == room_id)
+    .order_by(models.DBTable.number, models.DBTable.id)
+  )).all()
+  numbers = {table.id: table.number for table in tables}
+  grid = slots.SlotGrid(now, horizon_end - now, numbers)
+
+  reservations = await session.exec(
+    select(models.DBReservation.table_id, models.DBReservation.start_time, models.DBReservation.end_time)
+    .where(models.DBReservation.table_id.in_(list(numbers)))
+    .where(models.DBReservation.end_time > now, models.DBReservation.start_time < horizon_end)
+  )
+  for reservation in reservations.all():
+    grid.mark(reservation.table_id, reservation.start_time, reservation.end_time)
+
+  return models.NextSlots(
+    room_id=room_id,
+    status=True,
+    duration_hours=duration_hours,
+    slots=[
+      models.NextSlot(table_id=slot.table_id, number=numbers[slot.table_id],
+        start_time=slot.start_time, end_time=slot.end_time)
+      for slot in grid.next_slots(duration, limit)
+    ],
+    generated_at=now,
+  )
+
+async def raise_missing_or_not_owner(session: AsyncSession, room_id: int):
+  # Only reached when the owner-filtered statement matched no row.
+  if await session.get(models.DBRoom, room_id) is None:
+    raise HTTPException(status_code=404, detail="Room not found")
+  raise HTTPException(status_code=403, detail="You are not the owner of this room")
+
 @router.put("/update_room", response_model=models.Room)
 async def update_room(
     room_id: int, 
     room: models.UpdateRoom, 
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)]
     ) -> models.Room:
   
   if current_user.roles != "admin" or  current_user.room_permission != True:
     raise HTTPException(status_code=403, detail="Not enough permissions")
   
-  data = room.model_dump()
-  db_room = await session.get(models.DBRoom, room_id)
-
-  if db_room.user_id != current_user.id:
-    raise HTTPException(status_code=403, detail="You are not the owner of this room")
-  
-  if db_room:
-    db_room.sqlmodel_update(data)
-    session.add(db_room)
-    await session.commit()
-    await session.refresh(db_room)
-    return models.Room.model_validate(db_room)
-  raise HTTPException(status_code=404, detail="Room not found")
+  result = await session.exec(
+    update(models.DBRoom)
+    .where(models.DBRoom.id == room_id, models.DBRoom.user_id == current_user.id)
+    .values(**room.model_dump())
+    .returning(models.DBRoom)
+    .execution_options(synchronize_session=False)
+  )
+  db_room = result.scalars().one_or_none()
+  if db_room is None:
+    await raise_missing_or_not_owner(session, room_id)
+  await session.commit()
+  await response_cache.bump(models.DBRoom)
+  await events.publish(room_id, dict(type="room", room_id=room_id, name=db_room.name, status=db_room.status))
+  return models.Room.model_validate(db_room)
 
 @router.delete("/delete_room/{room_id}")
 async def delete_room(
     room_id: int,
-    current_user: Annotated[models.DBUser, Depends(deps.get_current_user)],
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)]
     ) -> dict:
   if current_user.roles != "admin" or  current_user.room_permission != True:
@@ -93,30 +305,40 @@ async def delete_room(
   if db_room.user_id != current_user.id and current_user.roles != "admin":
     raise HTTPException(status_code=403, detail="You are not the owner of this room")
   if db_room:
+    await sync.record_deletes(
+      session, "table", select(models.DBTable.id, models.DBTable.room_id).where(models.DBTable.room_id == room_id))
+    session.add(models.DBTombstone(entity="room", entity_id=room_id, room_id=room_id))
     await session.delete(db_room)
     await session.commit()
+    counting.counters.adjust(models.DBRoom, -1)
+    counting.counters.invalidate(models.DBTable)
+    counting.counters.invalidate(models.DBReservation)
+    await response_cache.bump(models.DBRoom, models.DBTable)
+    await events.publish(room_id, dict(type="room_deleted", room_id=room_id))
     return {"message": "Room deleted"}
   raise HTTPException(status_code=404, detail="Room not found")
 
 @router.put("/status_room")
 async def status_room(
     room_id: int,
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)]
 ) -> dict:
     if current_user.roles != "admin" or current_user.room_permission != True:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
-    db_room = await session.get(models.DBRoom, room_id)
-    if not db_room:
-        raise HTTPException(status_code=404, detail="Room not found")
-    
-    if db_room.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="You are not the owner of this room")
-    
-    db_room.status = not db_room.status
-    session.add(db_room)
+    result = await session.exec(
+        update(models.DBRoom)
+        .where(models.DBRoom.id == room_id, models.DBRoom.user_id == current_user.id)
+        .values(status=not_(models.DBRoom.status))
+        .returning(models.DBRoom.status)
+        .execution_options(synchronize_session=False)
+    )
+    status = result.scalar_one_or_none()
+    if status is None:
+        await raise_missing_or_not_owner(session, room_id)
     await session.commit()
-    await session.refresh(db_room)
+    await response_cache.bump(models.DBRoom)
+    await events.publish(room_id, dict(type="room", room_id=room_id, status=status))
     
-    return {"status": db_room.status}
+    return {"status": status}
@@ -1,8 +1,40 @@
 from fastapi import APIRouter
 
+from .. import deps
+from .. import models
+from .. import hashing
+from .. import security
+from .. import counting
+from .. import sweeper
+from .. import rollup
+from .. import events
+from .. import idempotency
+from .. import singleflight
+from .. import response_cache
+from .. import replicas
+from . import room
 
 router = APIRouter()
 
 @router.get("/")
 async def index() -> dict:
-    return dict(message = "Co-table Application")
\ No newline at end of file
+    return dict(message = "Co-table Application")
+
+@router.get("/metrics")
+async def metrics() -> dict:
+    return dict(
+        db_pool = models.get_pool_stats(),
+        read_replicas = replicas.get_stats(),
+        hashing = hashing.get_stats(),
+        user_cache = deps.user_cache.get_stats(),
+        token_generations = deps.token_generations.get_stats(),
+        refresh_tokens = security.refresh_tokens.get_stats(),
+        row_counts = counting.counters.get_stats(),
+        availability_cache = room.availability_cache.get_stats(),
+        sweeper = sweeper.get_stats(),
+        rollup = rollup.get_stats(),
+        events = events.get_stats(),
+        idempotency = idempotency.get_stats(),
+        singleflight = singleflight.get_stats(),
+        response_cache = response_cache.get_stats(),
+    )
\ No newline at end of file
@@ -1,11 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import select, func, delete
+from fastapi import APIRouter, Depends, HTTPException, Query, Header, Request, Response
+from sqlmodel import select, func, delete, insert, update, not_
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Annotated
 from .. import models
+from .. import replicas
 from .. import deps
+from .. import pagination
+from .. import counting
+from .. import events
+from .. import sync
+from .. import idempotency
+from .. import singleflight
+from .. import response_cache
 
-import math
 
 router = APIRouter(
     prefix="/tables",
@@ -14,56 +21,111 @@ router = APIRouter(
 
 SIZE_PER_PAGE = 50
 
-@router.post("/create_table", response_model=models.Table)
-async def create_Table(
-    table: models.CreateTable, 
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
-    session: Annotated[AsyncSession, Depends(models.get_session)]
-    ) -> models.Table:
+MAX_TABLES_PER_REQUEST = 1000
+
+async def provision_tables(
+    session: AsyncSession,
+    current_user: models.TokenPrincipal,
+    table: models.CreateTable,
+    ) -> list[models.DBTable]:
   if current_user.roles != "admin" or current_user.room_permission != True:
     raise HTTPException(status_code=403, detail="Not enough permissions")
-  created_tables = []
-  result = await session.exec(select(models.DBTable.number).where(models.DBTable.room_id == table.room_id))
-  max_number = max(result.all() or [0])
-  for i in range(table.number):
-    db_table = models.DBTable.model_validate(table)
-    db_room = await session.get(models.DBRoom, db_table.room_id)
-    if db_room.user_id != current_user.id or current_user.roles != "admin":
-      raise HTTPException(
-          status_code=403,
-          detail="Not enough permissions"
+  if table.number < 1 or table.number > MAX_TABLES_PER_REQUEST:
+    raise HTTPException(
+        status_code=400,
+        detail=f"Number of tables must be between 1 and {MAX_TABLES_PER_REQUEST}"
     )
-    if not db_room:
-        raise HTTPException(
-            status_code=404,
-            detail="Room not found"
-        )
-    db_table.room = db_room
-    db_table.number = max_number + i + 1
-    session.add(db_table)
-    created_tables.append(db_table)
+  db_room = await session.get(models.DBRoom, table.room_id)
+  if not db_room:
+    raise HTTPException(status_code=404, detail="Room not found")
+  if db_room.user_id != current_user.id:
+    raise HTTPException(status_code=403, detail="Not enough permissions")
+
+  result = await session.exec(select(func.max(models.DBTable.number)).where(models.DBTable.room_id == table.room_id))
+  max_number = result.one() or 0
+  rows = [
+    dict(number=max_number + i + 1, room_id=table.room_id, is_available=table.is_available)
+    for i in range(table.number)
+  ]
+  result = await session.exec(insert(models.DBTable).values(rows).returning(models.DBTable))
+  created_tables = sorted(result.scalars().all(), key=lambda db_table: db_table.number)
   await session.commit()
-  for db_table in created_tables:
-    await session.refresh(db_table)
-  return models.Table.model_validate(db_table)
+  counting.counters.adjust(models.DBTable, len(created_tables))
+  await response_cache.bump(models.DBTable)
+  await events.publish(table.room_id, dict(
+    type="tables_created", tables=[models.Table.model_validate(db_table) for db_table in created_tables]))
+  return created_tables
+
+@router.post("/create_table", response_model=models.Table)
+async def create_Table(
+    table: models.CreateTable, 
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    response: Response,
+    idempotency_key: Annotated[str | None, Header()] = None,
+    ) -> models.Table:
+  async def create() -> models.Table:
+    created_tables = await provision_tables(session, current_user, table)
+    return models.Table.model_validate(created_tables[-1])
+
+  created, replayed = await idempotency.run(idempotency_key, (current_user.id, "create_table"), table, create)
+  if replayed:
+    response.headers["Idempotent-Replayed"] = "true"
+  return created
+
+@router.post("/bulk_create", response_model=list[models.Table])
+async def bulk_create_tables(
+    table: models.CreateTable, 
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
+    session: Annotated[AsyncSession, Depends(models.get_session)]
+    ) -> list[models.Table]:
+  created_tables = await provision_tables(session, current_user, table)
+  return [models.Table.model_validate(db_table) for db_table in created_tables]
 
 @router.get("/get_listTable", response_model=models.TableList)
 async def get_tables(
-    session: Annotated[AsyncSession, Depends(models.get_session)], 
-    page: int = 1
+    request: Request,
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)], 
+    page: int = 1,
+    size: Annotated[int, Query(ge=1, le=pagination.MAX_PAGE_SIZE)] = SIZE_PER_PAGE,
+    after: str | None = None,
+    before: str | None = None,
+    count: counting.CountMode = "exact",
     ) -> models.TableList:
-  result = await session.exec(select(models.DBTable).offset((page - 1) * SIZE_PER_PAGE).limit(SIZE_PER_PAGE))
+  async def load() -> models.TableList:
+    result = await pagination.paginate(
+      session, select(models.DBTable), [models.DBTable.id], size, page=page, after=after, before=before)
 
-  db_tables = result.all()
-  page_count = int(math.ceil((await session.exec(select(func.count(models.DBTable.id)))).first() / SIZE_PER_PAGE))
+    db_tables = result.items
+    page_count = await counting.page_count(session, models.DBTable, size, count)
 
-  return models.TableList.model_validate(dict(tables=db_tables, page=page, page_count=page_count, size_per_page=SIZE_PER_PAGE))
+    return models.TableList.model_validate(dict(tables=db_tables, page=page, page_count=page_count, size_per_page=size,
+      next_cursor=result.next_cursor, prev_cursor=result.prev_cursor))
 
+  key = singleflight.request_key(request, session.info["source"])
+  return await response_cache.get_or_load(
+    "get_listTable", [models.DBTable], key, lambda: singleflight.do("get_listTable", key, load))
+
+@router.get("/changes", response_model=models.TableChanges)
+async def get_table_changes(
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    since: str | None = None,
+    room_id: int | None = None,
+    size: Annotated[int, Query(ge=1, le=pagination.MAX_PAGE_SIZE)] = SIZE_PER_PAGE,
+    ) -> models.TableChanges:
+  where, deleted_where = [], []
+  if room_id is not None:
+    where.append(models.DBTable.room_id == room_id)
+    deleted_where.append(models.DBTombstone.room_id == room_id)
+  result = await sync.changes(session, models.DBTable, "table", size, since, where, deleted_where)
+  return models.TableChanges(
+    tables=[models.Table.model_validate(db_table) for db_table in result.items],
+    deleted=result.deleted, watermark=result.watermark, has_more=result.has_more)
 
 @router.get("/table_id", response_model=models.Table)
 async def get_table(
     table_id: int, 
-    session: Annotated[AsyncSession, Depends(models.get_session)]
+    session: Annotated[AsyncSession, Depends(replicas.get_read_session)]
 ) -> models.Table:
     result = await session.execute(select(models.DBTable).where(models.DBTable.id == table_id))
     db_table = result.scalar_one_or_none()
@@ -76,32 +138,44 @@ async def get_table(
 @router.delete("/delete_table")
 async def delete_Table(
     table_id: int, 
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)]
     ) -> dict:
   if current_user.roles != "admin" or current_user.room_permission != True:
     raise HTTPException(status_code=401, detail="Not authenticated")
   
-  db_table = await session.get(models.DBTable, table_id)
-  if not db_table:
-    raise HTTPException(status_code=404, detail="Table not found")
-  
-  await session.refresh(db_table, ['room'])
-  if db_table.room.user_id != current_user.id:
-      raise HTTPException(
-          status_code=403,
-          detail="Not enough permissions"
-      )
+  # Reservations of the table go with it through ON DELETE CASCADE.
+  result = await session.exec(
+    delete(models.DBTable)
+    .where(
+      models.DBTable.id == table_id,
+      models.DBTable.room_id.in_(select(models.DBRoom.id).where(models.DBRoom.user_id == current_user.id)),
+    )
+    .returning(models.DBTable.room_id)
+    .execution_options(synchronize_session=False)
+  )
+  room_id = result.scalar_one_or_none()
+  if room_id is None:
+    if await session.get(models.DBTable, table_id) is None:
+      raise HTTPException(status_code=404, detail="Table not found")
+    raise HTTPException(
+        status_code=403,
+        detail="Not enough permissions"
+    )
+  session.add(models.DBTombstone(entity="table", entity_id=table_id, room_id=room_id))
   
-  await session.delete(db_table)
   await session.commit()
+  counting.counters.adjust(models.DBTable, -1)
+  counting.counters.invalidate(models.DBReservation)
+  await response_cache.bump(models.DBTable)
+  await events.publish(room_id, dict(type="table_deleted", table_id=table_id))
   return {"message": "Table deleted"}
 
 
 @router.delete("/del_table_in_room/{room_id}")
 async def del_table_in_room(
     room_id: int,
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)]
 ) -> dict:
     if current_user.roles != "admin" or current_user.room_permission != True:
@@ -114,24 +188,37 @@ async def del_table_in_room(
     if db_room.user_id != current_user.id and current_user.roles != "admin":
         raise HTTPException(status_code=403, detail="You are not the owner of this room")
     
+    await sync.record_deletes(
+        session, "table", select(models.DBTable.id, models.DBTable.room_id).where(models.DBTable.room_id == room_id))
     result = await session.execute(delete(models.DBTable).where(models.DBTable.room_id == room_id))
     
     await session.commit()
+    counting.counters.adjust(models.DBTable, -result.rowcount)
+    counting.counters.invalidate(models.DBReservation)
+    await response_cache.bump(models.DBTable)
+    await events.publish(room_id, dict(type="tables_deleted", room_id=room_id))
     
     return {"message": f"All tables in room {room_id} have been deleted", "tables_deleted": result.rowcount}
 
 @router.put("/is_available/{table_id}")
 async def is_available(
     table_id: int,
-    current_user: Annotated[models.User, Depends(deps.get_current_user)],
+    current_user: Annotated[models.TokenPrincipal, Depends(deps.get_token_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)]
 ) -> dict:
-    db_table = await session.get(models.DBTable, table_id)
-    if db_table is None:
+    result = await session.exec(
+        update(models.DBTable)
+        .where(models.DBTable.id == table_id)
+        .values(is_available=not_(models.DBTable.is_available))
+        .returning(models.DBTable.is_available, models.DBTable.room_id)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.one_or_none()
+    if row is None:
         raise HTTPException(status_code=404, detail="Table not found")
-    db_table.is_available = not db_table.is_available
-    session.add(db_table)
+    is_available = row.is_available
     await session.commit()
-    await session.refresh(db_table)
+    await response_cache.bump(models.DBTable)
+    await events.publish(row.room_id, dict(type="table", table_id=table_id, is_available=is_available))
     
-    return {"is_available": db_table.is_available}
\ No newline at end of file
+    return {"is_available": is_available}
@@ -1,16 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
 
 from flask import json
 
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlmodel import select, func
+from sqlmodel import select
 
 from typing import Annotated
 
 from .. import models
 from .. import deps
+from .. import pagination
+from .. import counting
 
-import math
 
 router = APIRouter(prefix="/users",tags=["Users"],)
 
@@ -54,6 +55,7 @@ async def create_superuser(
 
     session.add(user)
     await session.commit()
+    counting.counters.adjust(models.DBUser, 1)
     await session.refresh(user)
     return user
 
@@ -95,6 +97,7 @@ async def create(
 
     session.add(user)
     await session.commit()
+    counting.counters.adjust(models.DBUser, 1)
     await session.refresh(user)
     return user
 
@@ -105,14 +108,20 @@ def get_me(current_user: models.User = Depends(deps.get_current_user)):
 @router.get("/get_allUser", response_model=models.UserList)
 async def get_users(
     session: Annotated[AsyncSession, Depends(models.get_session)], 
-    page: int = 1
+    page: int = 1,
+    size: Annotated[int, Query(ge=1, le=pagination.MAX_PAGE_SIZE)] = SIZE_PER_PAGE,
+    after: str | None = None,
+    before: str | None = None,
+    count: counting.CountMode = "exact",
     ) -> models.UserList:
-  result = await session.exec(select(models.DBUser).offset((page - 1) * SIZE_PER_PAGE).limit(SIZE_PER_PAGE))
+  result = await pagination.paginate(
+    session, select(models.DBUser), [models.DBUser.id], size, page=page, after=after, before=before)
 
-  db_users = result.all()
-  page_count = int(math.ceil((await session.exec(select(func.count(models.DBUser.id)))).first() / SIZE_PER_PAGE))
+  db_users = result.items
+  page_count = await counting.page_count(session, models.DBUser, size, count)
 
-  return models.UserList.model_validate(dict(users=db_users, page=page, page_count=page_count, size_per_page=SIZE_PER_PAGE))
+  return models.UserList.model_validate(dict(users=db_users, page=page, page_count=page_count, size_per_page=size,
+    next_cursor=result.next_cursor, prev_cursor=result.prev_cursor))
 
 @router.get("/admin-only/")
 async def admin_only_route(
@@ -150,15 +159,17 @@ async def change_password(
             detail="Not found this user",
         )
     
-    if not user.verify_password(password_update.current_password):
+    if not await user.verify_password(password_update.current_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect password",
         )
     
     await user.set_password(password_update.new_password)
+    user.token_generation += 1
     session.add(user)
     await session.commit()
+    deps.invalidate_user(user.id)
 
 @router.put("/update_user")
 async def update_user(
@@ -183,14 +194,17 @@ async def update_user(
             user.name = user_update.name
         if user_update.email is not None:
             user.email = user_update.email
-        if user_update.faculty is not None:
+        if user_update.faculty is not None and user_update.faculty != user.faculty:
             user.faculty = user_update.faculty
-        if user_update.roles is not None and current_user.roles == "admin":
+            user.token_generation += 1
+        if user_update.roles is not None and current_user.roles == "admin" and user_update.roles != user.roles:
             user.roles = user_update.roles
+            user.token_generation += 1
 
         session.add(user)
         await session.commit()
         await session.refresh(user)
+        deps.invalidate_user(user.id)
         return user
     else:
         raise HTTPException(status_code=403, detail="Not enough permissions to update other users")
@@ -213,8 +227,10 @@ async def forget_password(
         )
     
     await existing_email.set_password(new_password.new_password)
+    existing_email.token_generation += 1
     session.add(existing_email)
     await session.commit()
     await session.refresh(existing_email)
+    deps.invalidate_user(existing_email.id)
 
     return {"message": "Password has been reset successfully"}
\ No newline at end of file
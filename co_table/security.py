@@ -1,13 +1,31 @@
 import datetime
+import secrets
 
 import jwt
 
+from sqlmodel import update, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
 from . import config
+from .models.user import DBRefreshTokenFamily
 
 ALGORITHM = "HS256"
+CLAIMS_VERSION = 1
+TOKEN_CLAIMS = ("sub", "ver", "roles", "faculty", "room_permission", "gen")
+REFRESH_TOKEN_TYPE = "refresh"
 
 settings = config.get_setting()
 
+def user_claims(user) -> dict:
+    return {
+        "sub": user.id,
+        "ver": CLAIMS_VERSION,
+        "roles": user.roles,
+        "faculty": user.faculty,
+        "room_permission": user.room_permission,
+        "gen": user.token_generation,
+    }
+
 def create_access_token(data: dict, expires_delta: datetime.timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
@@ -33,4 +51,90 @@ def create_refresh_token(
         )
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
+
+
+class RefreshTokenStore:
+    # Families live in the database so that any worker can rotate a token
+    # issued by another one, and restarts keep clients logged in.
+    purge_every = 1024
+
+    def __init__(self):
+        self.issued = 0
+        self.rotated = 0
+        self.reused = 0
+
+    async def start(
+        self, session: AsyncSession, user_id: int, expires_at: datetime.datetime
+    ) -> tuple[str, str]:
+        family = secrets.token_urlsafe(12)
+        token_id = secrets.token_urlsafe(12)
+        session.add(
+            DBRefreshTokenFamily(
+                family=family, user_id=user_id, token_id=token_id, expires_at=expires_at
+            )
+        )
+        await session.commit()
+        self.issued += 1
+        if self.issued % self.purge_every == 0:
+            await self.purge(session)
+        return family, token_id
+
+    async def rotate(
+        self,
+        session: AsyncSession,
+        family: str,
+        token_id: str,
+        expires_at: datetime.datetime,
+    ) -> str | None:
+        now = datetime.datetime.now()
+        new_token_id = secrets.token_urlsafe(12)
+        # Only one of several concurrent rotations of the same token can match.
+        result = await session.exec(
+            update(DBRefreshTokenFamily)
+            .where(
+                DBRefreshTokenFamily.family == family,
+                DBRefreshTokenFamily.token_id == token_id,
+                DBRefreshTokenFamily.expires_at > now,
+            )
+            .values(token_id=new_token_id, expires_at=expires_at)
+            .returning(DBRefreshTokenFamily.family)
+            .execution_options(synchronize_session=False)
+        )
+        if result.scalar_one_or_none() is not None:
+            await session.commit()
+            self.rotated += 1
+            return new_token_id
+
+        # Unknown, expired, or an already rotated token came back, in which
+        # case one of the two copies leaked; end the whole family and make
+        # the client log in again.
+        result = await session.exec(
+            delete(DBRefreshTokenFamily)
+            .where(DBRefreshTokenFamily.family == family)
+            .returning(DBRefreshTokenFamily.expires_at)
+            .execution_options(synchronize_session=False)
+        )
+        family_expires_at = result.scalar_one_or_none()
+        await session.commit()
+        if family_expires_at is not None and family_expires_at > now:
+            self.reused += 1
+        return None
+
+    async def purge(self, session: AsyncSession):
+        await session.exec(
+            delete(DBRefreshTokenFamily)
+            .where(DBRefreshTokenFamily.expires_at <= datetime.datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+
+    def get_stats(self) -> dict:
+        return dict(
+            issued=self.issued,
+            rotated=self.rotated,
+            reused=self.reused,
+        )
+
+
+refresh_tokens = RefreshTokenStore()
@@ -0,0 +1,98 @@
+import asyncio
+import collections
+import typing
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+
+def request_key(request: Request, scope: typing.Hashable = None) -> tuple:
+    # Identical means same path, same query parameters in any order, and
+    # the same auth scope; routes whose result depends on the caller pass
+    # something that tells callers apart.
+    return (request.url.path, tuple(sorted(request.query_params.multi_items())), scope)
+
+
+class SingleFlight:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._calls: dict[tuple, asyncio.Future] = {}
+        self._stats: dict[str, collections.Counter] = collections.defaultdict(collections.Counter)
+
+    async def do(self, route: str, key: tuple, call: typing.Callable[[], typing.Awaitable]) -> Response:
+        # The first request for a key runs call and renders its JSON once;
+        # requests for the same key arriving meanwhile get the same bytes.
+        stats = self._stats[route]
+        if not self.enabled:
+            stats["leaders"] += 1
+            return self.render(await call())
+
+        key = (route, key)
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            try:
+                body = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The leader's client went away; one of those waiting takes
+                # over instead of failing with it.
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    stats["leader_cancelled"] += 1
+                    continue
+                raise
+            except BaseException:
+                stats["coalesced"] += 1
+                raise
+            stats["coalesced"] += 1
+            return Response(body, media_type="application/json")
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        stats["leaders"] += 1
+        try:
+            body = self.render(await call()).body
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as error:
+            # Followers get the leader's error too: a bad cursor is bad for
+            # all of them, and a database in trouble is not helped by each
+            # one retrying at once.
+            stats["leader_failed"] += 1
+            future.set_exception(error)
+            future.exception()
+            raise
+        else:
+            future.set_result(body)
+        finally:
+            del self._calls[key]
+        return Response(body, media_type="application/json")
+
+    def render(self, content) -> Response:
+        return JSONResponse(jsonable_encoder(content))
+
+    def get_stats(self) -> dict:
+        return dict(
+            enabled=self.enabled,
+            inflight=len(self._calls),
+            routes={route: dict(stats) for route, stats in self._stats.items()},
+        )
+
+
+flights = SingleFlight()
+
+
+def init_singleflight(settings):
+    global flights
+
+    flights = SingleFlight(enabled=settings.SINGLEFLIGHT_ENABLED)
+
+
+async def do(route: str, key: tuple, call: typing.Callable[[], typing.Awaitable]) -> Response:
+    return await flights.do(route, key, call)
+
+
+def get_stats() -> dict:
+    return flights.get_stats()
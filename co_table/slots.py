@@ -0,0 +1,74 @@
+import datetime
+import math
+import typing
+
+SLOT = datetime.timedelta(minutes=15)
+
+
+class Slot(typing.NamedTuple):
+    table_id: int
+    start_time: datetime.datetime
+    end_time: datetime.datetime
+
+
+def free_runs(free: int, length: int) -> int:
+    # Bit i of the result is set when bits i..i+length-1 of free all are:
+    # the AND of free shifted by 0..length-1, built by doubling so it takes
+    # log2(length) big-int operations rather than length of them.
+    run, covered = free, 1
+    while covered < length:
+        step = min(covered, length - covered)
+        run &= run >> step
+        covered += step
+    return run
+
+
+class SlotGrid:
+    # One row per table and one column per SLOT from start, stored as a
+    # Python int per table with bit i set when slot i is booked; whole rows
+    # are tested and shifted at once instead of slot by slot.
+    def __init__(self, start: datetime.datetime, horizon: datetime.timedelta, table_ids: typing.Iterable[int]):
+        self.now = start
+        self.end = start + horizon
+        self.start = start - (start - datetime.datetime.min) % SLOT
+        self.slots = math.ceil((self.end - self.start) / SLOT)
+        self.full = (1 << self.slots) - 1
+        self.busy: dict[int, int] = {table_id: 0 for table_id in table_ids}
+
+    def slot_of(self, moment: datetime.datetime) -> float:
+        return (moment - self.start) / SLOT
+
+    def mark(self, table_id: int, start: datetime.datetime, end: datetime.datetime):
+        # Any slot the booking touches is busy, even partly.
+        first = max(0, math.floor(self.slot_of(start)))
+        last = min(self.slots, math.ceil(self.slot_of(end)))
+        if first < last and table_id in self.busy:
+            self.busy[table_id] |= ((1 << (last - first)) - 1) << first
+
+    def earliest(self, table_id: int, duration: datetime.timedelta) -> Slot | None:
+        free = ~self.busy[table_id] & self.full
+        # A window may start right now, partway into slot 0, and then needs
+        # the slots up to now + duration; later windows start on a boundary.
+        first_length = math.ceil(self.slot_of(self.now + duration))
+        if self.now + duration <= self.end and free_runs(free, first_length) & 1:
+            return Slot(table_id, self.now, self.now + duration)
+
+        # Windows must also end inside the horizon.
+        last = math.floor(self.slot_of(self.end - duration))
+        if last < 1:
+            return None
+        starts = free_runs(free, math.ceil(duration / SLOT)) & ((1 << (last + 1)) - 1) & ~1
+        if not starts:
+            return None
+        start = self.start + SLOT * ((starts & -starts).bit_length() - 1)
+        return Slot(table_id, start, start + duration)
+
+    def next_slots(self, duration: datetime.timedelta, limit: int) -> list[Slot]:
+        found = []
+        for table_id in self.busy:
+            slot = self.earliest(table_id, duration)
+            if slot is not None:
+                found.append(slot)
+        # Stable on ties, so tables keep the order they were given in.
+        found.sort(key=lambda slot: slot.start_time)
+        return found[:limit]
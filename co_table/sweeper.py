@@ -0,0 +1,234 @@
+import asyncio
+import datetime
+import logging
+import time
+
+from sqlalchemy import tuple_
+from sqlmodel import select, update, exists, not_
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import models
+from . import events
+from . import response_cache
+
+logger = logging.getLogger(__name__)
+
+
+def active_reservation(now: datetime.datetime):
+    return exists(
+        select(models.DBReservation.id)
+        .where(models.DBReservation.table_id == models.DBTable.id)
+        .where(models.DBReservation.start_time <= now)
+        .where(models.DBReservation.end_time > now)
+    )
+
+
+async def reconcile_tables(
+    session: AsyncSession, table_ids, now: datetime.datetime | None = None
+) -> list:
+    # Sets is_available from the reservations covering now, touching only
+    # the tables whose flag is wrong, and publishes what changed.
+    now = now or datetime.datetime.now()
+    active = active_reservation(now)
+    result = await session.exec(
+        update(models.DBTable)
+        .where(models.DBTable.id.in_(table_ids))
+        .where(models.DBTable.is_available == active)
+        .values(is_available=not_(active))
+        .returning(models.DBTable.id, models.DBTable.room_id, models.DBTable.is_available)
+        .execution_options(synchronize_session=False)
+    )
+    changed = result.all()
+    await session.commit()
+    if changed:
+        # is_available is part of the cached table listings.
+        await response_cache.bump(models.DBTable)
+    for table in changed:
+        await events.publish(
+            table.room_id, dict(type="table", table_id=table.id, is_available=table.is_available))
+    return changed
+
+
+class Sweeper:
+    def __init__(
+        self,
+        interval: float = 30,
+        batch_size: int = 500,
+        lookback: datetime.timedelta = datetime.timedelta(days=1),
+        overlap: datetime.timedelta = datetime.timedelta(minutes=1),
+        full_every: int = 20,
+    ):
+        self.interval = interval
+        self.batch_size = batch_size
+        # Each sweep rescans this far behind the watermark, for rows written
+        # with a start_time from before their commit (create_reservation
+        # stamps now() first).
+        self.overlap = overlap
+        # Every full_every sweeps all tables are reconciled, which catches
+        # what no start or end crossing shows: deleted reservations, and
+        # updates that moved or shortened one.
+        self.full_every = full_every
+        # Reservations that started or ended after the watermark have not been
+        # applied to DBTable.is_available yet.
+        self.watermark = datetime.datetime.now() - lookback
+        self._task: asyncio.Task | None = None
+        self._stopping = asyncio.Event()
+
+        self.sweeps = 0
+        self.errors = 0
+        self.released = 0
+        self.occupied = 0
+        self.reconciled = 0
+        self.full_sweeps = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_lag = 0.0
+        self.last_duration = 0.0
+
+    async def _batches(self, session: AsyncSession, column, since: datetime.datetime, until: datetime.datetime):
+        # Range scan over the indexed column, resumed from the last row of the
+        # previous batch so a burst of transitions never loads all at once.
+        cursor = None
+        while True:
+            statement = (
+                select(column, models.DBReservation.id, models.DBReservation.table_id)
+                .where(column > since, column <= until)
+                .order_by(column, models.DBReservation.id)
+                .limit(self.batch_size)
+            )
+            if cursor is not None:
+                statement = statement.where(tuple_(column, models.DBReservation.id) > cursor)
+            rows = (await session.exec(statement)).all()
+            if not rows:
+                return
+            self.last_batch_size = len(rows)
+            self.max_batch_size = max(self.max_batch_size, len(rows))
+            yield {row.table_id for row in rows}
+            if len(rows) < self.batch_size:
+                return
+            cursor = tuple_(rows[-1][0], rows[-1].id)
+
+    async def _reconcile_all(self, session: AsyncSession, now: datetime.datetime):
+        last_id = 0
+        while True:
+            table_ids = (await session.exec(
+                select(models.DBTable.id)
+                .where(models.DBTable.id > last_id)
+                .order_by(models.DBTable.id)
+                .limit(self.batch_size)
+            )).all()
+            if not table_ids:
+                break
+            self.reconciled += len(await reconcile_tables(session, table_ids, now))
+            last_id = table_ids[-1]
+        self.full_sweeps += 1
+
+    async def sweep_once(self, now: datetime.datetime | None = None, full: bool | None = None):
+        now = now or datetime.datetime.now()
+        since = self.watermark - self.overlap
+        began = time.monotonic()
+        self.last_lag = (now - self.watermark).total_seconds()
+        if full is None:
+            full = self.full_every > 0 and self.sweeps % self.full_every == 0
+
+        async with AsyncSession(models.engine, expire_on_commit=False) as session:
+            if full:
+                await self._reconcile_all(session, now)
+            else:
+                for column in (models.DBReservation.end_time, models.DBReservation.start_time):
+                    async for table_ids in self._batches(session, column, since, now):
+                        for table in await reconcile_tables(session, table_ids, now):
+                            if table.is_available:
+                                self.released += 1
+                            else:
+                                self.occupied += 1
+
+        self.watermark = now
+        self.sweeps += 1
+        self.last_duration = time.monotonic() - began
+
+    async def run(self):
+        while not self._stopping.is_set():
+            try:
+                await self.sweep_once()
+            except Exception:
+                self.errors += 1
+                logger.exception("Reservation sweep failed")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        # A sweep in progress finishes its current batch commit before the
+        # loop notices the stop request.
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._task, self.interval)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+
+    def get_stats(self) -> dict:
+        return dict(
+            running=self._task is not None,
+            interval=self.interval,
+            batch_size=self.batch_size,
+            watermark=self.watermark.isoformat(),
+            lag_seconds=self.last_lag,
+            last_batch_size=self.last_batch_size,
+            max_batch_size=self.max_batch_size,
+            last_duration=self.last_duration,
+            sweeps=self.sweeps,
+            errors=self.errors,
+            released=self.released,
+            occupied=self.occupied,
+            full_sweeps=self.full_sweeps,
+            reconciled=self.reconciled,
+        )
+
+
+sweeper = None
+enabled = False
+
+
+def init_sweeper(settings):
+    global sweeper, enabled
+
+    enabled = settings.SWEEPER_ENABLED
+    sweeper = Sweeper(
+        interval=settings.SWEEPER_INTERVAL,
+        batch_size=settings.SWEEPER_BATCH_SIZE,
+        lookback=datetime.timedelta(minutes=settings.SWEEPER_LOOKBACK_MINUTES),
+        overlap=datetime.timedelta(seconds=settings.SWEEPER_OVERLAP_SECONDS),
+        full_every=settings.SWEEPER_FULL_EVERY,
+    )
+
+
+def get_sweeper() -> Sweeper:
+    global sweeper
+
+    if sweeper is None:
+        sweeper = Sweeper()
+    return sweeper
+
+
+def start():
+    if enabled:
+        get_sweeper().start()
+
+
+async def stop():
+    if sweeper is not None:
+        await sweeper.stop()
+
+
+def get_stats() -> dict:
+    return dict(get_sweeper().get_stats(), enabled=enabled)
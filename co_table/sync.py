@@ -0,0 +1,86 @@
+import datetime
+import typing
+
+from sqlalchemy import literal, tuple_
+from sqlmodel import SQLModel, select, insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import pagination
+from .models import DBTombstone
+
+# Rows are only handed out once they are this old, so a transaction that
+# stamped updated_at before a client's sync but committed after it is still
+# picked up by the next one.
+SETTLE_TIME = datetime.timedelta(seconds=2)
+
+START = [datetime.datetime.min, 0]
+
+
+class Changes(typing.NamedTuple):
+    items: list
+    deleted: list[int]
+    watermark: str
+    has_more: bool
+
+
+async def record_deletes(session: AsyncSession, entity: str, statement):
+    # statement selects (id, room_id) of the rows about to be deleted.
+    await session.exec(
+        insert(DBTombstone).from_select(
+            ["entity_id", "room_id", "entity", "deleted_at"],
+            statement.add_columns(literal(entity), literal(datetime.datetime.now())),
+        )
+    )
+
+
+async def changes(
+    session: AsyncSession,
+    model: type[SQLModel],
+    entity: str,
+    size: int,
+    since: str | None = None,
+    where: typing.Sequence = (),
+    deleted_where: typing.Sequence = (),
+) -> Changes:
+    keys = [model.updated_at, model.id]
+    deleted_keys = [DBTombstone.deleted_at, DBTombstone.id]
+    # The watermark covers both streams: the last changed row and the last
+    # tombstone the client has seen.
+    if since is None:
+        values = START + START
+    else:
+        values = list(pagination.decode_cursor(since, keys + deleted_keys))
+    settled = datetime.datetime.now() - SETTLE_TIME
+
+    statement = (
+        select(model)
+        .where(model.updated_at <= settled, *where)
+        .where(tuple_(*keys) > tuple_(*values[:2]))
+        .order_by(*keys)
+        .limit(size + 1)
+    )
+    items = list((await session.exec(statement)).all())
+
+    statement = (
+        select(DBTombstone)
+        .where(DBTombstone.entity == entity, DBTombstone.deleted_at <= settled, *deleted_where)
+        .where(tuple_(*deleted_keys) > tuple_(*values[2:]))
+        .order_by(*deleted_keys)
+        .limit(size + 1)
+    )
+    tombstones = list((await session.exec(statement)).all())
+
+    has_more = len(items) > size or len(tombstones) > size
+    items = items[:size]
+    tombstones = tombstones[:size]
+    if items:
+        values[:2] = [items[-1].updated_at, items[-1].id]
+    if tombstones:
+        values[2:] = [tombstones[-1].deleted_at, tombstones[-1].id]
+
+    return Changes(
+        items,
+        [tombstone.entity_id for tombstone in tombstones],
+        pagination.encode_cursor(values),
+        has_more,
+    )
@@ -0,0 +1,46 @@
+import argparse
+import asyncio
+import time
+
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlmodel import delete
+
+from co_table import config, models, rollup
+
+
+async def main(reset: bool, batch_size: int):
+    settings = config.get_setting()
+    models.init_db(settings)
+    await models.create_all()
+
+    if reset:
+        # Start over from the first reservation, e.g. after changing how
+        # reserved minutes are counted.
+        async with models.AsyncSession(models.engine) as session:
+            await session.exec(delete(models.DBOccupancyHourly))
+            await session.exec(delete(models.DBOccupancyFolded))
+            await session.exec(delete(models.DBRollupState))
+            await session.commit()
+
+    # The same fold the running app does every ROLLUP_INTERVAL, carried on
+    # from the stored watermark until it has caught up with reservations.
+    job = rollup.Rollup(batch_size=batch_size)
+    began = time.perf_counter()
+    await job.catch_up()
+    print(f"folded {job.folded} reservations, removed {job.removed}, in {time.perf_counter() - began:.1f}s")
+
+    await models.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fold reservation history into occupancy_hourly.")
+    parser.add_argument("--reset", action="store_true",
+                        help="drop the rollup and rebuild it from every reservation")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.reset, args.batch_size))
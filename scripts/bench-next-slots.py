@@ -0,0 +1,90 @@
+import argparse
+import datetime
+import random
+import statistics
+import time
+
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from co_table import slots
+
+
+def make_reservations(tables: int, days: int, per_table: int, now: datetime.datetime) -> list[tuple]:
+    reservations = []
+    for table_id in range(1, tables + 1):
+        for _ in range(per_table):
+            start_time = now + datetime.timedelta(minutes=random.randint(-120, days * 24 * 60))
+            reservations.append((table_id, start_time, start_time + datetime.timedelta(hours=random.randint(1, 4))))
+    return reservations
+
+
+def grid_search(reservations, tables, now, horizon, duration, limit):
+    grid = slots.SlotGrid(now, horizon, range(1, tables + 1))
+    for reservation in reservations:
+        grid.mark(*reservation)
+    return grid.next_slots(duration, limit)
+
+
+def scan_search(reservations, tables, now, horizon, duration, limit):
+    # The same search one slot at a time over lists of booleans, as a
+    # baseline for the bitset grid.
+    start = now - (now - datetime.datetime.min) % slots.SLOT
+    count = -(-(now + horizon - start) // slots.SLOT)
+    busy = {table_id: [False] * count for table_id in range(1, tables + 1)}
+    for table_id, start_time, end_time in reservations:
+        first = max(0, int((start_time - start) // slots.SLOT))
+        last = min(count, -(-(end_time - start) // slots.SLOT))
+        for i in range(first, last):
+            busy[table_id][i] = True
+    found = []
+    for table_id, row in busy.items():
+        for i in range(count):
+            begin = now if i == 0 else start + slots.SLOT * i
+            end = begin + duration
+            if end > now + horizon:
+                break
+            needed = -(-(end - start) // slots.SLOT)
+            if not any(row[i:needed]):
+                found.append(slots.Slot(table_id, begin, end))
+                break
+    found.sort(key=lambda slot: slot.start_time)
+    return found[:limit]
+
+
+def measure(search, *args, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        search(*args)
+        timings.append((time.perf_counter() - began) * 1000)
+    return timings
+
+
+def main(tables: int, days: int, per_table: int, hours: list[int], repeat: int):
+    now = datetime.datetime.now()
+    horizon = datetime.timedelta(days=days)
+    reservations = make_reservations(tables, days, per_table, now)
+    print(f"{tables} tables x {days} days of {slots.SLOT.seconds // 60}-minute slots, {len(reservations)} reservations")
+    print(f"{'duration':>9} {'grid p50 ms':>12} {'scan p50 ms':>12} {'speedup':>8}")
+    for duration_hours in hours:
+        duration = datetime.timedelta(hours=duration_hours)
+        args = (reservations, tables, now, horizon, duration, 5)
+        assert grid_search(*args) == scan_search(*args)
+        grid = statistics.median(measure(grid_search, *args, repeat=repeat))
+        scan = statistics.median(measure(scan_search, *args, repeat=repeat))
+        print(f"{duration_hours:>8}h {grid:>12.2f} {scan:>12.2f} {scan / grid:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the next-free-slot search of /rooms/{id}/next_slots on a synthetic room.")
+    parser.add_argument("--tables", type=int, default=500)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--per-table", type=int, default=30)
+    parser.add_argument("--hours", type=int, nargs="+", default=[1, 3, 8])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.tables, args.days, args.per_table, args.hours, args.repeat)
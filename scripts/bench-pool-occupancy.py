@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SQLDB_URL", "sqlite+aiosqlite:///./test-data/bench.db")
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import insert
+
+from co_table import config, main, models, security
+
+# (share of requests, method, url builder, expected statuses)
+WORKLOAD = [
+    (0.4, "GET", lambda ids: ("/rooms/get_listRoom", dict(page=1)), {200}),
+    (0.2, "GET", lambda ids: ("/rooms/room_id", dict(room_id=random.choice(ids))), {200}),
+    (0.2, "GET", lambda ids: ("/reservations/get_list_reservation", dict(size=20)), {200}),
+    # A student trying an admin-only route: turned away after the token
+    # check, before anything else touches the database.
+    (0.2, "POST", lambda ids: ("/rooms/create_room", None), {403}),
+]
+
+
+async def sample(stop: asyncio.Event, samples: list[int]):
+    while not stop.is_set():
+        samples.append(models.get_pool_stats()["checked_out"])
+        await asyncio.sleep(0.001)
+
+
+async def run(client: AsyncClient, header: dict, room_ids: list[int], requests: int, concurrency: int) -> dict:
+    weights = [share for share, *_ in WORKLOAD]
+    picks = random.choices(WORKLOAD, weights, k=requests)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(pick):
+        _, method, build, expected = pick
+        url, params = build(room_ids)
+        async with semaphore:
+            if method == "GET":
+                response = await client.get(url, params=params, headers=header)
+            else:
+                response = await client.post(url, headers=header, json=dict(name="x", faculty="x", user_id=1))
+        assert response.status_code in expected | {503}, (url, response.status_code, response.text)
+        return response.status_code
+
+    stop = asyncio.Event()
+    samples: list[int] = []
+    sampler = asyncio.create_task(sample(stop, samples))
+    began = time.perf_counter()
+    statuses = await asyncio.gather(*[send(pick) for pick in picks])
+    elapsed = time.perf_counter() - began
+    stop.set()
+    await sampler
+    return dict(
+        throughput=requests / elapsed,
+        busy=statuses.count(503),
+        mean=statistics.mean(samples),
+        peak=max(samples),
+    )
+
+
+async def main_(requests: int, concurrency: int, pool_size: int):
+    # With no generation cache every token check reads the users table, as
+    # it does on a cold worker.
+    settings = config.Settings(DB_POOL_SIZE=pool_size, DB_MAX_OVERFLOW=0, DB_POOL_TIMEOUT=2, TOKEN_GENERATION_TTL=0)
+    app = main.create_app(settings)
+    await models.recreate_table()
+    async with models.engine.begin() as conn:
+        await conn.execute(insert(models.DBUser).values(
+            id=1, username="bench", password="bench", name="bench", email="bench@email.local",
+            roles="user", room_permission=False,
+        ))
+        await conn.execute(insert(models.DBRoom), [
+            dict(id=i, name=f"room {i}", faculty="bench", user_id=1) for i in range(1, 51)
+        ])
+    header = {"Authorization": f"Bearer {security.create_access_token(data={'sub': 1})}"}
+    room_ids = list(range(1, 51))
+
+    client = AsyncClient(transport=ASGITransport(app=app), base_url="http://localhost", timeout=None)
+    release = models.UnitOfWork.release
+
+    async def hold(self):
+        pass
+
+    print(f"{requests} requests, {concurrency} concurrent, pool of {pool_size}")
+    print(f"{'session':<10} {'req/s':>8} {'mean out':>9} {'peak out':>9} {'503s':>6}")
+    for mode in ["held", "released"]:
+        # held: the connection taken for the token check stays out until
+        # the request ends, as before UnitOfWork.release.
+        models.UnitOfWork.release = hold if mode == "held" else release
+        result = await run(client, header, room_ids, requests, concurrency)
+        print(f"{mode:<10} {result['throughput']:>8.1f} {result['mean']:>9.2f} {result['peak']:>9} {result['busy']:>6}")
+    models.UnitOfWork.release = release
+
+    await models.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure how many pooled connections a mixed workload keeps checked out.")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=5)
+    args = parser.parse_args()
+    os.makedirs("test-data", exist_ok=True)
+    asyncio.run(main_(args.requests, args.concurrency, args.pool_size))
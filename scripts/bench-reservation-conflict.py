@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import datetime
+import random
+import statistics
+import time
+
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import sessionmaker
+
+from co_table import config, conflicts, models
+
+TABLES = 200
+BATCH = 10_000
+CHECKS = 500
+
+
+async def seed(start_count: int, target: int):
+    # History is laid out back to back per table, two hours each, ending
+    # before now so every check exercises the "long history" case.
+    now = datetime.datetime.now()
+    async with models.engine.begin() as conn:
+        for offset in range(start_count, target, BATCH):
+            rows = []
+            for i in range(offset, min(offset + BATCH, target)):
+                table_id = i % TABLES + 1
+                slot = i // TABLES + 1
+                start_time = now - datetime.timedelta(hours=2 * slot + 2)
+                rows.append(dict(
+                    user_id=1,
+                    table_id=table_id,
+                    duration_hours=2,
+                    reserved_at=start_time,
+                    start_time=start_time,
+                    end_time=start_time + datetime.timedelta(hours=2),
+                ))
+            await conn.execute(insert(models.DBReservation), rows)
+
+
+async def measure() -> list[float]:
+    async_session = sessionmaker(models.engine, class_=models.AsyncSession, expire_on_commit=False)
+    now = datetime.datetime.now()
+    timings = []
+    async with async_session() as session:
+        for _ in range(CHECKS):
+            table_id = random.randint(1, TABLES)
+            start_time = now + datetime.timedelta(minutes=random.randint(0, 600))
+            began = time.perf_counter()
+            await conflicts.find_conflict(
+                session, table_id, start_time, start_time + datetime.timedelta(hours=2)
+            )
+            timings.append((time.perf_counter() - began) * 1000)
+    return timings
+
+
+async def main(url: str, sizes: list[int]):
+    models.init_db(config.Settings(SQLDB_URL=url, SECRET_KEY="bench"))
+    await models.recreate_table()
+    async with models.engine.begin() as conn:
+        await conn.execute(insert(models.DBUser).values(
+            id=1, username="bench", password="bench", name="bench", email="bench@email.local",
+            room_permission=True,
+        ))
+        await conn.execute(insert(models.DBRoom).values(id=1, name="bench", faculty="bench", user_id=1))
+        await conn.execute(insert(models.DBTable), [
+            dict(id=i, number=i, room_id=1, is_available=True) for i in range(1, TABLES + 1)
+        ])
+
+    count = 0
+    print(f"{'reservations':>14} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in sorted(sizes):
+        await seed(count, size)
+        count = size
+        if models.engine.dialect.name == "postgresql":
+            async with models.engine.begin() as conn:
+                await conn.execute(text("ANALYZE reservations"))
+        timings = sorted(await measure())
+        p99 = timings[int(len(timings) * 0.99) - 1]
+        print(f"{size:>14,} {statistics.median(timings):>8.3f} {p99:>8.3f}")
+
+    await models.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the reservation overlap check as history grows.")
+    parser.add_argument("--url", default="sqlite+aiosqlite:///./test-data/bench.db",
+                        help="database to benchmark against, its tables are recreated")
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="comma separated reservation counts")
+    args = parser.parse_args()
+    os.makedirs("test-data", exist_ok=True)
+    asyncio.run(main(args.url, [int(size) for size in args.sizes.split(",")]))
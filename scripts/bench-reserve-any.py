@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import random
+import time
+
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SQLDB_URL", "sqlite+aiosqlite:///./test-data/bench.db")
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from httpx import AsyncClient, ASGITransport
+from sqlmodel import delete
+
+from co_table import config, main, models, security
+
+
+async def prepare(client: AsyncClient, header: dict, user_id: int, tables: int) -> tuple[int, list[int]]:
+    room = (await client.post("/rooms/create_room", headers=header, json=dict(
+        name="bench", faculty="ไม่มีคณะ", user_id=user_id))).json()
+    created = (await client.post("/tables/bulk_create", headers=header, json=dict(
+        number=tables, room_id=room["id"], is_available=True))).json()
+    return room["id"], [table["id"] for table in created]
+
+
+async def clear_reservations():
+    async with models.AsyncSession(models.engine) as session:
+        await session.exec(delete(models.DBReservation))
+        await session.commit()
+
+
+async def run(client: AsyncClient, requests: list[tuple[str, dict]], header: dict) -> dict:
+    began = time.perf_counter()
+    responses = await asyncio.gather(*[
+        client.post(url, json=payload, headers=header) for url, payload in requests
+    ])
+    elapsed = time.perf_counter() - began
+
+    statuses = [response.status_code for response in responses]
+    assert set(statuses) <= {200, 409}, [response.text for response in responses if response.status_code not in (200, 409)]
+    full = sum(1 for response in responses if response.status_code == 409
+               and response.json()["detail"] == "No free table in this room")
+    return dict(
+        reserved=statuses.count(200),
+        full=full,
+        conflicts=statuses.count(409) - full,
+        throughput=len(requests) / elapsed,
+    )
+
+
+async def main_(clients: list[int], tables: int):
+    settings = config.Settings()
+    app = main.create_app(settings)
+    await models.recreate_table()
+
+    client = AsyncClient(transport=ASGITransport(app=app), base_url="http://localhost", timeout=None)
+    user = (await client.post("/users/create_superuser", params=dict(
+        email="bench@email.local", name="bench", username="bench", password="bench"))).json()
+    header = {"Authorization": f"Bearer {security.create_access_token(data={'sub': user['id']})}"}
+    room_id, table_ids = await prepare(client, header, user["id"], tables)
+
+    print(f"{tables} tables in one room")
+    print(f"{'strategy':<20} {'clients':>8} {'req/s':>9} {'reserved':>9} {'full':>6} {'conflict rate':>14}")
+    for count in clients:
+        for strategy in ["table_id", "reserve_any"]:
+            await clear_reservations()
+            if strategy == "table_id":
+                # Students picking a table themselves, half of them going for
+                # the few by the window.
+                requests = [
+                    ("/reservations/create_reservation", dict(
+                        user_id=user["id"], duration_hours=1,
+                        table_id=random.choice(table_ids[:max(1, tables // 10)] if random.random() < 0.5 else table_ids)))
+                    for _ in range(count)
+                ]
+            else:
+                requests = [
+                    ("/reservations/reserve_any", dict(room_id=room_id, duration_hours=1))
+                    for _ in range(count)
+                ]
+            result = await run(client, requests, header)
+            print(f"{strategy:<20} {count:>8} {result['throughput']:>9.1f} {result['reserved']:>9} {result['full']:>6} "
+                  f"{result['conflicts'] / count:>14.1%}")
+
+    await models.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare booking a chosen table with reserve_any under concurrent clients.")
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 100, 250, 500])
+    parser.add_argument("--tables", type=int, default=200)
+    args = parser.parse_args()
+    os.makedirs("test-data", exist_ok=True)
+    asyncio.run(main_(args.clients, args.tables))
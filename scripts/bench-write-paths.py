@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SQLDB_URL", "sqlite+aiosqlite:///./test-data/bench.db")
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import event
+
+from co_table import config, main, models, security
+
+statements = 0
+
+
+def count_statement(*args):
+    global statements
+    statements += 1
+
+
+async def timed(client: AsyncClient, requests: list[tuple]) -> tuple[float, float]:
+    global statements
+    timings = []
+    statements = 0
+    for method, url, kwargs in requests:
+        began = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        timings.append((time.perf_counter() - began) * 1000)
+        assert response.status_code == 200, response.text
+    return statistics.median(timings), statements / len(requests)
+
+
+async def toggled_correctly(client: AsyncClient, url: str, key: str, header: dict, clients: int) -> bool:
+    initial = (await client.put(url, headers=header)).json()[key]
+    responses = await asyncio.gather(*[client.put(url, headers=header) for _ in range(clients)])
+    values = [response.json()[key] for response in responses]
+    # Every toggle must observe a distinct state: half see each value and the
+    # last one leaves the row flipped once per request.
+    return (
+        values.count(initial) == clients // 2
+        and values.count(not initial) == clients - clients // 2
+    )
+
+
+async def main_(iterations: int, clients: int):
+    settings = config.Settings()
+    app = main.create_app(settings)
+    await models.recreate_table()
+    event.listen(models.engine.sync_engine, "before_cursor_execute", count_statement)
+
+    client = AsyncClient(transport=ASGITransport(app=app), base_url="http://localhost")
+    user = (await client.post("/users/create_superuser", params=dict(
+        email="bench@email.local", name="bench", username="bench", password="bench"))).json()
+    header = {"Authorization": f"Bearer {security.create_access_token(data={'sub': user['id']})}"}
+
+    room = (await client.post("/rooms/create_room", headers=header, json=dict(
+        name="bench", faculty="ไม่มีคณะ", user_id=user["id"]))).json()
+    tables = []
+    for _ in range(iterations * 2 + 1):
+        tables.append((await client.post("/tables/create_table", headers=header, json=dict(
+            number=1, room_id=room["id"], is_available=True))).json())
+    reservations = []
+    for table in tables[:iterations * 2]:
+        reservations.append((await client.post("/reservations/create_reservation", headers=header, json=dict(
+            user_id=user["id"], table_id=table["id"], duration_hours=1))).json())
+
+    routes = {
+        "PUT /tables/is_available": [
+            ("PUT", f"/tables/is_available/{tables[-1]['id']}", dict(headers=header))
+        ] * iterations,
+        "PUT /rooms/status_room": [
+            ("PUT", f"/rooms/status_room?room_id={room['id']}", dict(headers=header))
+        ] * iterations,
+        "PUT /rooms/update_room": [
+            ("PUT", f"/rooms/update_room?room_id={room['id']}", dict(headers=header, json=dict(
+                name=f"bench {i}", faculty="ไม่มีคณะ", user_id=user["id"], status=True)))
+            for i in range(iterations)
+        ],
+        "PUT /reservations/update_reservation": [
+            ("PUT", f"/reservations/update_reservation?reservation_id={reservation['id']}", dict(
+                headers=header, json=dict(user_id=user["id"], table_id=reservation["table_id"], duration_hours=2)))
+            for reservation in reservations[:iterations]
+        ],
+        "DELETE /reservations/delete_reservation": [
+            ("DELETE", f"/reservations/delete_reservation?reservation_id={reservation['id']}", dict(headers=header))
+            for reservation in reservations[:iterations]
+        ],
+        "DELETE /tables/delete_table": [
+            ("DELETE", f"/tables/delete_table?table_id={table['id']}", dict(headers=header))
+            for table in tables[iterations:iterations * 2]
+        ],
+    }
+
+    print(f"{'route':<40} {'p50 ms':>8} {'statements':>11}")
+    for name, requests in routes.items():
+        p50, per_request = await timed(client, requests)
+        print(f"{name:<40} {p50:>8.3f} {per_request:>11.1f}")
+
+    print()
+    print(f"{clients} concurrent toggles")
+    for name, url, key in [
+        ("PUT /tables/is_available", f"/tables/is_available/{tables[-1]['id']}", "is_available"),
+        ("PUT /rooms/status_room", f"/rooms/status_room?room_id={room['id']}", "status"),
+    ]:
+        correct = await toggled_correctly(client, url, key, header, clients)
+        print(f"{name:<40} {'ok' if correct else 'LOST UPDATES'}")
+
+    await models.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the single-row write routes and check concurrent toggles.")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=50)
+    args = parser.parse_args()
+    os.makedirs("test-data", exist_ok=True)
+    asyncio.run(main_(args.iterations, args.clients))
@@ -1,12 +1,40 @@
+import argparse
 import asyncio
-from co_table import config, models
 
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from co_table import config, models, migrations
+
+
+async def main(command: str, target: int | None):
+    try:
+        if command == "status":
+            status = await migrations.get_status(models.engine)
+            print(f"current {status['current']}, latest {status['latest']}")
+            for step in status["pending"]:
+                print(f"pending {step}")
+        elif command == "upgrade":
+            applied = await migrations.migrate(models.engine, target)
+            print(f"applied {applied}" if applied else "schema is up to date")
+        elif command == "reset":
+            applied = await migrations.reset(models.engine)
+            print(f"dropped every table, applied {applied}")
+    finally:
+        await models.engine.dispose()
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create or migrate the database schema.")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=["status", "upgrade", "reset"])
+    parser.add_argument("--to", type=int, default=None, help="stop at this version instead of the latest")
+    parser.add_argument("--yes", action="store_true", help="confirm that reset may drop all data")
+    args = parser.parse_args()
+    if args.command == "reset" and not args.yes:
+        parser.error("reset drops every table; pass --yes to go ahead")
+
     settings = config.get_setting()
     models.init_db(settings)
-    asyncio.run(models.recreate_table())
\ No newline at end of file
+    asyncio.run(main(args.command, args.to))
@@ -0,0 +1,93 @@
+import datetime
+import pytest
+
+from httpx import AsyncClient
+
+from co_table import rollup, sync
+from co_table.models import Token
+
+
+async def occupancy(client: AsyncClient, token: Token, room_id: int) -> dict:
+    response = await client.get(
+        f"/analytics/rooms/{room_id}/occupancy",
+        headers={"Authorization": f"Bearer {token.access_token}"}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.mark.asyncio
+async def test_occupancy_rollup(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(sync, "SETTLE_TIME", datetime.timedelta(0))
+    job = rollup.Rollup()
+    await job.catch_up()
+
+    header = {"Authorization": f"Bearer {token_user2.access_token}"}
+    room_payload = {"name": "Analytics Room", "user_id": token_user2.user_id, "faculty": "ไม่มีคณะ"}
+    room_id = (await client.post("/rooms/create_room", json=room_payload, headers=header)).json()["id"]
+    payload = {"number": 2, "room_id": room_id, "is_available": True}
+    table_ids = [table["id"] for table in (await client.post("/tables/bulk_create", json=payload, headers=header)).json()]
+
+    user_header = {"Authorization": f"Bearer {token_user1.access_token}"}
+    payload = {"user_id": token_user1.user_id, "table_id": table_ids[0], "duration_hours": 2}
+    reservation = (await client.post("/reservations/create_reservation", json=payload, headers=user_header)).json()
+
+    assert (await occupancy(client, token_user2, room_id))["hours"] == []
+    await job.catch_up()
+    data = await occupancy(client, token_user2, room_id)
+    assert data["tables"] == 2
+    assert len(data["hours"]) in (2, 3)
+    assert all(hour["reservations"] == 1 for hour in data["hours"])
+    assert abs(sum(hour["reserved_minutes"] for hour in data["hours"]) - 120) <= 1
+
+    # Moving and shortening the booking replaces what it contributed.
+    payload = {"user_id": token_user1.user_id, "table_id": table_ids[1], "duration_hours": 1}
+    response = await client.put(
+        "/reservations/update_reservation", params={"reservation_id": reservation["id"]},
+        json=payload, headers=user_header)
+    assert response.status_code == 200
+    await job.catch_up()
+    data = await occupancy(client, token_user2, room_id)
+    assert len(data["hours"]) in (1, 2)
+    assert abs(sum(hour["reserved_minutes"] for hour in data["hours"]) - 60) <= 1
+
+    start_time = datetime.datetime.fromisoformat(reservation["start_time"])
+    response = await client.get(f"/analytics/rooms/{room_id}/heatmap", headers=header)
+    assert response.status_code == 200
+    heatmap = response.json()
+    assert heatmap["room_ids"] == [room_id]
+    assert len(heatmap["cells"]) == 7 and all(len(day) == 24 for day in heatmap["cells"])
+    assert heatmap["cells"][start_time.weekday()][start_time.hour] > 0
+
+    response = await client.get("/analytics/faculties/ไม่มีคณะ/heatmap", headers=header)
+    assert room_id in response.json()["room_ids"]
+    assert response.json()["cells"][start_time.weekday()][start_time.hour] > 0
+
+    response = await client.delete(
+        "/reservations/delete_reservation", params={"reservation_id": reservation["id"]}, headers=user_header)
+    assert response.status_code == 200
+    await job.catch_up()
+    assert (await occupancy(client, token_user2, room_id))["hours"] == []
+    assert job.removed == 1
+
+    response = await client.get(f"/analytics/rooms/{room_id}/heatmap", headers=user_header)
+    assert response.status_code == 403
+    response = await client.get("/analytics/rooms/9999/heatmap", headers=header)
+    assert response.status_code == 404
+    response = await client.get(
+        f"/analytics/rooms/{room_id}/heatmap", params={"from": "2024-01-01T00:00:00", "to": "2024-12-01T00:00:00"},
+        headers=header)
+    assert response.status_code == 400
+
+
+def test_hours_of():
+    start = datetime.datetime(2024, 1, 1, 9, 45)
+    assert list(rollup.hours_of(start, start + datetime.timedelta(hours=1))) == [
+        (datetime.datetime(2024, 1, 1, 9), 15),
+        (datetime.datetime(2024, 1, 1, 10), 45),
+    ]
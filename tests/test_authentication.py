@@ -0,0 +1,173 @@
+import jwt
+import pytest
+
+from httpx import AsyncClient
+
+from co_table import security
+
+
+@pytest.mark.asyncio
+async def test_login(
+    client: AsyncClient,
+):
+    params = {
+        "username": "loginUser",
+        "name": "Login User",
+        "email": "login@test.com",
+        "password": "loginPassword",
+    }
+    create_response = await client.post("/users/create", params=params)
+    assert create_response.status_code == 200
+
+    response = await client.post(
+        "/token",
+        data={"username": params["username"], "password": params["password"]},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["token_type"] == "Bearer"
+    assert data["user_id"] == create_response.json()["id"]
+
+    metrics = (await client.get("/metrics")).json()
+    assert metrics["hashing"]["completed"] >= 2
+    assert metrics["hashing"]["in_flight"] == 0
+    assert metrics["hashing"]["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_login_wrong_password(
+    client: AsyncClient,
+):
+    params = {
+        "username": "wrongPasswordUser",
+        "name": "Wrong Password User",
+        "email": "wrong-password@test.com",
+        "password": "rightPassword",
+    }
+    create_response = await client.post("/users/create", params=params)
+    assert create_response.status_code == 200
+
+    response = await client.post(
+        "/token",
+        data={"username": params["username"], "password": "wrongPassword"},
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Incorrect username or password"
+
+
+async def login_superuser(client: AsyncClient, username: str) -> dict:
+    params = {
+        "username": username,
+        "name": username,
+        "email": f"{username}@test.com",
+        "password": "superPassword",
+    }
+    create_response = await client.post("/users/create_superuser", params=params)
+    assert create_response.status_code == 200
+
+    response = await client.post(
+        "/token",
+        data={"username": params["username"], "password": params["password"]},
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.mark.asyncio
+async def test_access_token_claims(
+    client: AsyncClient,
+):
+    token = await login_superuser(client, "claimsAdmin")
+    payload = jwt.decode(token["access_token"], options={"verify_signature": False})
+    assert payload["sub"] == token["user_id"]
+    assert payload["ver"] == security.CLAIMS_VERSION
+    assert payload["roles"] == "admin"
+    assert payload["faculty"] == "คณะแอดมิน"
+    assert payload["room_permission"] is True
+    assert payload["gen"] == 0
+
+    room_payload = {"name": "Claims Room", "user_id": token["user_id"], "faculty": "Test Faculty"}
+    response = await client.post(
+        "/rooms/create_room",
+        json=room_payload,
+        headers={"Authorization": f"Bearer {token['access_token']}"}
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_access_token_revoked_after_role_change(
+    client: AsyncClient,
+):
+    token = await login_superuser(client, "revokedAdmin")
+    header = {"Authorization": f"Bearer {token['access_token']}"}
+
+    response = await client.put(
+        f"/users/update_user?user_id={token['user_id']}",
+        json={"roles": "visitor"},
+        headers=header,
+    )
+    assert response.status_code == 200
+
+    room_payload = {"name": "Revoked Room", "user_id": token["user_id"], "faculty": "Test Faculty"}
+    response = await client.post("/rooms/create_room", json=room_payload, headers=header)
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_rotation(
+    client: AsyncClient,
+):
+    token = await login_superuser(client, "refreshAdmin")
+
+    response = await client.post("/token/refresh", json={"refresh_token": token["refresh_token"]})
+    assert response.status_code == 200
+    refreshed = response.json()
+    assert refreshed["user_id"] == token["user_id"]
+    assert refreshed["refresh_token"] != token["refresh_token"]
+
+    room_payload = {"name": "Refreshed Room", "user_id": token["user_id"], "faculty": "Test Faculty"}
+    response = await client.post(
+        "/rooms/create_room",
+        json=room_payload,
+        headers={"Authorization": f"Bearer {refreshed['access_token']}"}
+    )
+    assert response.status_code == 200
+
+    reused = await client.post("/token/refresh", json={"refresh_token": token["refresh_token"]})
+    assert reused.status_code == 401
+
+    # Reuse ends the whole family, including the token issued by the rotation.
+    response = await client.post("/token/refresh", json={"refresh_token": refreshed["refresh_token"]})
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_survives_restart(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    token = await login_superuser(client, "restartAdmin")
+
+    # A fresh store stands in for another worker or a restarted process.
+    monkeypatch.setattr(security, "refresh_tokens", security.RefreshTokenStore())
+    response = await client.post("/token/refresh", json={"refresh_token": token["refresh_token"]})
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_is_not_an_access_token(
+    client: AsyncClient,
+):
+    token = await login_superuser(client, "refreshOnlyAdmin")
+
+    room_payload = {"name": "Refresh Only Room", "user_id": token["user_id"], "faculty": "Test Faculty"}
+    response = await client.post(
+        "/rooms/create_room",
+        json=room_payload,
+        headers={"Authorization": f"Bearer {token['refresh_token']}"}
+    )
+    assert response.status_code == 401
+
+    response = await client.post("/token/refresh", json={"refresh_token": token["access_token"]})
+    assert response.status_code == 401
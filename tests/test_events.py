@@ -0,0 +1,86 @@
+import asyncio
+import json
+import pytest
+
+from httpx import AsyncClient
+
+from co_table import events
+from co_table.models import Token
+
+
+def parse_stream(body: str) -> list[dict]:
+    return [
+        json.loads(line[len("data: "):])
+        for line in body.splitlines()
+        if line.startswith("data: ")
+    ]
+
+
+async def wait_for_subscriber(room_id: int, stream: asyncio.Task):
+    while events.bus.subscriber_count(room_id) == 0:
+        assert not stream.done(), stream.result().text
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_room_events_stream(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+):
+    header = {"Authorization": f"Bearer {token_user2.access_token}"}
+    room_payload = {"name": "Display Room", "user_id": token_user2.user_id, "faculty": "ไม่มีคณะ"}
+    room_id = (await client.post("/rooms/create_room", json=room_payload, headers=header)).json()["id"]
+    table_payload = {"number": 1, "room_id": room_id, "is_available": True}
+    table_id = (await client.post("/tables/create_table", json=table_payload, headers=header)).json()["id"]
+
+    stream = asyncio.create_task(client.get(f"/rooms/{room_id}/events"))
+    await asyncio.wait_for(wait_for_subscriber(room_id, stream), 5)
+
+    await client.put(f"/tables/is_available/{table_id}", headers=header)
+    response = await client.post(
+        "/reservations/create_reservation",
+        json={"user_id": token_user1.user_id, "table_id": table_id, "duration_hours": 1},
+        headers={"Authorization": f"Bearer {token_user1.access_token}"}
+    )
+    assert response.status_code == 200
+    await client.delete(f"/rooms/delete_room/{room_id}", headers=header)
+
+    response = await asyncio.wait_for(stream, 5)
+    assert response.headers["content-type"].startswith("text/event-stream")
+    received = parse_stream(response.text)
+    assert [event["type"] for event in received] == [
+        "snapshot", "table", "reservation_created", "room_deleted"
+    ]
+    assert [table["id"] for table in received[0]["tables"]] == [table_id]
+    assert received[1] == {"type": "table", "table_id": table_id, "is_available": False}
+    assert received[2]["reservation"]["table_id"] == table_id
+    assert events.bus.subscriber_count(room_id) == 0
+
+
+@pytest.mark.asyncio
+async def test_room_events_room_not_found(
+    client: AsyncClient,
+):
+    response = await client.get("/rooms/9999/events")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_is_evicted():
+    bus = events.EventBus(max_queue=2)
+    slow = bus.subscribe(1)
+    fast = bus.subscribe(1)
+    other_room = bus.subscribe(2)
+
+    for i in range(2):
+        bus.deliver(1, dict(type="table", table_id=i))
+        assert (await fast.get())["table_id"] == i
+    bus.deliver(1, dict(type="table", table_id=2))
+
+    assert slow.evicted
+    assert await slow.get() == events.EVICTED
+    assert (await fast.get())["table_id"] == 2
+    assert other_room.queue.empty()
+    assert bus.subscriber_count(1) == 1
+    assert bus.get_stats()["evictions"] == 1
@@ -0,0 +1,104 @@
+import pytest
+
+from httpx import AsyncClient
+from sqlalchemy import event, insert, inspect, select
+from sqlmodel import SQLModel
+
+from co_table import config, migrations, models
+
+
+@pytest.mark.asyncio
+async def test_migrate_new_and_current_database(client: AsyncClient):
+    settings = config.Settings(SQLDB_URL="sqlite+aiosqlite:///./test-data/test-migrations.db")
+    engine = models.make_engine(settings, settings.SQLDB_URL)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.drop_all)
+            await conn.run_sync(migrations.metadata.drop_all)
+
+        assert await migrations.get_status(engine) == dict(
+            current=0, latest=migrations.latest(),
+            pending=[f"{step.version}: {step.name}" for step in migrations.MIGRATIONS])
+        assert await migrations.migrate(engine) == [step.version for step in migrations.MIGRATIONS]
+        async with engine.connect() as conn:
+            tables = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names())
+        assert set(SQLModel.metadata.tables) | {"schema_version"} <= set(tables)
+
+        # Up to date: a single query and nothing applied.
+        statements = []
+        event.listen(engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        assert await migrations.migrate(engine) == []
+        assert len(statements) == 1
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_migrate_adopts_existing_database():
+    # A database the old startup built with create_all, data and all.
+    settings = config.Settings(SQLDB_URL="sqlite+aiosqlite:///./test-data/test-migrations.db")
+    engine = models.make_engine(settings, settings.SQLDB_URL)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.drop_all)
+            await conn.run_sync(migrations.metadata.drop_all)
+            await conn.run_sync(SQLModel.metadata.create_all)
+            await conn.execute(insert(models.DBUser).values(
+                id=1, username="kept", password="kept", name="kept", email="kept@email.local",
+                roles="user", room_permission=False))
+
+        assert await migrations.current_version(engine) == 0
+        assert await migrations.migrate(engine) == [step.version for step in migrations.MIGRATIONS]
+        async with engine.connect() as conn:
+            result = await conn.execute(select(models.DBUser.username))
+            assert result.scalars().all() == ["kept"]
+        assert (await migrations.get_status(engine))["pending"] == []
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_startup_without_migrating_refuses_old_schema(monkeypatch: pytest.MonkeyPatch):
+    settings = config.Settings(SQLDB_URL="sqlite+aiosqlite:///./test-data/test-migrations.db")
+    engine = models.make_engine(settings, settings.SQLDB_URL)
+    monkeypatch.setattr(models, "engine", engine)
+    monkeypatch.setattr(migrations, "migrate_on_startup", False)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(migrations.metadata.drop_all)
+        with pytest.raises(RuntimeError):
+            await migrations.start()
+
+        await migrations.migrate(engine)
+        await migrations.start()
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_index_audit_migration():
+    # A version 1 database with the indexes it had before the audit.
+    settings = config.Settings(SQLDB_URL="sqlite+aiosqlite:///./test-data/test-migrations.db")
+    engine = models.make_engine(settings, settings.SQLDB_URL)
+    try:
+        await migrations.reset(engine)
+        async with engine.begin() as conn:
+            await conn.execute(migrations.schema_version.delete().where(migrations.schema_version.c.version > 1))
+            await conn.exec_driver_sql("CREATE UNIQUE INDEX ix_users_password ON users (password)")
+            await conn.exec_driver_sql("CREATE UNIQUE INDEX ix_users_name ON users (name)")
+            await conn.exec_driver_sql("DROP INDEX ix_tables_room_id_number")
+
+        assert await migrations.migrate(engine) == [2]
+
+        def indexes(sync_conn):
+            inspector = inspect(sync_conn)
+            return {
+                table: {index["name"] for index in inspector.get_indexes(table)}
+                for table in ("users", "tables")
+            }
+        async with engine.connect() as conn:
+            found = await conn.run_sync(indexes)
+        assert found["users"] == {"ix_users_username", "ix_users_email"}
+        assert "ix_tables_room_id_number" in found["tables"]
+    finally:
+        await engine.dispose()
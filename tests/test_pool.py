@@ -0,0 +1,38 @@
+import pytest
+
+from httpx import AsyncClient
+
+from co_table import config, models
+
+
+@pytest.mark.asyncio
+async def test_pool_timeout_returns_503(
+    client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    metrics = (await client.get("/metrics")).json()["db_pool"]
+    assert metrics["checkouts"] > 0
+    assert sum(metrics["wait_histogram_ms"].values()) == metrics["checkouts"]
+
+    # A one-connection pool with the connection held elsewhere.
+    settings = config.Settings(DB_POOL_SIZE=1, DB_MAX_OVERFLOW=0, DB_POOL_TIMEOUT=0.1, DB_POOL_WARMUP=1)
+    engine, async_session, pool_warmup = models.engine, models.async_session, models.pool_warmup
+    models.init_db(settings)
+    small = models.engine
+    try:
+        await models.warm_up()
+        assert models.get_pool_stats()["checked_out"] == 0
+        held = await small.connect()
+        try:
+            response = await client.get("/rooms/room_id", params={"room_id": 1})
+            assert response.status_code == 503
+            assert response.headers["Retry-After"] == "1"
+            assert models.get_pool_stats()["timeouts"] == metrics["timeouts"] + 1
+            assert models.get_pool_stats()["checked_out"] == 1
+        finally:
+            await held.close()
+        response = await client.get("/rooms/room_id", params={"room_id": 1})
+        assert response.status_code in (200, 404)
+    finally:
+        models.engine, models.async_session, models.pool_warmup = engine, async_session, pool_warmup
+        await small.dispose()
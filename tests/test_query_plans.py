@@ -0,0 +1,166 @@
+import datetime
+import re
+
+import pytest
+
+from httpx import AsyncClient
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlmodel import SQLModel
+
+from co_table import cache, config, counting, deps, hashing, migrations, models, response_cache, security
+from co_table.routers import room
+
+NOW = datetime.datetime.now().replace(minute=0, second=0, microsecond=0)
+
+# (method, url, query params, json body, caller)
+REQUESTS = [
+    ("POST", "/token", None, None, None),
+    ("GET", "/users/get_me", {}, None, "student"),
+    ("GET", "/users/user_id", {"user_id": 2}, None, "student"),
+    ("GET", "/users/get_allUser", {"after": "WzFd"}, None, "student"),
+    ("GET", "/rooms/get_listRoom", {"after": "WzFd", "size": 5}, None, None),
+    ("GET", "/rooms/room_id", {"room_id": 3}, None, None),
+    ("GET", "/rooms/availability", {"faculty": "faculty 1"}, None, None),
+    ("GET", "/rooms/changes", {}, None, None),
+    ("GET", "/rooms/3/next_slots", {"duration_hours": 2}, None, None),
+    ("GET", "/tables/get_listTable", {"after": "WzFd", "size": 5}, None, None),
+    ("GET", "/tables/table_id", {"table_id": 7}, None, None),
+    ("GET", "/tables/changes", {"room_id": 3}, None, None),
+    ("POST", "/tables/create_table", None, {"number": 1, "room_id": 3, "is_available": True}, "admin"),
+    ("GET", "/reservations/get_list_reservation", {"table_id": 7, "size": 5}, None, None),
+    ("GET", "/reservations/get_list_reservation", {"user_id": 2, "size": 5}, None, None),
+    ("GET", "/reservations/get_list_reservation", {"room_id": 3, "size": 5}, None, None),
+    ("GET", "/reservations/get_list_reservation", {"active_only": True, "size": 5}, None, None),
+    ("GET", "/reservations/get_id_reservation", {"reservation_id": 11}, None, None),
+    ("POST", "/reservations/create_reservation", None, {"user_id": 2, "table_id": 8, "duration_hours": 1}, "student"),
+    ("POST", "/reservations/reserve_any", None, {"room_id": 5, "duration_hours": 1}, "student"),
+    ("PUT", "/reservations/update_reservation", {"reservation_id": 12}, {"user_id": 2, "table_id": 9, "duration_hours": 1}, "student"),
+    ("DELETE", "/reservations/delete_reservation", {"reservation_id": 13}, None, "student"),
+    ("GET", "/analytics/rooms/3/occupancy", {}, None, "admin"),
+    ("GET", "/analytics/faculties/faculty 1/heatmap", {}, None, "admin"),
+    ("DELETE", "/tables/delete_table", {"table_id": 190}, None, "admin"),
+    ("DELETE", "/tables/del_table_in_room/5", {}, None, "admin"),
+    ("DELETE", "/rooms/delete_room/6", {}, None, "admin"),
+]
+
+# Scans that are the point of the statement rather than a missing index:
+# (route, table, why).
+EXPECTED_SCANS = [
+    ("GET /users/get_allUser", "users", "page_count counts every row"),
+    ("GET /rooms/get_listRoom", "rooms", "page_count counts every row"),
+    ("GET /tables/get_listTable", "tables", "page_count counts every row"),
+    ("GET /rooms/availability", "reservations",
+     "reads every booking still running, once per AVAILABILITY_CACHE_TTL"),
+]
+
+# A walk over a whole index counts too: dropping the index a filter needs
+# often turns a SEARCH into a SCAN of some other index.
+SCAN = re.compile(r"^SCAN (\w+?)(_\d+)?( |$)")
+
+
+async def seed(engine):
+    password = await hashing.hash_password("password")
+    async with engine.begin() as conn:
+        await conn.execute(insert(models.DBUser), [
+            dict(id=1, username="admin", password=password, name="Admin", email="admin@email.local",
+                 roles="admin", faculty="faculty 1", room_permission=True),
+            dict(id=2, username="student", password=password, name="Student", email="student@email.local",
+                 roles="user", faculty="faculty 1", room_permission=False),
+        ])
+        await conn.execute(insert(models.DBRoom), [
+            dict(id=room_id, name=f"room {room_id}", faculty=f"faculty {room_id % 4}", user_id=1)
+            for room_id in range(1, 21)
+        ])
+        await conn.execute(insert(models.DBTable), [
+            dict(id=table_id, number=table_id % 10, room_id=(table_id - 1) // 10 + 1, is_available=True)
+            for table_id in range(1, 201)
+        ])
+        await conn.execute(insert(models.DBReservation), [
+            dict(
+                id=reservation_id,
+                user_id=reservation_id % 2 + 1,
+                table_id=(reservation_id * 7) % 200 + 1,
+                duration_hours=1,
+                reserved_at=NOW,
+                start_time=NOW + datetime.timedelta(hours=reservation_id % 96 - 48),
+                end_time=NOW + datetime.timedelta(hours=reservation_id % 96 - 47),
+            )
+            for reservation_id in range(1, 2001)
+            # Table 8 is left free for the booking requests.
+            if (reservation_id * 7) % 200 + 1 != 8
+        ])
+        # Own the reservations the student updates and deletes.
+        for reservation_id in (12, 13):
+            await conn.execute(
+                models.DBReservation.__table__.update()
+                .where(models.DBReservation.id == reservation_id)
+                .values(user_id=2, start_time=NOW + datetime.timedelta(days=30),
+                        end_time=NOW + datetime.timedelta(days=30, hours=1)))
+
+
+@pytest.mark.asyncio
+async def test_no_sequential_scans(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    # A database of its own, seeded with a few thousand rows. It is not
+    # ANALYZEd: without statistics SQLite plans as if every table were
+    # large, so a SCAN here means no index could serve the query.
+    settings = config.Settings(SQLDB_URL="sqlite+aiosqlite:///./test-data/test-query-plans.db")
+    engine = models.make_engine(settings, settings.SQLDB_URL)
+    monkeypatch.setattr(models, "engine", engine)
+    monkeypatch.setattr(models, "async_session", async_sessionmaker(
+        engine, class_=models.UnitOfWork, expire_on_commit=False))
+    # Every request has to reach the database to be checked.
+    monkeypatch.setattr(deps, "user_cache", cache.TTLCache(maxsize=0))
+    monkeypatch.setattr(deps, "token_generations", cache.TTLCache(maxsize=0))
+    monkeypatch.setattr(counting, "counters", counting.RowCounter(ttl=0))
+    monkeypatch.setattr(room, "availability_cache", cache.TTLCache(maxsize=0))
+    monkeypatch.setattr(response_cache.responses, "enabled", False)
+
+    try:
+        await migrations.reset(engine)
+        await seed(engine)
+
+        tokens = {
+            name: security.create_access_token(data=security.user_claims(user))
+            for name, user in [
+                ("admin", models.DBUser(id=1, roles="admin", faculty="faculty 1", room_permission=True)),
+                ("student", models.DBUser(id=2, roles="user", faculty="faculty 1", room_permission=False)),
+            ]
+        }
+
+        statements: dict[str, list[tuple[str, tuple]]] = {}
+        current = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+                statements.setdefault(current[-1], []).append((statement, parameters))
+
+        event.listen(engine.sync_engine, "before_cursor_execute", capture)
+        for method, url, params, body, caller in REQUESTS:
+            current.append(f"{method} {url} {params or ''}")
+            headers = {"Authorization": f"Bearer {tokens[caller]}"} if caller else {}
+            if url == "/token":
+                response = await client.post(url, data={"username": "student", "password": "password"})
+            else:
+                response = await client.request(method, url, params=params, json=body, headers=headers)
+            assert response.status_code < 400, (current[-1], response.status_code, response.text)
+        event.remove(engine.sync_engine, "before_cursor_execute", capture)
+
+        scans = []
+        async with engine.connect() as conn:
+            for route, route_statements in statements.items():
+                for statement, parameters in route_statements:
+                    result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+                    plan = [row.detail for row in result]
+                    for detail in plan:
+                        match = SCAN.match(detail)
+                        if match is None or match.group(1) not in SQLModel.metadata.tables:
+                            continue
+                        if any(route.startswith(expected) and match.group(1) == table
+                               for expected, table, _ in EXPECTED_SCANS):
+                            continue
+                        scans.append(f"{route}\n  {statement}\n  {detail}")
+        assert statements
+        assert not scans, "\n\n".join(scans)
+    finally:
+        await engine.dispose()
@@ -0,0 +1,115 @@
+import pytest
+
+from httpx import AsyncClient
+from sqlalchemy import insert
+from sqlmodel import SQLModel
+
+from co_table import config, models, replicas
+
+
+@pytest.mark.asyncio
+async def test_reads_routed_to_replica(
+    client: AsyncClient,
+    token_user2: models.Token,
+):
+    # The primary is the test database; the replica is a second file that
+    # holds a room the primary does not have.
+    settings = config.Settings(
+        SQLDB_READ_URLS="sqlite+aiosqlite:///./test-data/test-replica.db,"
+                        "sqlite+aiosqlite:///./test-data/missing/test-replica.db",
+        READ_YOUR_WRITES_SECONDS=60,
+    )
+    router = replicas.router
+    replicas.init_replicas(settings)
+    replica, missing = replicas.router.replicas
+    try:
+        async with replica.engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.drop_all)
+            await conn.run_sync(SQLModel.metadata.create_all)
+            await conn.execute(insert(models.DBUser).values(
+                id=token_user2.user_id, username="replica", password="replica", name="replica",
+                email="replica@email.local", roles="admin", room_permission=True))
+            await conn.execute(insert(models.DBRoom).values(
+                id=9001, name="replica only", faculty="replica", user_id=token_user2.user_id))
+
+        await replicas.router.check_all()
+        assert replica.healthy
+        assert not missing.healthy
+
+        for _ in range(2):
+            response = await client.get("/rooms/room_id", params={"room_id": 9001})
+            assert response.status_code == 200
+            assert response.json()["name"] == "replica only"
+        assert replica.reads == 2
+        assert missing.reads == 0
+
+        response = await client.get("/rooms/get_listRoom", params={"size": 100})
+        assert response.status_code == 200
+        assert 9001 in [room["id"] for room in response.json()["rooms"]]
+
+        # After a write its caller reads from the primary, which has the
+        # new room and not the replica's.
+        headers = {"Authorization": f"Bearer {token_user2.access_token}"}
+        response = await client.post(
+            "/rooms/create_room", headers=headers,
+            json={"name": "written", "faculty": "replica", "user_id": token_user2.user_id})
+        assert response.status_code == 200, response.text
+        created = response.json()["id"]
+
+        response = await client.get("/rooms/room_id", params={"room_id": created}, headers=headers)
+        assert response.status_code == 200
+        response = await client.get("/rooms/room_id", params={"room_id": 9001}, headers=headers)
+        assert response.status_code == 404
+        response = await client.get("/rooms/get_listRoom", params={"size": 100}, headers=headers)
+        assert created in [room["id"] for room in response.json()["rooms"]]
+        assert replicas.router.sticky_reads == 3
+
+        # Other callers keep reading from the replica.
+        response = await client.get("/rooms/room_id", params={"room_id": 9001})
+        assert response.status_code == 200
+
+        # With no healthy replica everything reads from the primary.
+        replicas.router.failed(replica)
+        response = await client.get("/rooms/room_id", params={"room_id": 9001})
+        assert response.status_code == 404
+        assert replicas.router.primary_reads == 1
+
+        await replicas.router.check_all()
+        assert replica.healthy
+        response = await client.get("/rooms/room_id", params={"room_id": 9001})
+        assert response.status_code == 200
+
+        metrics = (await client.get("/metrics")).json()["read_replicas"]
+        assert [stats["healthy"] for stats in metrics["replicas"]] == [True, False]
+    finally:
+        await replicas.router.stop()
+        replicas.router = router
+
+
+@pytest.mark.asyncio
+async def test_round_robin_between_replicas():
+    settings = config.Settings(
+        SQLDB_READ_URLS="sqlite+aiosqlite:///./test-data/test-replica.db,"
+                        "sqlite+aiosqlite:///./test-data/test-replica-2.db",
+    )
+    router = replicas.ReadRouter(
+        [replicas.Replica(models.make_engine(settings, url)) for url in settings.SQLDB_READ_URLS.split(",")])
+
+    class Client:
+        host = "127.0.0.1"
+
+    class Request:
+        headers = {}
+        client = Client()
+
+    try:
+        picked = [router.pick(Request()) for _ in range(4)]
+        assert picked == router.replicas * 2
+
+        router.failed(router.replicas[0])
+        assert [router.pick(Request()) for _ in range(2)] == [router.replicas[1]] * 2
+
+        router.wrote(Request())
+        assert router.pick(Request()) is None
+    finally:
+        await router.stop()
@@ -331,4 +331,384 @@
 # #     response = await client.delete("/reservations/1")
 # #     assert response.status_code == 401  
 # #     assert "detail" in response.json()
-# #     assert response.json()["detail"] == "Not authenticated"
\ No newline at end of file
+# #     assert response.json()["detail"] == "Not authenticated"
+
+import asyncio
+import datetime
+import pytest
+
+from httpx import AsyncClient
+
+from sqlalchemy import text
+from sqlmodel import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from co_table import conflicts, idempotency, models
+from co_table.models import Token
+from co_table.routers.reservation import filter_reservations
+
+
+async def create_room_with_tables(client: AsyncClient, token: Token, number: int = 1) -> list[int]:
+    header = {"Authorization": f"Bearer {token.access_token}"}
+    room_payload = {
+        "name": "Reservation Room",
+        "user_id": token.user_id,
+        "faculty": "ไม่มีคณะ"
+    }
+    room_response = await client.post("/rooms/create_room", json=room_payload, headers=header)
+    assert room_response.status_code == 200
+    room_id = room_response.json()["id"]
+
+    table_ids = []
+    for _ in range(number):
+        payload = {"number": 1, "room_id": room_id, "is_available": True}
+        table_response = await client.post("/tables/create_table", json=payload, headers=header)
+        assert table_response.status_code == 200
+        table_ids.append(table_response.json()["id"])
+    return table_ids
+
+
+@pytest.mark.asyncio
+async def test_create_reservation(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+):
+    table_ids = await create_room_with_tables(client, token_user2)
+    payload = {"user_id": token_user1.user_id, "table_id": table_ids[0], "duration_hours": 2}
+    response = await client.post(
+        "/reservations/create_reservation",
+        json=payload,
+        headers={"Authorization": f"Bearer {token_user1.access_token}"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["table_id"] == table_ids[0]
+    assert data["start_time"] is not None
+    assert data["end_time"] is not None
+
+
+@pytest.mark.asyncio
+async def test_create_reservation_overlap(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+):
+    table_ids = await create_room_with_tables(client, token_user2, number=2)
+    header = {"Authorization": f"Bearer {token_user1.access_token}"}
+    payload = {"user_id": token_user1.user_id, "table_id": table_ids[0], "duration_hours": 2}
+
+    first = await client.post("/reservations/create_reservation", json=payload, headers=header)
+    assert first.status_code == 200
+
+    second = await client.post("/reservations/create_reservation", json=payload, headers=header)
+    assert second.status_code == 409
+    assert second.json()["detail"] == "This table is already reserved for that time"
+
+    payload["table_id"] = table_ids[1]
+    other_table = await client.post("/reservations/create_reservation", json=payload, headers=header)
+    assert other_table.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_create_reservation_table_not_found(
+    client: AsyncClient,
+    token_user1: Token,
+):
+    payload = {"user_id": token_user1.user_id, "table_id": 9999, "duration_hours": 2}
+    response = await client.post(
+        "/reservations/create_reservation",
+        json=payload,
+        headers={"Authorization": f"Bearer {token_user1.access_token}"}
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Table not found"
+
+
+@pytest.mark.asyncio
+async def test_get_reservations_cursor(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+):
+    table_ids = await create_room_with_tables(client, token_user2, number=2)
+    header = {"Authorization": f"Bearer {token_user1.access_token}"}
+    for table_id in table_ids:
+        payload = {"user_id": token_user1.user_id, "table_id": table_id, "duration_hours": 1}
+        response = await client.post("/reservations/create_reservation", json=payload, headers=header)
+        assert response.status_code == 200
+
+    response = await client.get("/reservations/get_list_reservation", params={"size": 200})
+    all_reservations = response.json()["reservations"]
+
+    seen = []
+    params = {"size": 1}
+    while True:
+        data = (await client.get("/reservations/get_list_reservation", params=params)).json()
+        seen.extend(data["reservations"])
+        if data["next_cursor"] is None:
+            break
+        params = {"size": 1, "after": data["next_cursor"]}
+    assert seen == all_reservations
+    assert [r["start_time"] for r in seen] == sorted(r["start_time"] for r in seen)
+
+
+@pytest.mark.asyncio
+async def test_update_and_delete_reservation(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+):
+    table_ids = await create_room_with_tables(client, token_user2)
+    header = {"Authorization": f"Bearer {token_user1.access_token}"}
+    payload = {"user_id": token_user1.user_id, "table_id": table_ids[0], "duration_hours": 1}
+    created = (await client.post("/reservations/create_reservation", json=payload, headers=header)).json()
+
+    payload["duration_hours"] = 3
+    response = await client.put(
+        f"/reservations/update_reservation?reservation_id={created['id']}", json=payload, headers=header)
+    assert response.status_code == 200
+    updated = response.json()
+    assert updated["duration_hours"] == 3
+    start_time = datetime.datetime.fromisoformat(updated["start_time"])
+    end_time = datetime.datetime.fromisoformat(updated["end_time"])
+    assert start_time == datetime.datetime.fromisoformat(created["start_time"])
+    assert abs((end_time - start_time) - datetime.timedelta(hours=3)) < datetime.timedelta(milliseconds=1)
+
+    response = await client.delete(
+        f"/reservations/delete_reservation?reservation_id={created['id']}", headers=header)
+    assert response.status_code == 200
+    assert response.json() == {"message": "Reservation deleted"}
+
+    response = await client.delete(
+        f"/reservations/delete_reservation?reservation_id={created['id']}", headers=header)
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_update_reservation_not_owner(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+):
+    table_ids = await create_room_with_tables(client, token_user2)
+    payload = {"user_id": token_user2.user_id, "table_id": table_ids[0], "duration_hours": 1}
+    admin_header = {"Authorization": f"Bearer {token_user2.access_token}"}
+    created = (await client.post(
+        "/reservations/create_reservation", json=payload, headers=admin_header)).json()
+
+    response = await client.put(
+        f"/reservations/update_reservation?reservation_id={created['id']}",
+        json=payload,
+        headers={"Authorization": f"Bearer {token_user1.access_token}"},
+    )
+    assert response.status_code == 403
+    assert response.json()["detail"] == "You are not allowed to update this reservation"
+
+
+@pytest.mark.asyncio
+async def test_update_reservation_table_not_found(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+):
+    table_ids = await create_room_with_tables(client, token_user2)
+    header = {"Authorization": f"Bearer {token_user1.access_token}"}
+    payload = {"user_id": token_user1.user_id, "table_id": table_ids[0], "duration_hours": 1}
+    created = (await client.post("/reservations/create_reservation", json=payload, headers=header)).json()
+
+    payload["table_id"] = 9999
+    response = await client.put(
+        f"/reservations/update_reservation?reservation_id={created['id']}", json=payload, headers=header)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Table not found"
+
+
+@pytest.mark.asyncio
+async def test_reserve_any_spreads_over_tables(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+):
+    table_ids = await create_room_with_tables(client, token_user2, number=2)
+    room_id = (await client.get("/tables/table_id", params={"table_id": table_ids[0]})).json()["room_id"]
+    payload = {"room_id": room_id, "duration_hours": 1}
+    header = {"Authorization": f"Bearer {token_user1.access_token}"}
+
+    responses = await asyncio.gather(*[
+        client.post("/reservations/reserve_any", json=payload, headers=header)
+        for _ in range(3)
+    ])
+    reserved = [response.json()["table_id"] for response in responses if response.status_code == 200]
+    assert sorted(reserved) == sorted(table_ids)
+    rejected = [response for response in responses if response.status_code != 200]
+    assert len(rejected) == 1
+    assert rejected[0].status_code == 409
+    assert rejected[0].json()["detail"] == "No free table in this room"
+
+
+@pytest.mark.asyncio
+async def test_reserve_any_retries_after_conflict(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    table_ids = await create_room_with_tables(client, token_user2, number=2)
+    room_id = (await client.get("/tables/table_id", params={"table_id": table_ids[0]})).json()["room_id"]
+    header = {"Authorization": f"Bearer {token_user1.access_token}"}
+    payload = {"user_id": token_user1.user_id, "table_id": table_ids[0], "duration_hours": 1}
+    assert (await client.post("/reservations/create_reservation", json=payload, headers=header)).status_code == 200
+
+    # The first pick returns the booked table, as if a specific-table booking
+    # had taken it between the pick and the insert.
+    find_free_table = conflicts.find_free_table
+    picks = []
+
+    async def stale_first_pick(session, room_id, start_time, end_time):
+        picks.append(room_id)
+        if len(picks) == 1:
+            return await session.get(models.DBTable, table_ids[0])
+        return await find_free_table(session, room_id, start_time, end_time)
+
+    monkeypatch.setattr(conflicts, "find_free_table", stale_first_pick)
+    response = await client.post(
+        "/reservations/reserve_any", json={"room_id": room_id, "duration_hours": 1}, headers=header)
+    assert response.status_code == 200
+    assert response.json()["table_id"] == table_ids[1]
+    assert response.json()["user_id"] == token_user1.user_id
+    assert len(picks) == 2
+
+
+@pytest.mark.asyncio
+async def test_reserve_any_room_not_found(
+    client: AsyncClient,
+    token_user1: Token,
+):
+    payload = {"room_id": 9999, "duration_hours": 1}
+    response = await client.post(
+        "/reservations/reserve_any",
+        json=payload,
+        headers={"Authorization": f"Bearer {token_user1.access_token}"}
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Room not found"
+
+
+@pytest.mark.asyncio
+async def test_get_reservations_filters(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+):
+    table_ids = await create_room_with_tables(client, token_user2, number=2)
+    room_id = (await client.get("/tables/table_id", params={"table_id": table_ids[0]})).json()["room_id"]
+    ids = []
+    for token, table_id in [(token_user1, table_ids[0]), (token_user2, table_ids[1])]:
+        payload = {"user_id": token.user_id, "table_id": table_id, "duration_hours": 1}
+        response = await client.post(
+            "/reservations/create_reservation",
+            json=payload,
+            headers={"Authorization": f"Bearer {token.access_token}"}
+        )
+        ids.append(response.json()["id"])
+
+    async def listed(**params) -> list[int]:
+        response = await client.get("/reservations/get_list_reservation", params=dict(size=200, **params))
+        assert response.status_code == 200
+        return [reservation["id"] for reservation in response.json()["reservations"]]
+
+    assert await listed(table_id=table_ids[0]) == ids[:1]
+    assert await listed(room_id=room_id) == ids
+    assert await listed(room_id=room_id, user_id=token_user2.user_id) == ids[1:]
+    assert await listed(room_id=room_id, active_only=True) == ids
+
+    now = datetime.datetime.now()
+    assert await listed(room_id=room_id, **{"from": (now + datetime.timedelta(minutes=30)).isoformat()}) == ids
+    assert await listed(room_id=room_id, **{"from": (now + datetime.timedelta(hours=2)).isoformat()}) == []
+    assert await listed(room_id=room_id, to=(now - datetime.timedelta(hours=1)).isoformat()) == []
+
+    response = await client.get("/reservations/get_list_reservation", params={"room_id": room_id, "size": 1})
+    assert response.json()["page_count"] == 2
+
+    response = await client.get("/reservations/get_list_reservation", params={
+        "from": now.isoformat(), "to": (now - datetime.timedelta(hours=1)).isoformat()})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_reservation_filters_use_indexes(session: AsyncSession):
+    if session.bind.dialect.name != "postgresql":
+        pytest.skip("EXPLAIN plans are only checked on Postgres")
+    # Tiny test tables are cheaper to scan; the planner is made to show
+    # which index it would use on a real one.
+    await session.execute(text("SET LOCAL enable_seqscan = off"))
+    base = select(models.DBReservation).order_by(models.DBReservation.start_time)
+    for statement, index in [
+        (filter_reservations(base, table_id=1), "ix_reservations_table_id_start_time"),
+        (filter_reservations(base, user_id=1), "ix_reservations_user_id_start_time"),
+    ]:
+        sql = statement.compile(session.bind, compile_kwargs={"literal_binds": True})
+        plan = "\n".join((await session.execute(text(f"EXPLAIN {sql}"))).scalars().all())
+        assert index in plan, plan
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["memory", "database"])
+async def test_create_reservation_idempotency_key(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+    monkeypatch: pytest.MonkeyPatch,
+    backend: str,
+):
+    if backend == "database":
+        monkeypatch.setattr(idempotency, "store", idempotency.IdempotencyStore(idempotency.DatabaseBackend(ttl=60)))
+    table_ids = await create_room_with_tables(client, token_user2, number=2)
+    header = {"Authorization": f"Bearer {token_user1.access_token}", "Idempotency-Key": f"booking-{backend}"}
+    payload = {"user_id": token_user1.user_id, "table_id": table_ids[0], "duration_hours": 1}
+
+    # Concurrent duplicates wait for the first one rather than racing it
+    # into a 409.
+    responses = await asyncio.gather(*[
+        client.post("/reservations/create_reservation", json=payload, headers=header) for _ in range(5)
+    ])
+    assert [response.status_code for response in responses] == [200] * 5
+    assert len({response.json()["id"] for response in responses}) == 1
+    assert [response.headers.get("Idempotent-Replayed") for response in responses].count("true") == 4
+
+    response = await client.post("/reservations/create_reservation", json=payload, headers=header)
+    assert response.json() == responses[0].json()
+
+    response = await client.get("/reservations/get_list_reservation", params={"table_id": table_ids[0]})
+    assert len(response.json()["reservations"]) == 1
+
+    payload["table_id"] = table_ids[1]
+    response = await client.post("/reservations/create_reservation", json=payload, headers=header)
+    assert response.status_code == 422
+
+    # A failed request is not kept; the retry runs again.
+    header["Idempotency-Key"] = f"missing-table-{backend}"
+    payload["table_id"] = 9999
+    for _ in range(2):
+        response = await client.post("/reservations/create_reservation", json=payload, headers=header)
+        assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_idempotency_database_backend_across_workers():
+    # Two stores stand in for two workers sharing the database.
+    workers = [idempotency.IdempotencyStore(idempotency.DatabaseBackend(ttl=60)) for _ in range(2)]
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return {"id": len(calls)}
+
+    results = await asyncio.gather(*[
+        worker.run("worker-test", "fingerprint", call) for worker in workers
+    ])
+    assert len(calls) == 1
+    assert sorted(replayed for _, replayed in results) == [False, True]
+    assert all(response == {"id": 1} for response, _ in results)
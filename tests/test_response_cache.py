@@ -0,0 +1,62 @@
+import pytest
+
+from httpx import AsyncClient
+
+from co_table import pagination, response_cache
+from co_table.models import Token
+
+
+@pytest.mark.asyncio
+async def test_list_cache_follows_writes(
+    client: AsyncClient,
+    token_user2: Token,
+):
+    header = {"Authorization": f"Bearer {token_user2.access_token}"}
+    room_payload = {"name": "Cached Room", "user_id": token_user2.user_id, "faculty": "Test Faculty"}
+    room_id = (await client.post("/rooms/create_room", json=room_payload, headers=header)).json()["id"]
+    payload = {"number": 1, "room_id": room_id, "is_available": True}
+    table_id = (await client.post("/tables/create_table", json=payload, headers=header)).json()["id"]
+
+    params = {"size": 1, "after": pagination.encode_cursor([table_id - 1])}
+    first = await client.get("/tables/get_listTable", params=params)
+    hits = response_cache.get_stats()["hits"]
+    second = await client.get("/tables/get_listTable", params=params)
+    assert response_cache.get_stats()["hits"] == hits + 1
+    assert second.content == first.content
+    assert first.json()["tables"][0]["is_available"] is True
+
+    await client.put(f"/tables/is_available/{table_id}", headers=header)
+    response = await client.get("/tables/get_listTable", params=params)
+    assert response.json()["tables"][0]["is_available"] is False
+
+    rooms = (await client.get("/rooms/get_listRoom", params={"size": 200})).json()["rooms"]
+    await client.put("/rooms/status_room", params={"room_id": room_id}, headers=header)
+    updated = (await client.get("/rooms/get_listRoom", params={"size": 200})).json()["rooms"]
+    assert [room["status"] for room in updated if room["id"] == room_id] == [False]
+    assert len(updated) == len(rooms)
+
+    await client.delete(f"/rooms/delete_room/{room_id}", headers=header)
+    response = await client.get("/tables/get_listTable", params=params)
+    assert all(table["id"] != table_id for table in response.json()["tables"])
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_byte_budget():
+    backend = response_cache.MemoryBackend(max_bytes=10)
+    await backend.set("a", b"1234", ttl=60)
+    await backend.set("b", b"1234", ttl=60)
+    assert await backend.get("a") == b"1234"
+    # b is now the least recently used and goes first.
+    await backend.set("c", b"1234", ttl=60)
+    assert await backend.get("b") is None
+    assert await backend.get("a") == b"1234"
+    assert backend.size == 8
+
+    await backend.set("too big", b"x" * 11, ttl=60)
+    assert await backend.get("too big") is None
+    await backend.set("expired", b"1", ttl=0)
+    assert await backend.get("expired") is None
+    assert backend.size == 8
+
+    assert await backend.version("rooms") == 0
+    assert await backend.bump("rooms") == 1
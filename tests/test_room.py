@@ -1,3 +1,5 @@
+import datetime
+
 from httpx import AsyncClient
 
 import pytest
@@ -7,7 +9,7 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 
 from co_table.models import Token
 from co_table.models.dbmodel import DBRoom
-from co_table import models 
+from co_table import models, slots, sync
 
 @pytest.mark.asyncio
 async def test_create_room_admin(
@@ -286,3 +288,279 @@ async def test_no_permission_delete_room(
     assert response.json() == {"detail": "Not authenticated"}
 
 
+
+
+@pytest.mark.asyncio
+async def test_get_rooms_cursor(
+    client: AsyncClient,
+    token_user2: Token,
+):
+    for i in range(3):
+        room_payload = {"name": f"Cursor Room {i}", "user_id": token_user2.user_id, "faculty": "Test Faculty"}
+        response = await client.post(
+            "/rooms/create_room",
+            json=room_payload,
+            headers={"Authorization": f"Bearer {token_user2.access_token}"}
+        )
+        assert response.status_code == 200
+
+    response = await client.get("/rooms/get_listRoom", params={"size": 200})
+    all_ids = [room["id"] for room in response.json()["rooms"]]
+
+    seen = []
+    params = {"size": 2}
+    while True:
+        data = (await client.get("/rooms/get_listRoom", params=params)).json()
+        assert data["size_per_page"] == 2
+        seen.extend(room["id"] for room in data["rooms"])
+        if data["next_cursor"] is None:
+            break
+        params = {"size": 2, "after": data["next_cursor"]}
+    assert seen == all_ids
+
+    response = await client.get("/rooms/get_listRoom", params={"size": 2, "before": data["prev_cursor"]})
+    assert [room["id"] for room in response.json()["rooms"]] == seen[-len(data["rooms"]) - 2:-len(data["rooms"])]
+
+
+@pytest.mark.asyncio
+async def test_get_rooms_invalid_cursor(
+    client: AsyncClient,
+):
+    response = await client.get("/rooms/get_listRoom", params={"after": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+@pytest.mark.asyncio
+async def test_status_room(
+    client: AsyncClient,
+    token_user2: Token,
+):
+    header = {"Authorization": f"Bearer {token_user2.access_token}"}
+    room_payload = {"name": "Status Room", "user_id": token_user2.user_id, "faculty": "Test Faculty"}
+    room_id = (await client.post("/rooms/create_room", json=room_payload, headers=header)).json()["id"]
+
+    response = await client.put(f"/rooms/status_room?room_id={room_id}", headers=header)
+    assert response.status_code == 200
+    assert response.json() == {"status": False}
+
+    response = await client.put(f"/rooms/status_room?room_id={room_id}", headers=header)
+    assert response.json() == {"status": True}
+
+
+@pytest.mark.asyncio
+async def test_update_room_not_found(
+    client: AsyncClient,
+    token_user2: Token,
+):
+    update_payload = {
+        "name": "Missing Room",
+        "faculty": "Test Faculty",
+        "user_id": token_user2.user_id,
+        "status": True
+    }
+    response = await client.put(
+        "/rooms/update_room?room_id=9999",
+        json=update_payload,
+        headers={"Authorization": f"Bearer {token_user2.access_token}"}
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Room not found"
+
+
+@pytest.mark.asyncio
+async def test_room_availability(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+):
+    header = {"Authorization": f"Bearer {token_user2.access_token}"}
+    faculty = "ไม่มีคณะ"
+    room_payload = {"name": "Kiosk Room", "user_id": token_user2.user_id, "faculty": faculty}
+    room_id = (await client.post("/rooms/create_room", json=room_payload, headers=header)).json()["id"]
+    empty_room_payload = {"name": "Empty Kiosk Room", "user_id": token_user2.user_id, "faculty": faculty}
+    empty_room_id = (await client.post("/rooms/create_room", json=empty_room_payload, headers=header)).json()["id"]
+
+    table_ids = []
+    for _ in range(2):
+        response = await client.post(
+            "/tables/create_table",
+            json={"number": 1, "room_id": room_id, "is_available": True},
+            headers=header
+        )
+        table_ids.append(response.json()["id"])
+    response = await client.post(
+        "/reservations/create_reservation",
+        json={"user_id": token_user1.user_id, "table_id": table_ids[0], "duration_hours": 2},
+        headers={"Authorization": f"Bearer {token_user1.access_token}"}
+    )
+    assert response.status_code == 200
+
+    response = await client.get("/rooms/availability", params={"faculty": faculty})
+    assert response.status_code == 200
+    rooms = {room["room_id"]: room for room in response.json()["rooms"]}
+    assert {room_id, empty_room_id} <= set(rooms)
+    assert rooms[room_id]["total_tables"] == 2
+    assert rooms[room_id]["free_tables"] == 1
+    assert rooms[room_id]["next_free_time"] is not None
+    assert rooms[empty_room_id]["total_tables"] == 0
+    assert rooms[empty_room_id]["next_free_time"] is None
+
+
+@pytest.mark.asyncio
+async def test_room_availability_back_to_back(
+    client: AsyncClient,
+    session: AsyncSession,
+    token_user1: Token,
+    token_user2: Token,
+):
+    header = {"Authorization": f"Bearer {token_user2.access_token}"}
+    faculty = "Back To Back Faculty"
+    room_payload = {"name": "Busy Room", "user_id": token_user2.user_id, "faculty": faculty}
+    room_id = (await client.post("/rooms/create_room", json=room_payload, headers=header)).json()["id"]
+    closed_payload = {"name": "Closed Room", "user_id": token_user2.user_id, "faculty": faculty}
+    closed_id = (await client.post("/rooms/create_room", json=closed_payload, headers=header)).json()["id"]
+    table_ids = []
+    for target in (room_id, closed_id):
+        response = await client.post(
+            "/tables/create_table",
+            json={"number": 1, "room_id": target, "is_available": True},
+            headers=header
+        )
+        table_ids.append(response.json()["id"])
+    table_id = table_ids[0]
+    await client.put(f"/rooms/status_room?room_id={closed_id}", headers=header)
+
+    now = datetime.datetime.now()
+    first_end = now + datetime.timedelta(hours=1)
+    second_end = first_end + datetime.timedelta(hours=2)
+    session.add(models.DBReservation(
+        user_id=token_user1.user_id, table_id=table_id, duration_hours=1,
+        start_time=now - datetime.timedelta(minutes=1), end_time=first_end))
+    session.add(models.DBReservation(
+        user_id=token_user1.user_id, table_id=table_id, duration_hours=2,
+        start_time=first_end, end_time=second_end))
+    await session.commit()
+
+    response = await client.get("/rooms/availability", params={"faculty": faculty})
+    rooms = {room["room_id"]: room for room in response.json()["rooms"]}
+    assert rooms[room_id]["free_tables"] == 0
+    assert datetime.datetime.fromisoformat(rooms[room_id]["next_free_time"]) == second_end
+    assert rooms[closed_id]["total_tables"] == 1
+    assert rooms[closed_id]["free_tables"] == 0
+    assert rooms[closed_id]["next_free_time"] is None
+
+
+@pytest.mark.asyncio
+async def test_room_changes(
+    client: AsyncClient,
+    token_user2: Token,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(sync, "SETTLE_TIME", datetime.timedelta(0))
+    header = {"Authorization": f"Bearer {token_user2.access_token}"}
+
+    params = {"size": 200}
+    while True:
+        data = (await client.get("/rooms/changes", params=params)).json()
+        params["since"] = data["watermark"]
+        if not data["has_more"]:
+            break
+
+    room_payload = {"name": "Changes Room", "user_id": token_user2.user_id, "faculty": "Test Faculty"}
+    room_id = (await client.post("/rooms/create_room", json=room_payload, headers=header)).json()["id"]
+    table_payload = {"number": 1, "room_id": room_id, "is_available": True}
+    table_id = (await client.post("/tables/create_table", json=table_payload, headers=header)).json()["id"]
+
+    data = (await client.get("/rooms/changes", params=params)).json()
+    assert [room["id"] for room in data["rooms"]] == [room_id]
+    assert data["deleted"] == []
+    params["since"] = data["watermark"]
+
+    data = (await client.get("/rooms/changes", params=params)).json()
+    assert data == dict(rooms=[], deleted=[], watermark=params["since"], has_more=False)
+
+    await client.put("/rooms/status_room", params={"room_id": room_id}, headers=header)
+    data = (await client.get("/rooms/changes", params=params)).json()
+    assert [(room["id"], room["status"]) for room in data["rooms"]] == [(room_id, False)]
+    params["since"] = data["watermark"]
+
+    await client.delete(f"/rooms/delete_room/{room_id}", headers=header)
+    data = (await client.get("/rooms/changes", params=params)).json()
+    assert data["rooms"] == []
+    assert data["deleted"] == [room_id]
+
+    data = (await client.get("/tables/changes", params={"room_id": room_id})).json()
+    assert data["tables"] == []
+    assert data["deleted"] == [table_id]
+
+
+@pytest.mark.asyncio
+async def test_room_next_slots(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+):
+    header = {"Authorization": f"Bearer {token_user2.access_token}"}
+    room_payload = {"name": "Slots Room", "user_id": token_user2.user_id, "faculty": "ไม่มีคณะ"}
+    room_id = (await client.post("/rooms/create_room", json=room_payload, headers=header)).json()["id"]
+    payload = {"number": 2, "room_id": room_id, "is_available": True}
+    table_ids = [table["id"] for table in (await client.post("/tables/bulk_create", json=payload, headers=header)).json()]
+
+    response = await client.post(
+        "/reservations/create_reservation",
+        json={"user_id": token_user1.user_id, "table_id": table_ids[0], "duration_hours": 2},
+        headers={"Authorization": f"Bearer {token_user1.access_token}"},
+    )
+    booked_until = datetime.datetime.fromisoformat(response.json()["end_time"])
+
+    response = await client.get(f"/rooms/{room_id}/next_slots", params={"duration_hours": 3})
+    assert response.status_code == 200
+    data = response.json()
+    generated_at = datetime.datetime.fromisoformat(data["generated_at"])
+    first, second = data["slots"]
+    assert (first["table_id"], first["number"]) == (table_ids[1], 2)
+    assert datetime.datetime.fromisoformat(first["start_time"]) == generated_at
+    assert datetime.datetime.fromisoformat(first["end_time"]) == generated_at + datetime.timedelta(hours=3)
+    assert second["table_id"] == table_ids[0]
+    start_time = datetime.datetime.fromisoformat(second["start_time"])
+    assert booked_until <= start_time < booked_until + datetime.timedelta(minutes=15)
+    assert start_time.minute % 15 == 0 and start_time.second == 0
+
+    response = await client.get(f"/rooms/{room_id}/next_slots", params={"duration_hours": 3, "limit": 1})
+    assert [slot["table_id"] for slot in response.json()["slots"]] == [table_ids[1]]
+
+    response = await client.get(f"/rooms/{room_id}/next_slots", params={"duration_hours": 24 * 8, "horizon_days": 7})
+    assert response.json()["slots"] == []
+
+    await client.put("/rooms/status_room", params={"room_id": room_id}, headers=header)
+    response = await client.get(f"/rooms/{room_id}/next_slots", params={"duration_hours": 1})
+    assert response.json()["status"] is False
+    assert response.json()["slots"] == []
+
+    response = await client.get("/rooms/9999/next_slots", params={"duration_hours": 1})
+    assert response.status_code == 404
+
+
+def test_slot_grid():
+    now = datetime.datetime(2024, 1, 1, 9, 5)
+    grid = slots.SlotGrid(now, datetime.timedelta(hours=6), [1, 2, 3])
+    assert grid.start == datetime.datetime(2024, 1, 1, 9, 0)
+    assert grid.slots == 25
+
+    grid.mark(1, now, now + datetime.timedelta(hours=1))
+    # Back to back with a gap too short for an hour.
+    grid.mark(2, now - datetime.timedelta(hours=1), datetime.datetime(2024, 1, 1, 10, 0))
+    grid.mark(2, datetime.datetime(2024, 1, 1, 10, 45), datetime.datetime(2024, 1, 1, 12, 10))
+    grid.mark(3, now, now + datetime.timedelta(hours=6))
+
+    hour = datetime.timedelta(hours=1)
+    assert grid.earliest(1, hour).start_time == datetime.datetime(2024, 1, 1, 10, 15)
+    assert grid.earliest(2, hour).start_time == datetime.datetime(2024, 1, 1, 12, 15)
+    assert grid.earliest(3, hour) is None
+    assert [slot.table_id for slot in grid.next_slots(hour, 5)] == [1, 2]
+    # Ends inside the horizon: 15:05 at the latest.
+    assert grid.earliest(2, 3 * hour) is None
+    assert grid.earliest(1, 4 * hour).end_time == datetime.datetime(2024, 1, 1, 14, 15)
+
+    assert slots.free_runs(0b1110111, 3) == 0b0010001
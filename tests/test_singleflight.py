@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+
+from fastapi import HTTPException
+from httpx import AsyncClient
+
+from co_table import singleflight
+
+
+@pytest.mark.asyncio
+async def test_list_requests_coalesce(client: AsyncClient):
+    before = singleflight.get_stats()["routes"].get("get_listRoom", {})
+    responses = await asyncio.gather(*[
+        client.get("/rooms/get_listRoom", params={"page": 1, "size": 10}) for _ in range(20)
+    ])
+    after = singleflight.get_stats()["routes"]["get_listRoom"]
+
+    assert all(response.status_code == 200 for response in responses)
+    assert len({response.content for response in responses}) == 1
+    assert after["leaders"] - before.get("leaders", 0) + after["coalesced"] - before.get("coalesced", 0) == 20
+    assert after["coalesced"] > before.get("coalesced", 0)
+
+    # Different query, different flight.
+    response = await client.get("/rooms/get_listRoom", params={"page": 1, "size": 1})
+    assert len(response.json()["rooms"]) <= 1
+
+    response = await client.get("/tables/get_listTable", params={"after": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_leader_failure_is_shared():
+    flights = singleflight.SingleFlight()
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    results = await asyncio.gather(*[flights.do("route", ("key",), fail) for _ in range(3)], return_exceptions=True)
+    assert len(calls) == 1
+    assert all(isinstance(result, HTTPException) and result.status_code == 400 for result in results)
+    assert flights.get_stats()["routes"]["route"] == dict(leaders=1, coalesced=2, leader_failed=1)
+
+    # Nothing is kept once the flight has landed.
+    async def succeed():
+        calls.append(1)
+        return {"ok": True}
+
+    response = await flights.do("route", ("key",), succeed)
+    assert response.body == b'{"ok":true}'
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_hands_over():
+    flights = singleflight.SingleFlight()
+    started = asyncio.Event()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        started.set()
+        await asyncio.sleep(0.05)
+        return {"call": len(calls)}
+
+    leader = asyncio.create_task(flights.do("route", ("key",), slow))
+    await started.wait()
+    follower = asyncio.create_task(flights.do("route", ("key",), slow))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    response = await follower
+    assert response.body == b'{"call":2}'
+    assert flights.get_stats()["routes"]["route"]["leader_cancelled"] == 1
+    with pytest.raises(asyncio.CancelledError):
+        await leader
@@ -0,0 +1,66 @@
+import asyncio
+import datetime
+import pytest
+
+from httpx import AsyncClient
+
+from co_table import sweeper
+from co_table.models import Token
+
+
+@pytest.mark.asyncio
+async def test_sweep_follows_reservations(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+):
+    header = {"Authorization": f"Bearer {token_user2.access_token}"}
+    room_payload = {"name": "Sweeper Room", "user_id": token_user2.user_id, "faculty": "ไม่มีคณะ"}
+    room_id = (await client.post("/rooms/create_room", json=room_payload, headers=header)).json()["id"]
+    table_payload = {"number": 1, "room_id": room_id, "is_available": True}
+    table_id = (await client.post("/tables/create_table", json=table_payload, headers=header)).json()["id"]
+
+    user_header = {"Authorization": f"Bearer {token_user1.access_token}"}
+    reservation_payload = {"user_id": token_user1.user_id, "table_id": table_id, "duration_hours": 1}
+    response = await client.post(
+        "/reservations/create_reservation", json=reservation_payload, headers=user_header)
+    assert response.status_code == 200
+    reservation_id = response.json()["id"]
+    response = await client.get("/tables/table_id", params={"table_id": table_id})
+    assert response.json()["is_available"] is False
+
+    table_sweeper = sweeper.Sweeper(batch_size=2)
+    await table_sweeper.sweep_once(datetime.datetime.now() + datetime.timedelta(hours=2), full=False)
+    response = await client.get("/tables/table_id", params={"table_id": table_id})
+    assert response.json()["is_available"] is True
+    assert table_sweeper.released >= 1
+
+    stats = table_sweeper.get_stats()
+    assert stats["sweeps"] == 1
+    assert 0 < stats["max_batch_size"] <= 2
+    assert stats["lag_seconds"] > 3600
+
+    # Back in the present the reservation is still running; a full pass puts
+    # the flag back without any start or end crossing the watermark.
+    await table_sweeper.sweep_once(full=True)
+    response = await client.get("/tables/table_id", params={"table_id": table_id})
+    assert response.json()["is_available"] is False
+    assert table_sweeper.full_sweeps == 1
+
+    response = await client.delete(
+        f"/reservations/delete_reservation?reservation_id={reservation_id}", headers=user_header)
+    assert response.status_code == 200
+    response = await client.get("/tables/table_id", params={"table_id": table_id})
+    assert response.json()["is_available"] is True
+
+
+@pytest.mark.asyncio
+async def test_sweeper_start_stop():
+    table_sweeper = sweeper.Sweeper(interval=60)
+    table_sweeper.start()
+    assert table_sweeper.get_stats()["running"] is True
+    while table_sweeper.sweeps == 0:
+        await asyncio.sleep(0.01)
+    await table_sweeper.stop()
+    assert table_sweeper.get_stats()["running"] is False
+    assert table_sweeper.sweeps == 1
@@ -1,4 +1,5 @@
 import asyncio
+import datetime
 import pytest
 
 from httpx import AsyncClient
@@ -6,6 +7,7 @@ from httpx import AsyncClient
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from co_table import sync
 from co_table.models import Token
 from co_table.models.dbmodel import DBRoom, DBTable
 
@@ -153,3 +155,198 @@ async def test_delete_table_unauthorized(
     assert "detail" in response_data
     assert response_data["detail"] == "Not authenticated"
     
+
+
+@pytest.mark.asyncio
+async def test_get_tables_count_modes(
+    client: AsyncClient,
+    token_user2: Token,
+):
+    response = await client.get("/tables/get_listTable", params={"count": "none"})
+    assert response.status_code == 200
+    assert response.json()["page_count"] is None
+
+    response = await client.get("/tables/get_listTable", params={"size": 1, "count": "estimate"})
+    assert response.status_code == 200
+    assert isinstance(response.json()["page_count"], int)
+
+    before = (await client.get("/tables/get_listTable", params={"size": 1})).json()["page_count"]
+
+    header = {"Authorization": f"Bearer {token_user2.access_token}"}
+    room_payload = {"name": "Count Room", "user_id": token_user2.user_id, "faculty": "Test Faculty"}
+    room_response = await client.post("/rooms/create_room", json=room_payload, headers=header)
+    assert room_response.status_code == 200
+    payload = {"number": 2, "room_id": room_response.json()["id"], "is_available": True}
+    response = await client.post("/tables/create_table", json=payload, headers=header)
+    assert response.status_code == 200
+
+    after = (await client.get("/tables/get_listTable", params={"size": 1})).json()["page_count"]
+    assert after == before + 2
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_tables(
+    client: AsyncClient,
+    token_user2: Token,
+    session: AsyncSession,
+):
+    header = {"Authorization": f"Bearer {token_user2.access_token}"}
+    room_payload = {"name": "Bulk Room", "user_id": token_user2.user_id, "faculty": "Test Faculty"}
+    room_response = await client.post("/rooms/create_room", json=room_payload, headers=header)
+    assert room_response.status_code == 200
+    room_id = room_response.json()["id"]
+
+    payload = {"number": 1, "room_id": room_id, "is_available": True}
+    response = await client.post("/tables/create_table", json=payload, headers=header)
+    assert response.status_code == 200
+    assert response.json()["number"] == 1
+
+    payload = {"number": 200, "room_id": room_id, "is_available": True}
+    response = await client.post("/tables/bulk_create", json=payload, headers=header)
+    assert response.status_code == 200
+    data = response.json()
+    assert [table["number"] for table in data] == list(range(2, 202))
+    assert all(table["room_id"] == room_id and table["is_available"] for table in data)
+
+    result = await session.execute(select(DBTable).where(DBTable.room_id == room_id))
+    assert len(result.scalars().all()) == 201
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_tables_room_not_found(
+    client: AsyncClient,
+    token_user2: Token,
+):
+    payload = {"number": 2, "room_id": 9999, "is_available": True}
+    response = await client.post(
+        "/tables/bulk_create",
+        json=payload,
+        headers={"Authorization": f"Bearer {token_user2.access_token}"}
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Room not found"
+
+
+@pytest.mark.asyncio
+async def test_is_available_concurrent_toggle(
+    client: AsyncClient,
+    token_user2: Token,
+):
+    header = {"Authorization": f"Bearer {token_user2.access_token}"}
+    room_payload = {"name": "Toggle Room", "user_id": token_user2.user_id, "faculty": "Test Faculty"}
+    room_response = await client.post("/rooms/create_room", json=room_payload, headers=header)
+    payload = {"number": 1, "room_id": room_response.json()["id"], "is_available": True}
+    table_id = (await client.post("/tables/create_table", json=payload, headers=header)).json()["id"]
+
+    response = await client.put(f"/tables/is_available/{table_id}", headers=header)
+    assert response.status_code == 200
+    assert response.json() == {"is_available": False}
+
+    responses = await asyncio.gather(*[
+        client.put(f"/tables/is_available/{table_id}", headers=header) for _ in range(9)
+    ])
+    assert all(response.status_code == 200 for response in responses)
+    assert sorted(response.json()["is_available"] for response in responses) == [False] * 4 + [True] * 5
+
+    response = await client.get(f"/tables/table_id?table_id={table_id}")
+    assert response.json()["is_available"] is True
+
+    response = await client.put("/tables/is_available/9999", headers=header)
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_delete_table_removes_reservations(
+    client: AsyncClient,
+    token_user1: Token,
+    token_user2: Token,
+):
+    header = {"Authorization": f"Bearer {token_user2.access_token}"}
+    room_payload = {"name": "Cascade Room", "user_id": token_user2.user_id, "faculty": "ไม่มีคณะ"}
+    room_response = await client.post("/rooms/create_room", json=room_payload, headers=header)
+    payload = {"number": 1, "room_id": room_response.json()["id"], "is_available": True}
+    table_id = (await client.post("/tables/create_table", json=payload, headers=header)).json()["id"]
+
+    payload = {"user_id": token_user1.user_id, "table_id": table_id, "duration_hours": 1}
+    response = await client.post(
+        "/reservations/create_reservation",
+        json=payload,
+        headers={"Authorization": f"Bearer {token_user1.access_token}"}
+    )
+    reservation_id = response.json()["id"]
+
+    response = await client.delete(f"/tables/delete_table?table_id={table_id}", headers=header)
+    assert response.status_code == 200
+
+    response = await client.get(f"/reservations/get_id_reservation?reservation_id={reservation_id}")
+    assert response.status_code == 404
+
+    response = await client.delete(f"/tables/delete_table?table_id={table_id}", headers=header)
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_table_changes(
+    client: AsyncClient,
+    token_user2: Token,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(sync, "SETTLE_TIME", datetime.timedelta(0))
+    header = {"Authorization": f"Bearer {token_user2.access_token}"}
+    room_payload = {"name": "Sync Room", "user_id": token_user2.user_id, "faculty": "Test Faculty"}
+    room_id = (await client.post("/rooms/create_room", json=room_payload, headers=header)).json()["id"]
+    payload = {"number": 3, "room_id": room_id, "is_available": True}
+    table_ids = [table["id"] for table in (await client.post("/tables/bulk_create", json=payload, headers=header)).json()]
+
+    response = await client.get("/tables/changes", params={"room_id": room_id, "size": 2})
+    assert response.status_code == 200
+    data = response.json()
+    assert [table["id"] for table in data["tables"]] == table_ids[:2]
+    assert data["has_more"] is True
+
+    response = await client.get("/tables/changes", params={"room_id": room_id, "since": data["watermark"]})
+    data = response.json()
+    assert [table["id"] for table in data["tables"]] == table_ids[2:]
+    assert data["deleted"] == []
+    assert data["has_more"] is False
+
+    await client.put(f"/tables/is_available/{table_ids[0]}", headers=header)
+    await client.delete(f"/tables/delete_table?table_id={table_ids[1]}", headers=header)
+
+    response = await client.get("/tables/changes", params={"room_id": room_id, "since": data["watermark"]})
+    data = response.json()
+    assert [(table["id"], table["is_available"]) for table in data["tables"]] == [(table_ids[0], False)]
+    assert data["deleted"] == [table_ids[1]]
+
+    await client.delete(f"/tables/del_table_in_room/{room_id}", headers=header)
+    response = await client.get("/tables/changes", params={"room_id": room_id, "since": data["watermark"]})
+    data = response.json()
+    assert data["tables"] == []
+    assert sorted(data["deleted"]) == [table_ids[0], table_ids[2]]
+
+    response = await client.get("/tables/changes", params={"since": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_create_table_idempotency_key(
+    client: AsyncClient,
+    token_user2: Token,
+):
+    header = {"Authorization": f"Bearer {token_user2.access_token}"}
+    room_payload = {"name": "Idempotent Room", "user_id": token_user2.user_id, "faculty": "Test Faculty"}
+    room_id = (await client.post("/rooms/create_room", json=room_payload, headers=header)).json()["id"]
+
+    payload = {"number": 1, "room_id": room_id, "is_available": True}
+    first = await client.post("/tables/create_table", json=payload, headers=dict(header, **{"Idempotency-Key": "table-1"}))
+    again = await client.post("/tables/create_table", json=payload, headers=dict(header, **{"Idempotency-Key": "table-1"}))
+    assert again.json() == first.json()
+    assert again.headers["Idempotent-Replayed"] == "true"
+
+    other = await client.post("/tables/create_table", json=payload, headers=dict(header, **{"Idempotency-Key": "table-2"}))
+    assert other.json()["id"] != first.json()["id"]
+    plain = await client.post("/tables/create_table", json=payload, headers=header)
+    assert "Idempotent-Replayed" not in plain.headers
+
+    response = await client.post("/tables/create_table", json=payload, headers=dict(header, **{"Idempotency-Key": "x" * 256}))
+    assert response.status_code == 400
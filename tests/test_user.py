@@ -0,0 +1,44 @@
+import pytest
+
+from httpx import AsyncClient
+
+from co_table.models import Token
+
+
+@pytest.mark.asyncio
+async def test_get_me(
+    client: AsyncClient,
+    token_user1: Token,
+):
+    header = {"Authorization": f"Bearer {token_user1.access_token}"}
+    response = await client.get("/users/get_me", headers=header)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["id"] == token_user1.user_id
+    assert "password" not in data
+    assert "token_generation" not in data
+
+    hits = (await client.get("/metrics")).json()["user_cache"]["hits"]
+    response = await client.get("/users/get_me", headers=header)
+    assert response.status_code == 200
+    assert (await client.get("/metrics")).json()["user_cache"]["hits"] == hits + 1
+
+
+@pytest.mark.asyncio
+async def test_update_user_refreshes_current_user(
+    client: AsyncClient,
+    token_user1: Token,
+):
+    header = {"Authorization": f"Bearer {token_user1.access_token}"}
+    response = await client.get("/users/get_me", headers=header)
+    assert response.status_code == 200
+
+    response = await client.put(
+        f"/users/update_user?user_id={token_user1.user_id}",
+        json={"faculty": "Science"},
+        headers=header,
+    )
+    assert response.status_code == 200
+
+    response = await client.get("/users/get_me", headers=header)
+    assert response.json()["faculty"] == "Science"